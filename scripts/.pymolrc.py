@@ -1,5 +1,7 @@
 import os
 import sys
+import threading
+from contextlib import nullcontext
 from pymol import cmd, util
 
 # ==== Logging Setup ====
@@ -11,6 +13,111 @@ logfile = open(log_path, "w")
 sys.stdout = logfile
 sys.stderr = logfile
 """
+#For timings of loads, hook steps, commands and renders use: instrument on (see pymol_instrument.py)
+
+# ==== Course Scripts ====
+#Directory with the course helper modules (e.g. pymol_neighbours.py).
+#Defaults to the directory this file is run from, set $PYMOL_SCRIPTS_DIR if you copied it to your home directory.
+SCRIPTS_DIRECTORY = os.environ.get("PYMOL_SCRIPTS_DIR") or os.path.dirname(os.path.abspath(globals().get("__script__", ".pymolrc.py")))
+if SCRIPTS_DIRECTORY not in sys.path:
+    sys.path.insert(0, SCRIPTS_DIRECTORY)
+
+try:
+    import pymol_instrument  # Imported first so commands registered later are instrumented
+except ImportError:
+    pymol_instrument = None
+
+try:
+    import pymol_memory  # Resident memory for the load reports
+except ImportError:
+    pymol_memory = None
+
+try:
+    import pymol_neighbours
+except ImportError:
+    pymol_neighbours = None
+    print("pymol_neighbours.py not found, using selections for the active site search", flush=True)
+
+try:
+    import pymol_settings_profiles  # Only sets the settings that changed
+except ImportError:
+    pymol_settings_profiles = None
+
+try:
+    import pymol_structure_cache  # Local mirror for fetch, see its settings for offline use and the source
+except ImportError:
+    pymol_structure_cache = None
+
+try:
+    import pymol_bulk_load  # bulk_load command for directories of structures
+except ImportError:
+    pymol_bulk_load = None
+
+try:
+    import pymol_sessions  # session_info, find_sessions and load_objects for .pse files
+except ImportError:
+    pymol_sessions = None
+
+try:
+    import pymol_superpose  # superpose_all command for series of related structures
+except ImportError:
+    pymol_superpose = None
+
+try:
+    import pymol_movie  # render_movie command for ensembles and rotations
+except ImportError:
+    pymol_movie = None
+
+def timed(kind, name, selection=None):
+    """
+    Function to time a block when instrumentation is on (pymol_instrument.py).
+    Does nothing when it is off or the module is missing.
+    Args:
+        kind (str): load, fetch or step.
+        name (str): Name of the step.
+        selection (str): Optional selection to count the atoms of.
+    """
+    if pymol_instrument is None:
+        return nullcontext()
+    return pymol_instrument.timed(kind, name, selection)
+
+#Cutoffs (Angstrom) from the organics for the active site water, inorganics and residues
+ACTIVE_SITE_CUTOFFS = {"water": 3.5, "inorganic": 3.5, "residues": 3.5}
+
+#Set to True to style loaded objects with named selections and per-atom settings instead of
+#creating copies (_organics, _active_site_residues, one object per chain...). Same picture,
+#no duplicated atoms. Can also be switched from the PyMOL prompt: SELECTION_BACKED = True
+SELECTION_BACKED = False
+
+#Set to True to print the atom count and memory after every load (also printed while "instrument on" is active)
+LOAD_REPORT = False
+
+#When to style loaded objects: "now" (during the load), "command" (when you run apply_styling)
+#or "background" (a worker thread styles them after the load returns, so the GUI stays responsive)
+DEFERRED_STYLING = "now"
+
+#Level of detail for large structures (ribosomes, capsids...). The first policy whose atom or chain
+#threshold an object reaches replaces the full styling: a CA/P trace cartoon ("trace") or a coarse
+#surface ("surface"), chains colored on the object instead of one object per chain, the active site
+#as selections (or skipped), and lighter "settings" set on the object only. Off by default: LOD objects get
+#no {name}_A/{name}_organics copies, which the lessons and the batch defaults expect. Set LEVEL_OF_DETAIL = True
+#to use it. "render_settings" are global, so the load never sets them, they are the settings
+#profile lod_<name>_render for a quick draft, e.g. in pymol_settings_profiles.settings_profile("lod_huge_render")
+LEVEL_OF_DETAIL = False
+LOD_POLICIES = [
+    {"name": "huge", "min_atoms": 500000, "min_chains": 100, "representation": "surface", "active_site": False,
+     "settings": {"surface_quality": -1, "cartoon_fancy_helices": 0},
+     "render_settings": {"antialias": 0, "ray_shadows": 0}},
+    {"name": "large", "min_atoms": 100000, "min_chains": 26, "representation": "trace", "active_site": True,
+     "settings": {"cartoon_fancy_helices": 0, "cartoon_sampling": 3},
+     "render_settings": {"antialias": 1, "ray_shadows": 0}},
+]
+#Set to True to fetch through the local structure mirror (pymol_structure_cache.py) instead of PyMOL's own fetch
+STRUCTURE_CACHE = False
+
+_pending_styling = []  # Objects loaded but not styled yet
+_pending_lock = threading.Lock()  # Guards _pending_styling (held briefly, so a load never waits for a styling run)
+_styling_lock = threading.Lock()  # One styling run at a time
 
 # Set up Custom Color Palette
 # https://color.adobe.com/color-name_LG-color-theme-19646985/
@@ -23,39 +130,64 @@ def pymol_colors():
     cmd.set_color('LG4', [36/255.0,  160/255.0, 152/255.0])
     cmd.set_color('LG5', [91/255.0,  211/255.0, 203/255.0])
 
+# ==== PyMOL Settings ====
+DISPLAY_SETTINGS = {
+    'use_shaders': 0, # Disable shaders
+    'cartoon_gap_cutoff': 0, # Don't show dashes in cartoon)
+    'seq_view': 1, #Turn on the sequence view
+    'valence': 0, #Don't explicitly show double bonds
+    'stick_radius': 0.3, #Set stick radius to 0.3
+    'stick_ball': 'on',
+    'stick_ball_ratio': 1.7,
+    'bg_rgb': 'light_grey',
+    'cartoon_fancy_helices': 1,
+    'cartoon_side_chain_helper': 1,
+    'label_font_id': 7,
+    'label_size': 14,
+    'label_color': 'black',
+    'ambient': 0.4, #Make visuals lighter
+    'two_sided_lighting': 1,
+    'depth_cue': 0,
+    'orthoscopic': 70, #Set orthographic projection
+}
+
+#https://www.blopig.com/blog/2021/01/making-pretty-pictures-with-pymol/
+RENDER_SETTINGS = {
+    'ray_trace_mode': 0,
+    'ray_shadows': 1,
+    'ray_trace_gain': 0.1, #Only used when ray_trace mode is 1-3 but here as a placeholder
+    'antialias': 2,
+}
+
+if pymol_settings_profiles is not None:
+    pymol_settings_profiles.PROFILES.update(display=DISPLAY_SETTINGS, render=RENDER_SETTINGS)
+    pymol_settings_profiles.PROFILES.update({f"lod_{policy['name']}_render": policy["render_settings"] for policy in LOD_POLICIES})
+
+def apply_settings(profile, settings):
+    """
+    Function to apply a settings profile.
+    Only the settings that changed are set when pymol_settings_profiles.py is available.
+    Args:
+        profile (str): Name of the profile.
+        settings (dict): Setting names and values.
+    """
+    if pymol_settings_profiles is not None:
+        pymol_settings_profiles.apply_profile(profile)
+        return
+    for name, value in settings.items():
+        cmd.set(name, value)
+
 def pymol_display_settings():
     """
     Function to set up custom PyMOL settings.
     This function is called when the script is executed.
     """
     print("Loading custom PyMOL settings...", flush=True)
-
-    # ==== PyMOL Settings ====
     pymol_colors() # Load custom colors
-    cmd.set('use_shaders', 0) # Disable shaders
-    cmd.set('cartoon_gap_cutoff', 0) # Don't show dashes in cartoon)
-    cmd.set('seq_view', 1) #Turn on the sequence view
-    cmd.set('valence', 0) #Don't explicitly show double bonds
-    cmd.set('stick_radius', 0.3) #Set stick radius to 0.3
-    cmd.set('stick_ball', 'on')
-    cmd.set('stick_ball_ratio', 1.7)
-    cmd.set('bg_rgb', 'light_grey')
-    cmd.set('cartoon_fancy_helices', 1)
-    cmd.set('cartoon_side_chain_helper', 1)
-    cmd.set('label_font_id', 7)
-    cmd.set('label_size', 14)
-    cmd.set('label_color', 'black')
-    cmd.set('ambient', 0.4) #Make visuals lighter
-    cmd.set('two_sided_lighting', 1)
-    cmd.set('depth_cue', 0)
-    cmd.set('orthoscopic', 70) #Set orthographic projection
+    apply_settings("display", DISPLAY_SETTINGS)
 
-#https://www.blopig.com/blog/2021/01/making-pretty-pictures-with-pymol/
 def pymol_render_settings():
-    cmd.set('ray_trace_mode', 0)
-    cmd.set('ray_shadows', 1)
-    cmd.set('ray_trace_gain', 0.1) #Only used when ray_trace mode is 1-3 but here as a placeholder
-    cmd.set('antialias', 2)
+    apply_settings("render", RENDER_SETTINGS)
 
 #Custom color protein chains
 def get_protein_chains(obj_name):
@@ -71,6 +203,25 @@ def get_protein_chains(obj_name):
     chains = cmd.get_chains(selection)
     print("Chains in selection:", chains, flush=True)
     return chains
+#Chain colors for objects with 5 or more protein chains (fewer chains use LG1-LG4)
+CHAIN_COLORS = [
+    "red", "green", "blue", "yellow", "cyan", "magenta",
+    "orange", "slate", "teal", "violet", "salmon", "lime",
+    "pink", "marine", "wheat", "white", "grey", "black"
+]
+def chain_color(index, count):
+    """
+    Function to get the cartoon color of a protein chain.
+    Args:
+        index (int): Position of the chain in the object.
+        count (int): Number of protein chains in the object.
+    Returns:
+        str: Color name.
+    """
+    if count < 5:
+        return f"LG{index+1}"
+    return CHAIN_COLORS[(index - 5) % len(CHAIN_COLORS)]
+
 # Get the protein chains from the selection
 def color_protein_chains(obj_name):
     """
@@ -80,24 +231,144 @@ def color_protein_chains(obj_name):
     """
     print("Coloring protein chains for object:", obj_name, flush=True)
     chains = get_protein_chains(obj_name)
-    
-    pymol_colors = [
-        "red", "green", "blue", "yellow", "cyan", "magenta",
-        "orange", "slate", "teal", "violet", "salmon", "lime",
-        "pink", "marine", "wheat", "white", "grey", "black"
-    ]
     for i, chain in enumerate(chains):
-        if len(chains) < 5:
-            color = f"LG{i+1}"
-        else:
-            color = pymol_colors[(i - 5) % len(pymol_colors)]
+        color = chain_color(i, len(chains))
         
-        cmd.create(name=f"{obj_name}_{chain}", selection=f"{obj_name} and polymer.protein and chain {chain}") # Create a new object for each chain
+        if SELECTION_BACKED:
+            cmd.select(f"{obj_name}_{chain}", f"{obj_name} and polymer.protein and chain {chain}", enable=0) # Name the chain instead of copying it
+        else:
+            cmd.create(name=f"{obj_name}_{chain}", selection=f"{obj_name} and polymer.protein and chain {chain}") # Create a new object for each chain
         cmd.show(representation="cartoon", selection=f"{obj_name}_{chain}") # Show the cartoon representation of the chain
-        cmd.set("cartoon_color", color, f"{obj_name}_{chain}") #Set the color of eac chain
-        cmd.hide("everything", f"{obj_name}")  # Hide everything from the original object
+        cmd.set("cartoon_color", color, f"{obj_name}_{chain}") #Set the color of eac chain (per atom for a selection)
+        if not SELECTION_BACKED:
+            cmd.hide("everything", f"{obj_name}")  # Hide everything from the original object
         print(f"Colored chain {chain} with color {color}", flush=True) 
 
+def memory_mb():
+    """
+    Function to get the resident memory of the PyMOL process (see pymol_memory.py).
+    Returns:
+        float: Resident memory in MB, or None if it can't be read.
+    """
+    return pymol_memory.memory_mb() if pymol_memory is not None else None
+
+def load_reporting():
+    """
+    Returns:
+        bool: True if load reports are on (LOAD_REPORT or instrumentation).
+    """
+    return LOAD_REPORT or (pymol_instrument is not None and pymol_instrument.STATE["enabled"])
+
+def load_report(name, atoms_before, memory_before):
+    """
+    Function to print the atom count and memory before and after the load hook.
+    Does nothing when load reports are off (atoms_before is None).
+    Args:
+        name (str): Name of the object.
+        atoms_before (int): Atoms in the session before the hook ran.
+        memory_before (float): Memory in MB before the hook ran.
+    """
+    if atoms_before is None:
+        return
+    atoms_after = cmd.count_atoms("all")
+    memory_after = memory_mb()
+    mode = "selections" if SELECTION_BACKED else "copies"
+    memory = "n/a" if memory_before is None or memory_after is None else \
+        f"{memory_before:.1f} -> {memory_after:.1f} MB ({memory_after - memory_before:+.1f} MB)"
+    print(f"Load report for {name} ({mode}): atoms {atoms_before} -> {atoms_after} "
+          f"({atoms_after - atoms_before:+d}), memory {memory}", flush=True)
+
+def style_active_site_selections(name, site):
+    """
+    Function to style the active site with named selections on the loaded object.
+    Gives the same picture as the copied objects in after_load_callback.
+    Args:
+        name (str): Name of the object.
+        site (dict): Selection strings from active_site_selections.
+    """
+    if cmd.count_atoms(f"{name} and polymer.protein"):
+        cmd.hide("everything", name)  # The chain copies would have hidden the original object
+    cmd.select(f"{name}_active_site_water", site["water"], enable=0)
+    cmd.show(representation="spheres", selection=f"{name}_active_site_water")
+    cmd.select(f"{name}_inorganics", site["inorganic"], enable=0)
+    cmd.show(representation="spheres", selection=f"{name}_inorganics")
+    cmd.color("LG3", f"{name}_inorganics")
+    cmd.select(f"{name}_organics", site["organic"], enable=0)
+    cmd.show(representation="spheres", selection=f"{name}_organics")
+    cmd.color("White", f"{name}_organics")
+    cmd.color("LG1", f"{name} and polymer.protein")
+    cmd.select(f"{name}_active_site_residues", site["residues"], enable=0)
+    util.cbay(f"{name}_active_site_residues")  # Carbons only, the chain cartoon uses cartoon_color
+    cmd.show(representation="sticks", selection=f"{name}_active_site_residues and not name n+c+o")
+
+def active_site_selections(name):
+    """
+    Function to find the active site around the organics of an object.
+    Uses the one pass neighbour search in pymol_neighbours.py when available.
+    Args:
+        name (str): Name of the object.
+    Returns:
+        dict: Selection strings for water, inorganic, organic and residues.
+    """
+    if pymol_neighbours is not None:
+        return pymol_neighbours.active_site_selections(name, ACTIVE_SITE_CUTOFFS)
+
+    organic = f"({name} and organic)"
+    return {
+        "water": f"{name} and resname HOH within {ACTIVE_SITE_CUTOFFS['water']} of {organic}",
+        "inorganic": f"{name} and inorganic within {ACTIVE_SITE_CUTOFFS['inorganic']} of {organic}",
+        "organic": f"{name} and organic",
+        "residues": f"byres ({name} and polymer.protein within {ACTIVE_SITE_CUTOFFS['residues']} of {organic})",
+    }
+
+def choose_lod_policy(name):
+    """
+    Function to pick the level of detail policy for an object.
+    Args:
+        name (str): Name of the object.
+    Returns:
+        dict: The first policy in LOD_POLICIES whose atom or chain threshold is reached, or None.
+    """
+    if not LEVEL_OF_DETAIL:
+        return None
+    atoms = cmd.count_atoms(name)
+    chains = len(cmd.get_chains(f"{name} and polymer"))
+    for policy in LOD_POLICIES:
+        if atoms >= policy["min_atoms"] or chains >= policy["min_chains"]:
+            print(f"Level of detail for {name}: {policy['name']} ({atoms} atoms, {chains} chains, "
+                  f"{policy['representation']}, active site {'on' if policy['active_site'] else 'off'})", flush=True)
+            return policy
+    return None
+
+def style_large_structure(name, policy):
+    """
+    Function to style a large object with a level of detail policy.
+    No copies are created, the chains are colored on the object itself.
+    Args:
+        name (str): Name of the object.
+        policy (dict): Policy from LOD_POLICIES.
+    """
+    for setting, value in policy["settings"].items():
+        cmd.set(setting, value, name)  # On this object only, other objects and later figures keep the full quality
+    if policy["active_site"]:
+        style_active_site_selections(name, active_site_selections(name))
+    else:
+        cmd.hide("everything", name)
+
+    polymer = f"{name} and polymer"
+    if policy["representation"] == "surface":
+        colored = polymer
+        cmd.show(representation="surface", selection=polymer)
+    else:
+        colored = f"{polymer} and name CA+P"  # The trace only uses these, active site sticks keep their colors
+        cmd.hide(representation="cartoon", selection=polymer)
+        cmd.set("cartoon_trace_atoms", 1, name)  # Cartoon through the shown CA/P atoms only
+        cmd.show(representation="cartoon", selection=colored)
+
+    chains = cmd.get_chains(polymer)
+    for i, chain in enumerate(chains):
+        cmd.color(chain_color(i, len(chains)), f"{colored} and chain {chain}")
+
 # ==== Callback ====
 def after_load_callback(object_names):
     """
@@ -108,26 +379,118 @@ def after_load_callback(object_names):
         object_names (list): List of names of the loaded objects.
     """
     for name in object_names: 
-        cmd.hide("everything", f"{name} and resname HOH")  # Hide water
-        cmd.hide("everything", f"{name} and organic")  # Hide organics
-        cmd.hide("everything", f"{name} and inorganic")
-        cmd.create(name=f"{name}_active_site_water", selection="resname HOH within 3.5 of organic") # Create a new object for active site water
-        cmd.show(representation="spheres", selection=f"{name}_active_site_water")  # Show selected water
-        cmd.create(name=f"{name}_inorganics", selection="inorganic within 3.5 of organic") # Create a new object for inorganics
-        cmd.show(representation="spheres", selection=f"{name}_inorganics")  # Show selected inorganics
-        cmd.color("LG3", f"{name}_inorganics")  # Color inorganics
-        cmd.show(representation="spheres", selection=f"{name}_inorganics")  # Show active site water
-        cmd.create(name=f"{name}_organics", selection=f"{name} and organic") # Create a new object for organics
-        cmd.show(representation="spheres", selection=f"{name}_organics")
-        cmd.color("White", f"{name}_organics")  # Color organics white to stand out.
-        cmd.color("LG1", f"{name} and polymer.protein")  # Color protein molecule
-        cmd.create(name=f"{name}_active_site_residues", selection=f"byres ({name} and polymer.protein or name CA within 3.5 of {name}_organics)") # Select residues near to organic
-        util.cbay(f"{name}_active_site_residues")  # Color active site residues
-        cmd.show(representation="sticks", selection=f"{name}_active_site_residues and not name n+c+o")  # Show active site residues
-        cmd.hide(representation="cartoon", selection=f"{name}_active_site_residues")  # Hide cartoon representation of protein
-
-        color_protein_chains(name)  # Color protein chains
+        atoms_before, memory_before = (cmd.count_atoms("all"), memory_mb()) if load_reporting() else (None, None)
+        policy = choose_lod_policy(name)
+        if policy is not None:
+            with timed("step", f"level_of_detail_{policy['name']}", name):
+                style_large_structure(name, policy)
+            load_report(name, atoms_before, memory_before)
+            continue
+        with timed("step", "hide_solvent_and_ligands", name):
+            cmd.hide("everything", f"{name} and resname HOH")  # Hide water
+            cmd.hide("everything", f"{name} and organic")  # Hide organics
+            cmd.hide("everything", f"{name} and inorganic")
+        with timed("step", "active_site_search", name):
+            site = active_site_selections(name)  # Find the active site water, inorganics and residues in one pass
+        if SELECTION_BACKED:
+            with timed("step", "active_site_selections"):
+                style_active_site_selections(name, site)
+            with timed("step", "color_protein_chains"):
+                color_protein_chains(name)
+            load_report(name, atoms_before, memory_before)
+            continue
 
+        with timed("step", "active_site_objects"):
+            cmd.create(name=f"{name}_active_site_water", selection=site["water"]) # Create a new object for active site water
+            cmd.show(representation="spheres", selection=f"{name}_active_site_water")  # Show selected water
+            cmd.create(name=f"{name}_inorganics", selection=site["inorganic"]) # Create a new object for inorganics
+            cmd.show(representation="spheres", selection=f"{name}_inorganics")  # Show selected inorganics
+            cmd.color("LG3", f"{name}_inorganics")  # Color inorganics
+            cmd.show(representation="spheres", selection=f"{name}_inorganics")  # Show active site water
+            cmd.create(name=f"{name}_organics", selection=site["organic"]) # Create a new object for organics
+            cmd.show(representation="spheres", selection=f"{name}_organics")
+            cmd.color("White", f"{name}_organics")  # Color organics white to stand out.
+            cmd.color("LG1", f"{name} and polymer.protein")  # Color protein molecule
+            cmd.create(name=f"{name}_active_site_residues", selection=site["residues"]) # Select residues near to organic
+            util.cbay(f"{name}_active_site_residues")  # Color active site residues
+            cmd.show(representation="sticks", selection=f"{name}_active_site_residues and not name n+c+o")  # Show active site residues
+            cmd.hide(representation="cartoon", selection=f"{name}_active_site_residues")  # Hide cartoon representation of protein
+
+        with timed("step", "color_protein_chains"):
+            color_protein_chains(name)  # Color protein chains
+        load_report(name, atoms_before, memory_before)
+
+
+def style_objects(object_names):
+    """
+    Function to run after_load_callback for objects that were loaded with deferred styling.
+    Each object is taken off the pending list before it is styled, so it is styled once even
+    if a background run and apply_styling ask for it at the same time.
+    Objects deleted in the meantime are skipped.
+    Args:
+        object_names (list): List of names of the loaded objects.
+    """
+    with _styling_lock:
+        with _pending_lock:
+            claimed = [name for name in dict.fromkeys(object_names) if name in _pending_styling]
+            _pending_styling[:] = [name for name in _pending_styling if name not in claimed]
+        existing = cmd.get_names("objects")
+        for name in claimed:
+            if name not in existing:
+                print(f"{name} no longer exists, skipping its styling", flush=True)
+                continue
+            with timed("step", "deferred_styling", name):
+                after_load_callback([name])
+
+def schedule_styling(object_names, kind="load"):
+    """
+    Function to style loaded objects now, later on request or in the background (DEFERRED_STYLING).
+    Args:
+        object_names (list): List of names of the loaded objects.
+        kind (str): load or fetch, for the instrumentation.
+    """
+    if DEFERRED_STYLING == "now":
+        with timed(kind, "after_load_callback"):
+            after_load_callback(object_names) # Call the callback function with the object name
+        return
+
+    for name in object_names:
+        cmd.hide("everything", f"{name} and resname HOH")  # Basic representation until the object is styled
+        with _pending_lock:
+            _pending_styling.append(name)
+    if DEFERRED_STYLING == "background":
+        threading.Thread(target=style_objects, args=(list(object_names),), daemon=True).start()
+        print(f"Styling {object_names} in the background", flush=True)
+    else:
+        print(f"Styling of {object_names} deferred, run apply_styling when you need it", flush=True)
+
+def apply_styling(names=""):
+    """
+    Function to style objects whose styling was deferred.
+    Args:
+        names (str): Space separated object names, all pending objects if empty.
+    """
+    with _pending_lock:
+        object_names = names.split() or list(_pending_styling)
+    if not object_names:
+        print("No objects waiting for styling", flush=True)
+        return
+    style_objects(object_names)
+
+def is_session_file(args, kwargs):
+    """
+    Function to check if a load call opens a PyMOL session.
+    Sessions already hold the styled objects, so the load hook skips them.
+    Returns:
+        bool: True for .pse/.psw files.
+    """
+    filename = kwargs.get("filename", args[0] if args else "")
+    file_format = kwargs.get("format", args[3] if len(args) > 3 else "")
+    if not isinstance(filename, str):
+        return False
+    return file_format in ("pse", "psw") or filename.lower().endswith((".pse", ".psw"))
+
+cmd.extend("apply_styling", apply_styling)
 
 _original_load = cmd.load  # Backup the original load function
 _original_fetch = cmd.fetch  # Backup the original fetch function
@@ -146,7 +509,12 @@ def custom_load(*args, **kwargs):
         original load function result
     """
     print("custom_load() called with:", args, kwargs, flush=True)
-    result = _original_load(*args, **kwargs) # Call the original load function with the same arguments
+    with timed("load", str(args[0] if args else kwargs.get("filename", ""))):
+        result = _original_load(*args, **kwargs) # Call the original load function with the same arguments
+
+    if is_session_file(args, kwargs):
+        print("Session loaded, skipping the load hook", flush=True)
+        return result
         
     obj_name = kwargs.get("object")
     if not obj_name:
@@ -158,7 +526,7 @@ def custom_load(*args, **kwargs):
             
     if obj_name:
         print("Object loaded:", obj_name, flush=True)
-        after_load_callback([obj_name]) # Call the callback function with the object name
+        schedule_styling([obj_name], "load") # Call the callback function with the object name
     else:
         print("No object name found in load arguments.", flush=True)
     
@@ -172,12 +540,20 @@ def custom_fetch(*args, **kwargs):
     not found, it checks the first argument of the fetch function.
     """
     print("custom_fetch() called with:", args, kwargs, flush=True)
-    result = _original_fetch(*args, **kwargs) # Call the original fetch function with the same arguments
+    with timed("fetch", str(args[0] if args else kwargs.get("code", ""))):
+        result = None
+        if pymol_structure_cache is not None and STRUCTURE_CACHE:
+            #Load from the local mirror (None for fetches it does not handle, e.g. maps)
+            result = pymol_structure_cache.cached_fetch(_original_load, *args, **kwargs)
+            if result is not None and len(result) == 1:
+                result = result[0]
+        if result is None:
+            result = _original_fetch(*args, **kwargs) # Call the original fetch function with the same arguments
         
     #Fetch returns a list of object names
     object_names = result if isinstance(result, list) else [result]
     print("Fetched objects:", object_names, flush=True)
-    after_load_callback(object_names) # Call the callback function with the object name
+    schedule_styling(object_names, "fetch") # Call the callback function with the object name
     return result
 
 cmd.load = custom_load # Override the original load function with the custom one
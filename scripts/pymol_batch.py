@@ -0,0 +1,284 @@
+import csv
+import json
+import os
+import sys
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pymol_postprocess
+
+"""
+Headless batch renderer for the lesson 3 figure pipeline.
+Reads a manifest of structures (CSV or JSON) and fans the jobs out to a pool
+of headless PyMOL (pymol -cq) worker processes. Each worker runs .pymolrc.py
+once (colors, settings and the load hook), then for every job it loads the
+structure through the hook and renders the lesson 3 layers.
+
+Manifest columns / keys:
+    file        path to the structure or session (relative paths are relative to the manifest)
+    code        PDB code to fetch instead of a file (through the .pymolrc.py fetch hook)
+    protein     protein object to render, e.g. {name}_A
+    ligand      ligand object, e.g. {name}_organics
+    active_site active site residue object (optional), e.g. {name}_active_site_residues
+    residues    selection of the residues to cut out of the background (optional,
+                defaults to the residues of the active site object)
+    view        18 comma separated floats from get_view (optional, defaults to orient)
+    name        object name for the structure (optional, defaults to the file name or code)
+    layers      layers to render, e.g. "protein active_site" (optional, defaults to all)
+    reference   structure file or PDB code to superpose onto before rendering (optional),
+                so one view fits the whole series (see pymol_superpose.py)
+
+{name} in any column is replaced with the object name of the structure.
+
+The images of each finished job are handed to the pymol_postprocess pool
+(re-encoding, thumbnails) while the rest render, and the batch ends with a
+contact sheet and an HTML gallery (index.html) in the output directory.
+
+Usage from a shell (use the python that PyMOL is installed into):
+    python pymol_batch.py manifest.csv --workers 8 --output-dir ~/tmp/batch
+    python pymol_batch.py manifest.csv --format webp --quality 85
+"""
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(globals().get('__script__') or __file__))
+RC_PATH = os.path.join(SCRIPT_DIR, '.pymolrc.py')
+
+#Batch Settings
+WORKERS = max(1, (os.cpu_count() or 2) // 2)
+OUTPUT_DIRECTORY = os.path.join(os.path.expanduser("~"), 'tmp', 'batch')
+REPORT_NAME = 'batch_report.json'
+POSTPROCESS = True
+POSTPROCESS_WORKERS = pymol_postprocess.WORKERS
+
+# ==== Manifest ====
+def read_manifest(manifest_path:str):
+    """
+    Input: Path to a CSV or JSON manifest
+    Returns: list of job dictionaries with the {name} templates filled in
+    """
+    manifest_dir = os.path.dirname(os.path.abspath(manifest_path))
+    if manifest_path.endswith('.json'):
+        with open(manifest_path) as handle:
+            rows = json.load(handle)
+    else:
+        with open(manifest_path, newline='') as handle:
+            rows = list(csv.DictReader(handle))
+    return [make_job(row, manifest_dir) for row in rows]
+
+def make_job(row:dict, base_dir:str='.'):
+    """
+    Inputs: Manifest row (or figure service request) and the directory relative paths are relative to
+    Returns: job dictionary with the {name} templates filled in
+    """
+    code = (row.get('code') or '').strip()
+    structure = os.path.normpath(os.path.join(base_dir, os.path.expanduser(row['file']))) if row.get('file') else ''
+    if not structure and not code:
+        raise ValueError("A job needs a file or a PDB code")
+    name = row.get('name') or (os.path.basename(structure).split('.')[0] if structure else code)
+    job = {'name': name, 'file': structure, 'code': code}
+    for key in ('protein', 'ligand', 'active_site', 'residues'):
+        job[key] = (row.get(key) or '').format(name=name)
+    job['view'] = parse_view(row.get('view'))
+    layers = row.get('layers') or ()
+    job['layers'] = tuple(layers.replace(',', ' ').split() if isinstance(layers, str) else layers)
+    reference = (row.get('reference') or '').strip()
+    if reference and os.path.exists(os.path.join(base_dir, os.path.expanduser(reference))):
+        reference = os.path.normpath(os.path.join(base_dir, os.path.expanduser(reference)))
+    job['reference'] = reference
+    return job
+
+def parse_view(view):
+    """
+    Input: View as a list of 18 floats, a comma separated string or None
+    Returns: tuple of 18 floats or None (let the worker orient on the protein)
+    """
+    if not view:
+        return None
+    if isinstance(view, str):
+        view = view.replace('(', ' ').replace(')', ' ').replace(',', ' ').split()
+    view = tuple(float(value) for value in view)
+    if len(view) != 18:
+        raise ValueError(f"A view needs 18 values, got {len(view)}")
+    return view
+
+# ==== Worker ====
+def start_headless_pymol(rc_path:str=RC_PATH, max_threads:int=None):
+    """
+    Launches PyMOL without a GUI in the current process (pymol -cq, skipping the
+    user's own pymolrc) and runs the course .pymolrc.py in the pymol namespace,
+    the same way PyMOL runs it at startup.
+    """
+    import pymol
+    pymol.finish_launching(['pymol', '-cqk'])
+    from pymol import cmd
+
+    if SCRIPT_DIR not in sys.path:
+        sys.path.insert(0, SCRIPT_DIR)
+    if rc_path and os.path.exists(rc_path):
+        run_pymolrc(rc_path)
+    if max_threads:
+        cmd.set('max_threads', max_threads)
+
+def run_pymolrc(rc_path:str=RC_PATH):
+    """
+    Runs a pymolrc python file in the pymol namespace, like PyMOL's run command
+    does at startup, so its functions are available as pymol.<name>
+    """
+    import pymol
+    namespace = pymol.__dict__
+    namespace['__script__'] = rc_path
+    with open(rc_path) as handle:
+        exec(compile(handle.read(), rc_path, 'exec'), namespace)
+
+def reset_session():
+    """
+    Clears the session and re-applies the .pymolrc.py colors and settings so
+    every job starts from the same state as a fresh interactive session.
+    """
+    import pymol
+    from pymol import cmd
+    cmd.reinitialize()
+    for setup in ('pymol_colors', 'pymol_display_settings', 'pymol_render_settings'):
+        if hasattr(pymol, setup):
+            getattr(pymol, setup)()
+
+def run_job(job:dict, output_dir:str):
+    """
+    Input: Job dictionary from read_manifest and the batch output directory
+    Loads (or fetches) the structure through the load hook and renders the lesson 3 layers.
+    From a session (.pse) only the protein and active site objects are loaded.
+    Never raises, a missing object (sys.exit in select_objects) or any other
+    error is returned as a failed result.
+    Returns: result dictionary (name, file, ok, error, images, seconds)
+    """
+    from pymol import cmd
+    import pymol_scripting_lesson3 as lesson3
+    import pymol_sessions
+    import pymol_superpose
+
+    start = time.perf_counter()
+    result = {'name': job['name'], 'file': job['file'] or job.get('code', ''), 'ok': False,
+              'error': None, 'images': [], 'seconds': 0.0, 'pid': os.getpid()}
+    try:
+        reset_session()
+        protein = job['protein'] or job['name']
+        active_site = [item for item in (job['ligand'], job['active_site']) if item]
+        if job.get('code') and not job['file']:
+            cmd.fetch(job['code'], job['name'])
+        elif pymol_sessions.is_session(job['file']):
+            #Only the objects the figures need, with the session view (see pymol_sessions.py)
+            pymol_sessions.load_objects(job['file'], [protein] + active_site, view=job['view'] is None)
+            job = dict(job, view=job['view'] or cmd.get_view())
+        else:
+            cmd.load(job['file'], job['name'])
+        lesson3.select_objects(protein, active_site)
+        if job.get('reference'):
+            #Every object of the structure moves with the fit of the protein
+            fitted = cmd.get_object_list(protein)[0]
+            fit = pymol_superpose.superpose_to(pymol_superpose.reference_atoms(job['reference']),
+                                               {fitted: cmd.get_names('objects')})
+            if not fit:
+                raise ValueError(f"{fitted} could not be superposed onto {job['reference']}")
+            result['rmsd'] = fit[fitted]['rmsd']
+
+        residues = job['residues']
+        if not residues and job['active_site']:
+            residues = f"byres ({protein} within 0.1 of {job['active_site']})"
+        if not residues or cmd.select(lesson3.SELECTION_NAME, f"{protein} and ({residues})") == 0:
+            raise ValueError(f"Residue selection is empty: {residues!r}")
+        resi_list = lesson3.get_selection_residues(protein, lesson3.SELECTION_NAME)
+
+        view = job['view']
+        if view is None:
+            cmd.orient(protein)
+            view = cmd.get_view()
+
+        image_dir = os.path.join(output_dir, job['name'])
+        os.makedirs(image_dir, exist_ok=True)
+        result['images'] = lesson3.render_figures(protein, active_site, resi_list, image_dir, view,
+                                                  layers=job.get('layers') or None)
+        result['ok'] = True
+    except SystemExit:
+        result['error'] = "select_objects could not find the protein or active site objects"
+    except Exception as error:
+        result['error'] = f"{type(error).__name__}: {error}"
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+# ==== Main Execution ====
+def run_batch(manifest_path:str, workers:int=WORKERS, output_dir:str=OUTPUT_DIRECTORY, rc_path:str=RC_PATH,
+              postprocess:bool=POSTPROCESS, image_format:str=pymol_postprocess.FORMAT, quality:int=pymol_postprocess.QUALITY):
+    """
+    Inputs: Manifest path, number of worker processes, output directory, the
+    .pymolrc.py to run in each worker, and the post-processing options
+    Renders every job in the manifest and writes batch_report.json to the
+    output directory.
+    Returns: the report dictionary
+    """
+    jobs = read_manifest(manifest_path)
+    output_dir = os.path.abspath(os.path.expanduser(output_dir))
+    os.makedirs(output_dir, exist_ok=True)
+    workers = max(1, min(int(workers), len(jobs) or 1))
+    print(f"Rendering {len(jobs)} structures with {workers} workers into {output_dir}", flush=True)
+
+    start = time.perf_counter()
+    results, processing = [], []
+    #spawn so workers never inherit a running PyMOL from the parent
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=start_headless_pymol, initargs=(rc_path,)) as pool:
+        futures = {pool.submit(run_job, job, output_dir): job for job in jobs}
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                result = future.result()
+            except Exception as error:
+                #The worker process itself died
+                result = {'name': job['name'], 'file': job['file'] or job.get('code', ''), 'ok': False,
+                          'error': f"{type(error).__name__}: {error}", 'images': [], 'seconds': 0.0}
+            status = 'ok' if result['ok'] else f"FAILED ({result['error']})"
+            print(f"{result['name']:<24} {result['seconds']:8.2f} s  {status}", flush=True)
+            results.append(result)
+            if postprocess and result['images']:
+                #Queued in the post-processing pool, the renderers carry on
+                processing += pymol_postprocess.submit_images(result['images'], output_dir, POSTPROCESS_WORKERS,
+                                                              image_format=image_format, quality=quality)
+
+    wall_time = time.perf_counter() - start
+    succeeded = sum(1 for result in results if result['ok'])
+    report = {
+        'manifest': os.path.abspath(manifest_path),
+        'workers': workers,
+        'jobs': len(results),
+        'succeeded': succeeded,
+        'failed': len(results) - succeeded,
+        'wall_seconds': wall_time,
+        'job_seconds': sum(result['seconds'] for result in results),
+        'jobs_per_minute': 60.0 * len(results) / wall_time if wall_time else 0.0,
+        'results': sorted(results, key=lambda result: result['name']),
+    }
+    if postprocess:
+        report['postprocess'] = pymol_postprocess.finish_gallery(output_dir, processing, report)
+    with open(os.path.join(output_dir, REPORT_NAME), 'w') as handle:
+        json.dump(report, handle, indent=2)
+
+    print(f"Finished {report['jobs']} jobs ({succeeded} ok, {report['failed']} failed) \
+          \n Wall time: {wall_time:.1f} s, summed job time: {report['job_seconds']:.1f} s \
+          \n Throughput: {report['jobs_per_minute']:.1f} structures/min \
+          \n Report saved as {os.path.join(output_dir, REPORT_NAME)}", flush=True)
+    return report
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="Render the lesson 3 figures for every structure in a manifest")
+    parser.add_argument('manifest', help="CSV or JSON manifest of structures")
+    parser.add_argument('--workers', type=int, default=WORKERS)
+    parser.add_argument('--output-dir', default=OUTPUT_DIRECTORY)
+    parser.add_argument('--rc', default=RC_PATH, help="pymolrc to run in each worker")
+    parser.add_argument('--format', default=pymol_postprocess.FORMAT, choices=('png', 'webp', 'jpeg'))
+    parser.add_argument('--quality', type=int, default=pymol_postprocess.QUALITY)
+    parser.add_argument('--no-postprocess', action='store_true', help="Skip re-encoding, thumbnails and the gallery")
+    options = parser.parse_args()
+    report = run_batch(options.manifest, options.workers, options.output_dir, options.rc,
+                       not options.no_postprocess, options.format, options.quality)
+    sys.exit(1 if report['failed'] else 0)
@@ -0,0 +1,288 @@
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+"""
+Reproducible headless benchmarks for the course scripts.
+Times the startup of .pymolrc.py, the load hook, color_protein_chains,
+residue extraction, loading the lesson sessions and every lesson 3 figure
+layer. The structures are pdb_pse/9AX6.pdb, the lesson*_*.pse sessions and
+copies of 9AX6 scaled up to 10x/100x the atoms (one new set of chains per copy).
+
+Usage (with the python that PyMOL is installed into):
+    python pymol_benchmark.py run --out results.json
+    python pymol_benchmark.py compare results.json benchmark_baseline.json
+    python pymol_benchmark.py run --out benchmark_baseline.json   (store a new baseline)
+
+compare exits with status 1 when any benchmark is slower than the baseline by
+more than the threshold, so it can gate every performance change. No baseline
+is committed (timings depend on the machine): store one with run --out first,
+compare exits with status 2 when it is missing.
+"""
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(globals().get('__script__') or __file__))
+REPO_DIR = os.path.dirname(SCRIPT_DIR)
+PDB_DIR = os.path.join(REPO_DIR, 'pdb_pse')
+STRUCTURE = os.path.join(PDB_DIR, '9AX6.pdb')
+BASELINE_PATH = os.path.join(SCRIPT_DIR, 'benchmark_baseline.json')
+
+#Benchmark Settings
+SCALES = (1, 10, 100)
+REPEATS = 3
+LAYER_IMAGE = {'WIDTH': 400, 'HEIGHT': 300, 'DPI': 150, 'ANTIALIAS': 1}
+THRESHOLD = 0.15 #Fraction slower than the baseline that counts as a regression
+MIN_SECONDS = 0.01 #Ignore differences smaller than this
+#Lesson 3 sessions with the objects run_selection needs: (session, protein, ligand, active site residues)
+LAYER_SESSIONS = (
+    ('lesson3_gfp.pse', '1EMA_A', '1EMA_organics', '1EMA_active_site_residues'),
+    ('lesson3_9COR.pse', '9COR_A', '9COR_organics', '9COR_active_site_residues'),
+)
+
+if SCRIPT_DIR not in sys.path:
+    sys.path.insert(0, SCRIPT_DIR)
+import pymol_batch
+
+def measure(function, repeats:int=REPEATS, setup=None):
+    """
+    Inputs: Function to time, number of repeats and an optional setup function
+    that runs (untimed) before every repeat
+    Returns: dictionary with the best and mean time in seconds
+    """
+    times = []
+    for repeat in range(repeats):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return {'best_s': min(times), 'mean_s': sum(times) / len(times), 'repeats': repeats}
+
+# ==== Structures ====
+def build_scaled_structure(copies:int, path:str):
+    """
+    Inputs: Number of copies of 9AX6 and the mmCIF file to write
+    Lays the copies out on a grid so they don't overlap, each copy gets its
+    own chain ids (A -> A1, A2, ...), and saves them as one structure.
+    Returns: number of atoms written
+    """
+    import pymol
+    from pymol import cmd
+    pymol_batch.reset_session()
+    pymol._original_load(STRUCTURE, '_source')
+    if copies == 1:
+        cmd.save(path, '_source')
+        return cmd.count_atoms('_source')
+
+    extent = cmd.get_extent('_source')
+    spacing = max(high - low for low, high in zip(*extent)) + 10.0
+    side = round(copies ** (1.0 / 3)) + 1
+    parts = []
+    for copy in range(copies):
+        part = f"_copy{copy}"
+        cmd.create(part, '_source')
+        cmd.alter(part, f"chain = chain + '{copy}'")
+        offset = [spacing * (copy % side), spacing * ((copy // side) % side), spacing * (copy // side ** 2)]
+        cmd.translate(offset, part, camera=0)
+        parts.append(part)
+    cmd.create('_scaled', ' or '.join(parts))
+    cmd.save(path, '_scaled')
+    return cmd.count_atoms('_scaled')
+
+# ==== Benchmarks ====
+def bench_startup(repeats:int):
+    """
+    Times launching headless PyMOL and running .pymolrc.py in fresh processes
+    """
+    code = ("import json, sys, time; sys.path.insert(0, %r); import pymol_batch; "
+            "start = time.perf_counter(); pymol_batch.start_headless_pymol(None); launched = time.perf_counter(); "
+            "pymol_batch.run_pymolrc(pymol_batch.RC_PATH); "
+            "print(json.dumps([launched - start, time.perf_counter() - launched]))") % SCRIPT_DIR
+    launch, rc = [], []
+    for repeat in range(repeats):
+        output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True).stdout
+        timings = json.loads(output.strip().splitlines()[-1])
+        launch.append(timings[0])
+        rc.append(timings[1])
+    return {
+        'startup/pymol_launch': {'best_s': min(launch), 'mean_s': sum(launch) / repeats, 'repeats': repeats},
+        'startup/pymolrc': {'best_s': min(rc), 'mean_s': sum(rc) / repeats, 'repeats': repeats},
+    }
+
+def bench_structure(label:str, path:str, atoms:int, repeats:int):
+    """
+    Times the load hook, color_protein_chains and residue extraction on one structure
+    """
+    import pymol
+    from pymol import cmd
+    import pymol_residues
+    results = {}
+
+    def load_raw():
+        pymol_batch.reset_session()
+        pymol._original_load(path, 'bench')
+    results[f'load_hook/{label}'] = measure(lambda: cmd.load(path, 'bench'), repeats, pymol_batch.reset_session)
+    results[f'color_protein_chains/{label}'] = measure(lambda: pymol.color_protein_chains('bench'), repeats, load_raw)
+    load_raw()
+    results[f'residue_index/{label}'] = measure(lambda: pymol_residues.get_residue_index('bench'), repeats)
+    for result in results.values():
+        result['atoms'] = atoms
+    return results
+
+def bench_sessions(repeats:int):
+    """
+    Times loading every lesson session (without the load hook)
+    """
+    import glob
+    import pymol
+    from pymol import cmd
+    results = {}
+    for session in sorted(glob.glob(os.path.join(PDB_DIR, 'lesson*_*.pse'))):
+        label = os.path.basename(session)
+        results[f'session_load/{label}'] = measure(lambda: pymol._original_load(session), repeats, pymol_batch.reset_session)
+        results[f'session_load/{label}']['atoms'] = cmd.count_atoms('all')
+    return results
+
+def bench_layers(repeats:int, image_dir:str):
+    """
+    Times every lesson 3 figure layer on the lesson 3 sessions and on 9AX6
+    loaded through the hook, at the LAYER_IMAGE size without the render cache
+    """
+    import pymol
+    from pymol import cmd
+    import pymol_scripting_lesson3 as lesson3
+    for name, value in LAYER_IMAGE.items():
+        setattr(lesson3, name, value)
+    lesson3.RENDER_CACHE = False
+    lesson3.RENDER_WORKERS = 1
+
+    def prepare_session(session):
+        def prepare():
+            pymol_batch.reset_session()
+            pymol._original_load(os.path.join(PDB_DIR, session))
+            lesson3.pymol_settings()
+        return prepare
+
+    def prepare_structure():
+        pymol_batch.reset_session()
+        cmd.load(STRUCTURE, '9AX6')
+        cmd.select(lesson3.SELECTION_NAME, "byres (9AX6_A within 0.1 of 9AX6_active_site_residues)")
+        lesson3.pymol_settings()
+
+    cases = [(session, protein, ligand, residues, prepare_session(session))
+             for session, protein, ligand, residues in LAYER_SESSIONS
+             if os.path.exists(os.path.join(PDB_DIR, session))]
+    cases.append(('9AX6', '9AX6_A', '9AX6_organics', '9AX6_active_site_residues', prepare_structure))
+
+    results = {}
+    for label, protein, ligand, residues, prepare in cases:
+        active_site = [ligand, residues]
+        prepare()
+        cmd.orient(protein)
+        view = cmd.get_view()
+        resi_list = lesson3.get_selection_residues(protein, lesson3.SELECTION_NAME)
+
+        def run_layers(layer):
+            def run():
+                transparent = lesson3.protein_figure(protein, resi_list, image_dir, view, render=(layer == 'protein'))
+                if layer != 'protein':
+                    lesson3.active_site_figure(protein, active_site, image_dir, view, render=(layer == 'active_site'))
+                if layer == 'transparent':
+                    lesson3.transparent_figure(protein, transparent, image_dir, view)
+            return run
+        for layer in ('protein', 'active_site', 'transparent'):
+            #Setting up the earlier layers without rendering is included, it is tiny next to ray tracing
+            results[f'layer_{layer}/{label}'] = measure(run_layers(layer), repeats, prepare)
+            results[f'layer_{layer}/{label}']['atoms'] = cmd.count_atoms(protein)
+    return results
+
+def run_benchmarks(out_path:str, scales=SCALES, repeats:int=REPEATS, layers:bool=True):
+    """
+    Inputs: Results file, scales of 9AX6 to test, repeats, and whether to time the figure layers
+    Runs every benchmark headless and writes the results as JSON
+    Returns: the results dictionary
+    """
+    pymol_batch.start_headless_pymol()
+    from pymol import cmd
+
+    results = bench_startup(repeats)
+    with tempfile.TemporaryDirectory() as work_dir:
+        for scale in scales:
+            path = os.path.join(work_dir, f'9AX6x{scale}.cif')
+            atoms = build_scaled_structure(scale, path)
+            print(f"Benchmarking 9AX6 x{scale} ({atoms} atoms)", flush=True)
+            results.update(bench_structure(f'9AX6x{scale}', path, atoms, repeats))
+        results.update(bench_sessions(repeats))
+        if layers:
+            print("Benchmarking the lesson 3 figure layers", flush=True)
+            results.update(bench_layers(repeats, work_dir))
+
+    report = {
+        'meta': {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'pymol': cmd.get_version()[0],
+                 'python': platform.python_version(), 'platform': platform.platform(),
+                 'cpu_count': os.cpu_count(), 'repeats': repeats, 'scales': list(scales)},
+        'results': results,
+    }
+    with open(out_path, 'w') as handle:
+        json.dump(report, handle, indent=2, sort_keys=True)
+    for name, result in sorted(results.items()):
+        print(f"{name:<48}{result['best_s']:>10.3f} s")
+    print(f"Results saved as {out_path}", flush=True)
+    return report
+
+def compare(results_path:str, baseline_path:str=BASELINE_PATH, threshold:float=THRESHOLD):
+    """
+    Inputs: Results file, baseline file and the allowed slowdown as a fraction
+    Prints every benchmark against the baseline and flags the regressions
+    Returns: list of the names of the regressed benchmarks, None if there is no baseline
+    """
+    with open(results_path) as handle:
+        results = json.load(handle)['results']
+    if not os.path.exists(baseline_path):
+        #No baseline is committed, timings depend on the machine
+        print(f"No baseline at {baseline_path}. Create one on this machine first (before the change to test):\n"
+              f"    python pymol_benchmark.py run --out {baseline_path}", flush=True)
+        return None
+    with open(baseline_path) as handle:
+        baseline = json.load(handle)['results']
+
+    regressions = []
+    print(f"{'benchmark':<48}{'baseline s':>12}{'now s':>10}{'change':>9}")
+    for name in sorted(set(results) | set(baseline)):
+        if name not in results or name not in baseline:
+            print(f"{name:<48}{'only in ' + ('results' if name in results else 'baseline'):>31}")
+            continue
+        before, after = baseline[name]['best_s'], results[name]['best_s']
+        change = (after - before) / before if before else 0.0
+        regressed = change > threshold and after - before > MIN_SECONDS
+        if regressed:
+            regressions.append(name)
+        print(f"{name:<48}{before:>12.3f}{after:>10.3f}{change:>+9.0%}{'  REGRESSION' if regressed else ''}")
+    print(f"{len(regressions)} regressions (threshold {threshold:.0%})")
+    return regressions
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="Benchmark the course scripts headless")
+    commands = parser.add_subparsers(dest='command', required=True)
+    run_parser = commands.add_parser('run', help="run the benchmarks")
+    run_parser.add_argument('--out', default='benchmark_results.json')
+    run_parser.add_argument('--scales', default=','.join(str(scale) for scale in SCALES),
+                            help="comma separated copies of 9AX6, e.g. 1,10,100")
+    run_parser.add_argument('--repeats', type=int, default=REPEATS)
+    run_parser.add_argument('--no-layers', action='store_true', help="skip the (slow) figure layers")
+    compare_parser = commands.add_parser('compare', help="compare results with a baseline")
+    compare_parser.add_argument('results')
+    compare_parser.add_argument('baseline', nargs='?', default=BASELINE_PATH)
+    compare_parser.add_argument('--threshold', type=float, default=THRESHOLD)
+    options = parser.parse_args()
+
+    if options.command == 'run':
+        scales = [int(scale) for scale in options.scales.split(',') if scale]
+        run_benchmarks(options.out, scales, options.repeats, not options.no_layers)
+    else:
+        regressions = compare(options.results, options.baseline, options.threshold)
+        sys.exit(2 if regressions is None else 1 if regressions else 0)
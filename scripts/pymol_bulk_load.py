@@ -0,0 +1,231 @@
+from pymol import cmd, util
+import glob
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pymol
+import pymol_batch
+import pymol_memory
+
+"""
+Parallel bulk loading of a directory of structures.
+Loading 500 files through the hooked cmd.load parses them one by one on the
+main thread and styles every object separately. bulk_load reads and parses
+the files in its own pool of headless PyMOL worker processes instead (parsing, bonding and
+secondary structure assignment), each worker returns its object as a binary
+partial session (pse_binary_dump: coordinates and atom/bond tables as packed
+arrays). The main process adds every batch of BATCH_SIZE objects with one
+set_session call and styles the batch once, with one shared selection (or one
+copied object when SELECTION_BACKED is off) per part instead of one per object:
+    {batch}_water, {batch}_inorganics, {batch}_organics, {batch}_active_site_residues
+Objects that reach a level of detail policy (LOD_POLICIES) are styled with
+it on their own, like the load hook does.
+The report gives files/s and the peak memory of PyMOL and of the workers.
+"""
+
+BATCH_SIZE = 50
+WORKERS = max(1, (os.cpu_count() or 2) - 1)
+BATCH_PREFIX = 'bulk'
+STRUCTURE_PATTERNS = ('*.pdb', '*.ent', '*.cif', '*.mmcif', '*.pdb.gz', '*.ent.gz', '*.cif.gz')
+
+_BATCHES = {'count': 0} #Batches styled in this session, bulkN selections are numbered from it
+_POOL = {'pool': None, 'workers': 0}
+
+def find_structures(path:str):
+    """
+    Input: Directory, glob pattern or single file
+    Returns: sorted list of structure files
+    """
+    path = os.path.expanduser(path)
+    if os.path.isdir(path):
+        files = [file for pattern in STRUCTURE_PATTERNS for file in glob.glob(os.path.join(path, pattern))]
+    else:
+        files = glob.glob(path)
+    return sorted(set(files))
+
+def object_names(files:list):
+    """
+    Input: List of structure files
+    Returns: list of object names from the file names, unique within the session
+    """
+    taken = set(cmd.get_names('all'))
+    names = []
+    for file in files:
+        base = cmd.get_legal_name(os.path.basename(file).split('.')[0])
+        name, number = base, 1
+        while name in taken:
+            number += 1
+            name = f"{base}_{number}"
+        taken.add(name)
+        names.append(name)
+    return names
+
+def parse_structure(file:str, name:str):
+    """
+    Runs in a worker. Parses one file with PyMOL and returns the object as a
+    partial session.
+    Returns: dictionary (name, file, ok, error, atoms, session, seconds, peak_mb)
+    """
+    from pymol import cmd
+
+    start = time.perf_counter()
+    result = {'name': name, 'file': file, 'ok': False, 'error': None, 'atoms': 0, 'session': None}
+    try:
+        cmd.delete('all')
+        cmd.set('pse_binary_dump', 1) #Pack coordinates and atom tables as binary arrays
+        cmd.load(file, name)
+        result['atoms'] = cmd.count_atoms(name)
+        result['session'] = cmd.get_session(name, partial=1)
+        result['ok'] = True
+        cmd.delete(name)
+    except Exception as error:
+        result['error'] = f"{type(error).__name__}: {error}"
+    result['seconds'] = time.perf_counter() - start
+    result['peak_mb'] = pymol_memory.memory_mb(peak=True)
+    return result
+
+def get_pool(workers:int=WORKERS):
+    """
+    Returns: the bulk loading process pool of headless PyMOL workers, reused between calls
+    (separate from the render workers, a bigger pool replaces it)
+    """
+    if _POOL['pool'] is None or _POOL['workers'] < workers:
+        if _POOL['pool'] is not None:
+            _POOL['pool'].shutdown(wait=False)
+        context = multiprocessing.get_context('spawn')
+        _POOL['pool'] = ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                            initializer=pymol_batch.start_headless_pymol, initargs=(None,))
+        _POOL['workers'] = workers
+    return _POOL['pool']
+
+def add_batch(sessions:list):
+    """
+    Input: List of partial sessions from parse_structure
+    Adds all their objects to the session with one set_session call
+    """
+    merged = dict(sessions[0])
+    merged['names'] = [entry for session in sessions for entry in session['names'] if entry]
+    cmd.set_session(merged, partial=1)
+
+def style_batch(names:list, batch_name:str):
+    """
+    Inputs: Object names of one batch and the prefix of its selections
+    Styles the whole batch like the .pymolrc.py load hook, one command per
+    step for all objects together: shared selections with SELECTION_BACKED,
+    otherwise one copied object per part. Objects that reach a level of
+    detail policy are styled with it instead.
+    """
+    if not hasattr(pymol, 'active_site_selections'):
+        print(".pymolrc.py is not loaded, objects are left unstyled", flush=True)
+        return
+    full = []
+    for name in names:
+        policy = pymol.choose_lod_policy(name)
+        if policy is None:
+            full.append(name)
+        else:
+            pymol.style_large_structure(name, policy)
+    if not full:
+        return
+    names = full
+    objects = '(' + ' or '.join(names) + ')'
+    sites = [pymol.active_site_selections(name) for name in names]
+
+    def union(part):
+        return ' or '.join(f"({site[part]})" for site in sites)
+
+    def collect(name, selection):
+        if pymol.SELECTION_BACKED:
+            cmd.select(name, selection, enable=0)
+        else:
+            cmd.create(name, selection)
+
+    cmd.hide("everything", objects)
+    for part, suffix, color in (('water', 'water', None), ('inorganic', 'inorganics', 'LG3'),
+                                ('organic', 'organics', 'White')):
+        selection = f"{batch_name}_{suffix}"
+        collect(selection, union(part))
+        cmd.show(representation="spheres", selection=selection)
+        if color:
+            cmd.color(color, selection)
+    cmd.color("LG1", f"{objects} and polymer.protein")
+    residues = f"{batch_name}_active_site_residues"
+    collect(residues, union('residues'))
+    util.cbay(residues)
+    cmd.show(representation="sticks", selection=f"{residues} and not name n+c+o")
+    if not pymol.SELECTION_BACKED:
+        cmd.hide(representation="cartoon", selection=residues)
+
+    #One cartoon_color per color instead of one per chain
+    chain_groups = {}
+    for name in names:
+        chains = cmd.get_chains(f"{name} and polymer.protein")
+        for i, chain in enumerate(chains):
+            chain_groups.setdefault(pymol.chain_color(i, len(chains)), []).append(f"({name} and chain {chain})")
+    cmd.show(representation="cartoon", selection=f"{objects} and polymer.protein")
+    for color, parts in chain_groups.items():
+        cmd.set("cartoon_color", color, f"polymer.protein and ({' or '.join(parts)})")
+
+def bulk_load(path:str, batch_size:int=BATCH_SIZE, workers:int=WORKERS, style:int=1):
+    """
+    Inputs: Directory (or glob pattern) of structures, objects per batch,
+    number of worker processes and 0 to skip the styling
+    e.g. bulk_load ~/structures, 100
+    Returns: report dictionary (files, loaded, failed, atoms, seconds, files_per_s, peak memory)
+    """
+    files = find_structures(path)
+    if not files:
+        print(f"No structures found in {path}", flush=True)
+        return None
+    batch_size, workers = max(1, int(batch_size)), max(1, min(int(workers), len(files)))
+    names = object_names(files)
+    print(f"Loading {len(files)} structures with {workers} workers in batches of {batch_size}", flush=True)
+
+    start = time.perf_counter()
+    pool = get_pool(workers)
+    futures = {pool.submit(parse_structure, file, name): file for file, name in zip(files, names)}
+    loaded, failed, batch, worker_peak, atoms, batches = [], [], [], 0.0, 0, 0
+
+    def flush_batch():
+        nonlocal batches
+        batches += 1
+        _BATCHES['count'] += 1 #Numbered across calls, so earlier bulkN selections are kept
+        add_batch([result['session'] for result in batch])
+        batch_names = [result['name'] for result in batch]
+        if int(style):
+            style_batch(batch_names, f"{BATCH_PREFIX}{_BATCHES['count']}")
+        loaded.extend(batch_names)
+        print(f"Batch {batches}: {len(loaded)}/{len(files)} structures "
+              f"({len(loaded) / (time.perf_counter() - start):.1f} files/s)", flush=True)
+        batch.clear()
+
+    for future in as_completed(futures):
+        try:
+            result = future.result()
+        except Exception as error:
+            #The worker process itself died
+            result = {'ok': False, 'error': f"{type(error).__name__}: {error}", 'file': futures[future], 'peak_mb': None}
+        worker_peak = max(worker_peak, result['peak_mb'] or 0.0)
+        if not result['ok']:
+            failed.append((result['file'], result['error']))
+            print(f"Could not load {result['file']}: {result['error']}", flush=True)
+            continue
+        atoms += result['atoms']
+        batch.append(result)
+        if len(batch) >= batch_size:
+            flush_batch()
+    if batch:
+        flush_batch()
+
+    seconds = time.perf_counter() - start
+    report = {'files': len(files), 'loaded': len(loaded), 'failed': len(failed), 'atoms': atoms,
+              'batches': batches, 'seconds': seconds, 'files_per_s': len(loaded) / seconds if seconds else 0.0,
+              'peak_memory_mb': pymol_memory.memory_mb(peak=True), 'worker_peak_memory_mb': worker_peak or None}
+    peak = 'n/a' if report['peak_memory_mb'] is None else f"{report['peak_memory_mb']:.0f} MB"
+    print(f"Loaded {len(loaded)}/{len(files)} structures ({atoms} atoms) in {seconds:.1f} s: "
+          f"{report['files_per_s']:.1f} files/s, peak memory {peak} (workers {worker_peak:.0f} MB each)", flush=True)
+    return report
+
+cmd.extend("bulk_load", bulk_load)
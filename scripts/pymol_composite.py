@@ -0,0 +1,139 @@
+from pymol import cmd
+import os
+import time
+import numpy as np
+
+from pymol_png import PNG_SIGNATURE, png_to_array, read_png, write_png
+
+"""
+Compositing of the lesson 3 figure layers into the merged figure.
+The layers are alpha blended ("over") in memory with NumPy, bottom first, in
+COMPOSITE_ORDER: the opaque background (_4), the active site (_3), the outline (_2)
+and the transparent white foreground (_1) on top, each with its own opacity
+(the order of media/lesson-2-PML-scripts/merged.png).
+The layer images are the outputs of the figure functions. Layers rendered in
+this session with render_png (cmd.png(None) returns the PNG data on recent
+PyMOL versions) are kept in memory and composited from there. Layers from the
+render cache or the parallel workers are read back from disk. PNGs are decoded
+and written with pymol_png (PIL when it is installed, otherwise its own codec).
+
+e.g. composite_layers 1EMA_A, ~/tmp, 4:1 3:1 2:1 1:0.8
+"""
+
+#(image number, opacity) from the bottom layer to the top
+COMPOSITE_ORDER = ((4, 1.0), (3, 1.0), (2, 1.0), (1, 1.0))
+MERGED_SUFFIX = 'merged'
+
+_RENDERED = {} #Layer image path -> (file mtime, PNG data) rendered in this session, taken by composite
+
+def _layer_key(path:str):
+    path = os.path.abspath(os.path.expanduser(path))
+    return path if path.endswith('.png') else path + '.png'
+
+def render_png(filename:str, width:int=0, height:int=0, dpi:float=-1.0, ray:int=0):
+    """
+    Inputs: Same as cmd.png
+    Saves the image like cmd.png and keeps its PNG data for composite, when
+    this PyMOL returns the data (cmd.png(None)), so the layer is not read back.
+    Returns: the path of the saved image
+    """
+    path = _layer_key(filename)
+    _RENDERED.pop(path, None)
+    try:
+        data = cmd.png(None, width=width, height=height, dpi=dpi, ray=ray)
+    except Exception: #Older PyMOL versions need a file name
+        data = None
+    if not isinstance(data, bytes) or not data.startswith(PNG_SIGNATURE):
+        cmd.png(path, width=width, height=height, dpi=dpi, ray=ray)
+        return path
+    with open(path, 'wb') as handle:
+        handle.write(data)
+    _RENDERED[path] = (os.stat(path).st_mtime_ns, data)
+    return path
+
+def forget_layer(filename:str):
+    """
+    Drops the in memory copy of a layer that is about to be written another way (e.g. the render cache)
+    """
+    _RENDERED.pop(_layer_key(filename), None)
+
+def read_layer(path:str):
+    """
+    Returns: uint8 RGBA array of a layer, from memory if render_png kept it
+    and the file was not written since, otherwise from the file
+    """
+    mtime, data = _RENDERED.pop(_layer_key(path), (None, None))
+    try:
+        current = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        current = None
+    return png_to_array(data) if data is not None and mtime == current else read_png(path)
+
+# ==== Compositing ====
+def blend(bottom:np.ndarray, top:np.ndarray, opacity:float=1.0):
+    """
+    Inputs: Float RGBA image (0-1) so far, uint8 RGBA layer and its opacity
+    Returns: the layer blended over the image ("over" operator, straight alpha)
+    """
+    layer = top.astype(np.float32) / 255.0
+    alpha = layer[..., 3:4] * float(opacity)
+    bottom_alpha = bottom[..., 3:4] * (1.0 - alpha)
+    out_alpha = alpha + bottom_alpha
+    out = np.empty_like(bottom)
+    np.divide(layer[..., :3] * alpha + bottom[..., :3] * bottom_alpha, out_alpha,
+              out=out[..., :3], where=out_alpha > 0)
+    out[..., :3][np.broadcast_to(out_alpha == 0, out[..., :3].shape)] = 0.0
+    out[..., 3:4] = out_alpha
+    return out
+
+def composite(layers:list, output:str):
+    """
+    Inputs: List of (image path, opacity) from the bottom layer to the top, and the output path
+    Blends the layers one at a time and writes the merged PNG.
+    Returns: the output path
+    """
+    merged = None
+    for path, opacity in layers:
+        layer = read_layer(path)
+        if merged is None:
+            merged = np.zeros(layer.shape, dtype=np.float32)
+        elif layer.shape != merged.shape:
+            raise ValueError(f"{path} is {layer.shape[1]}x{layer.shape[0]}, the other layers are "
+                             f"{merged.shape[1]}x{merged.shape[0]}")
+        merged = blend(merged, layer, opacity)
+    write_png(output, np.clip(np.rint(merged * 255.0), 0, 255).astype(np.uint8))
+    return output
+
+def parse_order(order):
+    """
+    Input: Order as (image number, opacity) pairs or a string like "4:1 3:1 2:1 1:0.8"
+    Returns: tuple of (image number, opacity)
+    """
+    if not isinstance(order, str):
+        return tuple((int(number), float(opacity)) for number, opacity in order)
+    pairs = []
+    for item in order.replace(',', ' ').split():
+        number, _, opacity = item.partition(':')
+        pairs.append((int(number), float(opacity or 1.0)))
+    return tuple(pairs)
+
+def composite_figure(protein:str, image_dir:str, order=COMPOSITE_ORDER):
+    """
+    Inputs: Protein (the image prefix), directory of its layer images and the blend order
+    Writes {protein}_merged.png next to the layers.
+    Returns: path of the merged figure
+    """
+    start = time.perf_counter()
+    image_dir = os.path.expanduser(image_dir)
+    layers = [(os.path.join(image_dir, f'{protein}_{number}.png'), opacity) for number, opacity in parse_order(order)]
+    output = composite(layers, os.path.join(image_dir, f'{protein}_{MERGED_SUFFIX}.png'))
+    print(f"Merged figure saved as {output} ({time.perf_counter() - start:.1f} s)", flush=True)
+    return output
+
+def composite_layers(protein:str, image_dir:str='~/tmp', order:str=''):
+    """
+    Inputs: Protein, image directory and optionally the order, e.g. 4:1 3:1 2:1 1:0.8
+    """
+    return composite_figure(protein, image_dir, order or COMPOSITE_ORDER)
+
+cmd.extend("composite_layers", composite_layers)
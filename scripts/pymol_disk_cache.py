@@ -0,0 +1,90 @@
+import os
+import shutil
+import threading
+
+"""
+Helpers shared by the on disk caches (pymol_render_cache.py and
+pymol_structure_cache.py): atomic writes, least recently used eviction
+under a byte limit, usage and clearing. A cache is a flat directory of
+files with a common suffix, the modification time marks when an entry was
+last used. Several PyMOL sessions or workers can share a directory.
+Does not need PyMOL.
+"""
+
+def entries(directory:str, suffix:str):
+    """
+    Inputs: Cache directory and file suffix of the entries
+    Returns: list of (mtime, size, path) of the entries, oldest first
+    """
+    found = []
+    if not os.path.isdir(directory):
+        return found
+    for entry in os.scandir(directory):
+        if not entry.name.endswith(suffix):
+            continue
+        try:
+            info = entry.stat()
+        except FileNotFoundError: #Evicted by another session or worker
+            continue
+        found.append((info.st_mtime, info.st_size, entry.path))
+    return sorted(found)
+
+def usage(directory:str, suffix:str):
+    """
+    Returns: (number of entries, total bytes) in the cache directory
+    """
+    found = entries(directory, suffix)
+    return len(found), sum(size for _, size, _ in found)
+
+def evict(directory:str, suffix:str, max_bytes:int):
+    """
+    Inputs: Cache directory, file suffix and byte limit
+    Removes the least recently used entries until the cache fits in max_bytes.
+    Returns: the number of entries removed
+    """
+    found = entries(directory, suffix)
+    total, removed = sum(size for _, size, _ in found), 0
+    for _, size, path in found:
+        if total <= max_bytes:
+            break
+        total -= size
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            continue
+        removed += 1
+    return removed
+
+def touch(path:str):
+    """
+    Marks an entry as recently used
+    Returns: False if it is not (or no longer) in the cache
+    """
+    try:
+        os.utime(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+def write_atomic(path:str, data:bytes=None, source:str=None):
+    """
+    Inputs: Entry path and either the bytes to write or a file to copy
+    Writes to a .part file next to the entry and renames it into place, so
+    other sessions never see a half written entry.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+    try:
+        if source is not None:
+            shutil.copyfile(source, temporary)
+        else:
+            with open(temporary, 'wb') as handle:
+                handle.write(data)
+        os.replace(temporary, path)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+
+def clear(directory:str):
+    if os.path.isdir(directory):
+        shutil.rmtree(directory)
@@ -0,0 +1,96 @@
+from pymol import cmd
+
+import pymol_parallel_layers
+
+"""
+Progressive refinement of draft renders.
+While framing a figure, lesson 3 renders every layer with the draft profile
+(set_render_profile draft). The session is snapshot before the draft layers
+are rendered, so the layers you like can be refined in the background with
+accept_layers: each accepted layer is rendered in a worker process at every
+profile in REFINE_PROFILES in turn (overwriting the draft image), while
+PyMOL stays free for the next draft.
+"""
+
+REFINE_PROFILES = ('preview', 'final')
+REFINE_WORKERS = 3
+
+#Image number -> layer name used by the lesson 3 figure functions
+IMAGE_LAYERS = {'4': 'protein', '3': 'active_site', '1': 'transparent', '2': 'transparent'}
+
+_DRAFT = {}
+TIMINGS = []
+
+def record_draft(protein:str, active_site:list, resi_list, image_dir:str, pymol_view,
+                 lesson_globals:dict, profiles:dict):
+    """
+    Inputs: The render_figures arguments, the lesson 3 globals and the render profiles
+    Snapshots the session before the draft layers are rendered
+    """
+    _DRAFT.clear()
+    _DRAFT.update(session=cmd.get_session(), protein=protein, active_site=list(active_site),
+                  resi_list=resi_list, image_dir=image_dir, pymol_view=tuple(pymol_view),
+                  lesson_globals=dict(lesson_globals), profiles=dict(profiles))
+
+def record_timing(layer:str, profile:str, seconds:float):
+    TIMINGS.append((layer, profile, seconds))
+    print(f"Rendered {layer} layer ({profile}) in {seconds:.1f} s", flush=True)
+
+def _refine(layer:str, steps:list):
+    """
+    Submits the next refinement step of a layer, the step after it is submitted
+    when this one finishes
+    """
+    if not steps:
+        return
+    profile, remaining = steps[0], steps[1:]
+    lesson_globals = dict(_DRAFT['lesson_globals'], **_DRAFT['profiles'][profile])
+    pool = pymol_parallel_layers.get_pool(REFINE_WORKERS)
+    max_threads = pymol_parallel_layers.threads_per_worker(REFINE_WORKERS)
+    future = pool.submit(pymol_parallel_layers.render_layer, _DRAFT['session'], layer, _DRAFT['protein'],
+                         _DRAFT['active_site'], _DRAFT['resi_list'], _DRAFT['image_dir'],
+                         _DRAFT['pymol_view'], lesson_globals, max_threads)
+
+    def done(future):
+        try:
+            rendered_layer, seconds, images = future.result()
+        except Exception as error:
+            print(f"Refining the {layer} layer ({profile}) failed: {error}", flush=True)
+            return
+        record_timing(rendered_layer, profile, seconds)
+        print(f"Refined images: {', '.join(images)}", flush=True)
+        _refine(layer, remaining)
+    future.add_done_callback(done)
+
+def accept_layers(layers:str='4 3 1'):
+    """
+    Input: Image numbers of the draft layers to keep, e.g. accept_layers 4 3
+    (1 or 2 both accept the transparent layer)
+    Refines the accepted layers of the last draft in the background.
+    """
+    if not _DRAFT:
+        print("No draft to refine, use: set_render_profile draft, then run_selection", flush=True)
+        return
+    accepted = []
+    for number in str(layers).replace(',', ' ').split():
+        layer = IMAGE_LAYERS.get(number.strip())
+        if layer is None:
+            print(f"Unknown layer {number}, choose from 1, 2, 3 and 4", flush=True)
+            return
+        if layer not in accepted:
+            accepted.append(layer)
+    for layer in accepted:
+        _refine(layer, list(REFINE_PROFILES))
+    print(f"Refining {', '.join(accepted)} in the background: {' -> '.join(REFINE_PROFILES)}", flush=True)
+
+def render_timings():
+    """
+    Prints the render time of every layer and profile so far
+    """
+    print(f"{'layer':<14}{'profile':<10}{'seconds':>9}")
+    for layer, profile, seconds in TIMINGS:
+        print(f"{layer:<14}{profile:<10}{seconds:>9.1f}")
+    return list(TIMINGS)
+
+cmd.extend("accept_layers", accept_layers)
+cmd.extend("render_timings", render_timings)
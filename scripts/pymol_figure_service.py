@@ -0,0 +1,384 @@
+import heapq
+import itertools
+import multiprocessing
+import os
+import threading
+import time
+from socketserver import ThreadingMixIn
+from xmlrpc.server import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
+from xmlrpc.client import Fault
+
+import pymol_batch
+import pymol_memory
+
+"""
+Local figure job service with a pool of warm headless PyMOL workers.
+Every worker starts PyMOL, runs .pymolrc.py and imports the lesson 3 script
+once, then renders jobs one after the other (pymol_batch.run_job), so a job
+only pays for its own load and ray tracing. Jobs are queued here by priority
+and handed to the next idle worker. submit refuses jobs when MAX_QUEUE jobs
+are waiting (or waits up to block_seconds for room). A worker is replaced
+after MAX_JOBS_PER_WORKER jobs or when it uses more than MEMORY_LIMIT_MB, and
+when it dies (its job fails).
+The service listens for XML-RPC on localhost. A job is a pymol_batch manifest
+row (file or code, protein, ligand, active_site, residues, view, layers).
+events is a long poll that streams job states, image paths and timings.
+
+Usage from a shell (use the python that PyMOL is installed into):
+    python pymol_figure_service.py --workers 4 --port 9124
+
+From python:
+    from xmlrpc.client import ServerProxy
+    service = ServerProxy('http://127.0.0.1:9124', allow_none=True)
+    job = service.submit({'code': '1ema', 'protein': '{name}_A', 'ligand': '{name}_organics',
+                          'active_site': '{name}_active_site_residues'})
+    service.wait(job, 60)
+"""
+
+#Service Settings
+HOST = '127.0.0.1'
+PORT = 9124
+WORKERS = max(1, (os.cpu_count() or 2) // 2)
+MAX_QUEUE = 64
+MAX_JOBS_PER_WORKER = 50
+MEMORY_LIMIT_MB = 4000
+OUTPUT_DIRECTORY = os.path.join(os.path.expanduser("~"), 'tmp', 'service')
+MAX_EVENTS = 10000 #Events kept for the events long poll
+RESULT_SECONDS = 3600 #Finished jobs are forgotten after this long
+
+# ==== Worker ====
+def worker_main(worker_id:int, rc_path:str, output_dir:str, inbox, events, max_jobs:int, memory_limit_mb:float):
+    """
+    Runs in a worker process. Warms PyMOL up, then renders the jobs from its inbox
+    until it gets None, has rendered max_jobs or uses more than memory_limit_mb.
+    """
+    start = time.perf_counter()
+    pymol_batch.start_headless_pymol(rc_path)
+    #Imported (and its commands registered) during the warm up, so the first job does not pay for it.
+    #run_job imports it again and gets this module from sys.modules, the name itself is not used here.
+    import pymol_scripting_lesson3  # noqa: F401
+    events.put(('ready', worker_id, None, {'pid': os.getpid(), 'warmup_seconds': time.perf_counter() - start}))
+
+    done = 0
+    while True:
+        item = inbox.get()
+        if item is None:
+            break
+        job_id, job = item
+        result = pymol_batch.run_job(job, os.path.join(output_dir, str(job_id)))
+        done += 1
+        result.update(worker=worker_id, worker_jobs=done, worker_memory_mb=pymol_memory.memory_mb() or 0.0)
+        recycle = done >= max_jobs or result['worker_memory_mb'] >= memory_limit_mb
+        events.put(('done', worker_id, job_id, result))
+        if recycle:
+            break
+    events.put(('exit', worker_id, None, {'jobs': done}))
+
+# ==== Service ====
+class FigureService:
+    """
+    Schedules figure jobs on warm PyMOL workers. The public methods are the XML-RPC API.
+    """
+    def __init__(self, workers:int=WORKERS, output_dir:str=OUTPUT_DIRECTORY, rc_path:str=pymol_batch.RC_PATH,
+                 max_queue:int=MAX_QUEUE, max_jobs_per_worker:int=MAX_JOBS_PER_WORKER,
+                 memory_limit_mb:float=MEMORY_LIMIT_MB):
+        self.worker_count = max(1, int(workers))
+        self.output_dir = os.path.abspath(os.path.expanduser(output_dir))
+        self.rc_path = rc_path
+        self.max_queue = max(1, int(max_queue))
+        self.max_jobs_per_worker = max(1, int(max_jobs_per_worker))
+        self.memory_limit_mb = float(memory_limit_mb)
+
+        self.context = multiprocessing.get_context('spawn') #Workers never inherit a running PyMOL
+        self.events_queue = self.context.Queue()
+        self.condition = threading.Condition()
+        self.workers = {} #Worker id -> {'process', 'inbox', 'job', 'ready'}
+        self.idle = []
+        self.pending = [] #Heap of (priority, sequence, job id)
+        self.jobs = {} #Job id -> job record
+        self.events_log = []
+        self.event_offset = 0 #Number of events dropped from the front of events_log
+        self.counter = itertools.count(1)
+        self.worker_ids = itertools.count(1)
+        self.counts = {'submitted': 0, 'done': 0, 'failed': 0, 'rejected': 0, 'cancelled': 0, 'recycled': 0, 'crashed': 0}
+        self.running = False
+
+    # ---- Workers ----
+    def start(self, wait:bool=True):
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.running = True
+        with self.condition:
+            for _ in range(self.worker_count):
+                self._start_worker()
+        threading.Thread(target=self._event_loop, daemon=True).start()
+        threading.Thread(target=self._monitor_loop, daemon=True).start()
+        if wait:
+            with self.condition:
+                self.condition.wait_for(lambda: len(self.idle) >= self.worker_count or not self.running, timeout=120)
+
+    def _start_worker(self):
+        worker_id = next(self.worker_ids)
+        inbox = self.context.Queue()
+        process = self.context.Process(target=worker_main, daemon=True,
+                                       args=(worker_id, self.rc_path, self.output_dir, inbox, self.events_queue,
+                                             self.max_jobs_per_worker, self.memory_limit_mb))
+        process.start()
+        self.workers[worker_id] = {'process': process, 'inbox': inbox, 'job': None, 'ready': False}
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            for worker in self.workers.values():
+                worker['inbox'].put(None)
+            self.condition.notify_all()
+        for worker in list(self.workers.values()):
+            worker['process'].join(timeout=10)
+            if worker['process'].is_alive():
+                worker['process'].terminate()
+
+    def _event_loop(self):
+        while self.running:
+            try:
+                kind, worker_id, job_id, data = self.events_queue.get(timeout=1)
+            except Exception:
+                continue
+            with self.condition:
+                worker = self.workers.get(worker_id)
+                if kind == 'ready' and worker:
+                    worker['ready'] = True
+                    self.idle.append(worker_id)
+                    self._log({'worker': worker_id, 'state': 'worker_ready', **data})
+                elif kind == 'done':
+                    if worker:
+                        worker['job'] = None
+                    self._finish(job_id, data)
+                    if worker and worker['process'].is_alive() and data['worker_jobs'] < self.max_jobs_per_worker \
+                            and data['worker_memory_mb'] < self.memory_limit_mb:
+                        self.idle.append(worker_id)
+                elif kind == 'exit':
+                    self.counts['recycled'] += 1
+                    self._log({'worker': worker_id, 'state': 'worker_recycled', **data})
+                self._dispatch()
+                self.condition.notify_all()
+
+    def _monitor_loop(self):
+        #Replaces workers that exited (recycled or crashed)
+        while self.running:
+            time.sleep(0.5)
+            with self.condition:
+                for worker_id, worker in list(self.workers.items()):
+                    process = worker['process']
+                    if process.is_alive() or not self.running:
+                        continue
+                    process.join()
+                    del self.workers[worker_id]
+                    if not worker['ready']:
+                        #Failed during warm up (e.g. PyMOL is missing), replacing it would fail the same way
+                        self.counts['crashed'] += 1
+                        print(f"Worker {worker_id} exited with code {process.exitcode} before it was ready", flush=True)
+                        if not self.workers:
+                            self.running = False
+                        continue
+                    if process.exitcode and worker['job'] is not None:
+                        self.counts['crashed'] += 1
+                        self._finish(worker['job'], {'ok': False, 'images': [], 'seconds': 0.0, 'worker': worker_id,
+                                                     'error': f"Worker exited with code {process.exitcode}"})
+                    if worker_id in self.idle:
+                        self.idle.remove(worker_id)
+                    self._start_worker()
+                self._dispatch()
+                self.condition.notify_all()
+
+    # ---- Scheduling ----
+    def _log(self, event:dict):
+        event['time'] = time.time()
+        self.events_log.append(event)
+        if len(self.events_log) > MAX_EVENTS:
+            dropped = len(self.events_log) - MAX_EVENTS
+            del self.events_log[:dropped]
+            self.event_offset += dropped
+
+    def _dispatch(self):
+        #Hands the most urgent queued jobs to idle workers
+        while self.idle and self.pending:
+            _, _, job_id = heapq.heappop(self.pending)
+            record = self.jobs[job_id]
+            if record['state'] != 'queued':
+                continue
+            worker_id = self.idle.pop(0)
+            worker = self.workers[worker_id]
+            worker['job'] = job_id
+            record.update(state='running', worker=worker_id, started=time.time())
+            worker['inbox'].put((job_id, record['job']))
+            self._log({'job': job_id, 'state': 'running', 'worker': worker_id,
+                       'queued_seconds': record['started'] - record['submitted']})
+
+    def _finish(self, job_id:int, result:dict):
+        record = self.jobs.get(job_id)
+        if record is None or record['state'] not in ('queued', 'running'):
+            return
+        finished = time.time()
+        record.update(state='done' if result['ok'] else 'failed', finished=finished, result=result)
+        self.counts['done' if result['ok'] else 'failed'] += 1
+        self._log({'job': job_id, 'state': record['state'], 'images': result['images'], 'error': result.get('error'),
+                   'job_seconds': result['seconds'], 'total_seconds': finished - record['submitted']})
+        for old_id in [key for key, item in self.jobs.items() if item['finished'] and item['finished'] < finished - RESULT_SECONDS]:
+            del self.jobs[old_id]
+
+    def _summary(self, record:dict):
+        summary = {key: record[key] for key in ('id', 'state', 'name', 'submitted', 'started', 'finished', 'worker')}
+        if record['result'] is not None:
+            summary.update(images=record['result']['images'], error=record['result'].get('error'),
+                           job_seconds=record['result']['seconds'],
+                           total_seconds=record['finished'] - record['submitted'])
+        if record['started']:
+            summary['queued_seconds'] = record['started'] - record['submitted']
+        return summary
+
+    def _record(self, job_id):
+        record = self.jobs.get(int(job_id))
+        if record is None:
+            raise Fault(404, f"Unknown job {job_id}")
+        return record
+
+    # ---- XML-RPC API ----
+    def submit(self, request:dict, priority:int=0, block_seconds:float=0):
+        """
+        Inputs: Job (a pymol_batch manifest row), priority (lower runs first) and
+        how long to wait for room in the queue
+        Returns: job id
+        """
+        if not self.running:
+            raise Fault(503, "The figure service is not running")
+        try:
+            job = pymol_batch.make_job(request)
+        except (KeyError, ValueError) as error:
+            raise Fault(400, f"Invalid job: {error}")
+        with self.condition:
+            queued = lambda: sum(1 for record in self.jobs.values() if record['state'] == 'queued')
+            if not self.condition.wait_for(lambda: queued() < self.max_queue, timeout=float(block_seconds)):
+                self.counts['rejected'] += 1
+                raise Fault(429, f"Queue is full ({self.max_queue} jobs waiting), try again later")
+            job_id = next(self.counter)
+            self.jobs[job_id] = {'id': job_id, 'state': 'queued', 'name': job['name'], 'job': job, 'result': None,
+                                 'submitted': time.time(), 'started': None, 'finished': None, 'worker': None}
+            heapq.heappush(self.pending, (int(priority), job_id, job_id))
+            self.counts['submitted'] += 1
+            self._log({'job': job_id, 'state': 'queued', 'name': job['name']})
+            self._dispatch()
+            self.condition.notify_all()
+        return job_id
+
+    def status(self, job_id):
+        """
+        Returns: state, image paths and timings of a job
+        """
+        with self.condition:
+            return self._summary(self._record(job_id))
+
+    def wait(self, job_id, timeout:float=60):
+        """
+        Waits up to timeout seconds for the job to finish
+        Returns: the job status
+        """
+        with self.condition:
+            record = self._record(job_id)
+            self.condition.wait_for(lambda: record['state'] not in ('queued', 'running'), timeout=float(timeout))
+            return self._summary(record)
+
+    def render(self, request:dict, timeout:float=300):
+        """
+        Submits a job and waits for it
+        Returns: the job status
+        """
+        return self.wait(self.submit(request, block_seconds=timeout), timeout)
+
+    def cancel(self, job_id):
+        """
+        Cancels a job that is still queued
+        Returns: True if it was cancelled
+        """
+        with self.condition:
+            record = self._record(job_id)
+            if record['state'] != 'queued':
+                return False
+            record.update(state='cancelled', finished=time.time())
+            self.counts['cancelled'] += 1
+            self._log({'job': record['id'], 'state': 'cancelled'})
+            self.condition.notify_all()
+            return True
+
+    def events(self, cursor:int=0, timeout:float=30):
+        """
+        Long poll for job and worker events after cursor
+        Returns: {'cursor': next cursor, 'events': [...]}
+        """
+        cursor = int(cursor)
+        with self.condition:
+            self.condition.wait_for(lambda: self.event_offset + len(self.events_log) > cursor, timeout=float(timeout))
+            start = max(0, cursor - self.event_offset)
+            return {'cursor': self.event_offset + len(self.events_log), 'events': self.events_log[start:]}
+
+    def stats(self):
+        """
+        Returns: job counts, queue length, workers and the mean job and total times
+        """
+        with self.condition:
+            finished = [record for record in self.jobs.values() if record['result'] is not None]
+            return dict(self.counts,
+                        queued=sum(1 for record in self.jobs.values() if record['state'] == 'queued'),
+                        running=sum(1 for record in self.jobs.values() if record['state'] == 'running'),
+                        workers=len(self.workers), idle_workers=len(self.idle),
+                        mean_job_seconds=sum(record['result']['seconds'] for record in finished) / len(finished) if finished else 0.0,
+                        mean_total_seconds=sum(record['finished'] - record['submitted'] for record in finished) / len(finished) if finished else 0.0)
+
+class ThreadingXMLRPCServer(ThreadingMixIn, SimpleXMLRPCServer):
+    daemon_threads = True #Long polls must not block other clients
+
+class QuietRequestHandler(SimpleXMLRPCRequestHandler):
+    rpc_paths = ('/', '/RPC2')
+    def log_message(self, format, *args):
+        pass
+
+# ==== Main Execution ====
+def serve(host:str=HOST, port:int=PORT, **options):
+    """
+    Inputs: Host and port to listen on and the FigureService options
+    Starts the workers and serves until interrupted
+    """
+    service = FigureService(**options)
+    start = time.perf_counter()
+    service.start()
+    if not service.running:
+        print("No PyMOL worker could be started, exiting", flush=True)
+        return
+    print(f"{len(service.idle)} PyMOL workers ready in {time.perf_counter() - start:.1f} s", flush=True)
+    server = ThreadingXMLRPCServer((host, int(port)), requestHandler=QuietRequestHandler, allow_none=True, logRequests=False)
+    for method in ('submit', 'status', 'wait', 'render', 'cancel', 'events', 'stats'):
+        server.register_function(getattr(service, method), method)
+    server.register_introspection_functions()
+    print(f"Figure service listening on http://{host}:{port}, images in {service.output_dir}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.stop()
+        print(f"Figure service stopped: {service.stats()}", flush=True)
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="Serve lesson 3 figure jobs from warm PyMOL workers")
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--workers', type=int, default=WORKERS)
+    parser.add_argument('--output-dir', default=OUTPUT_DIRECTORY)
+    parser.add_argument('--rc', default=pymol_batch.RC_PATH, help="pymolrc to run in each worker")
+    parser.add_argument('--max-queue', type=int, default=MAX_QUEUE)
+    parser.add_argument('--max-jobs-per-worker', type=int, default=MAX_JOBS_PER_WORKER)
+    parser.add_argument('--memory-limit-mb', type=float, default=MEMORY_LIMIT_MB)
+    options = parser.parse_args()
+    serve(options.host, options.port, workers=options.workers, output_dir=options.output_dir, rc_path=options.rc,
+          max_queue=options.max_queue, max_jobs_per_worker=options.max_jobs_per_worker,
+          memory_limit_mb=options.memory_limit_mb)
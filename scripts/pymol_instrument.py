@@ -0,0 +1,154 @@
+from pymol import cmd
+import functools
+import json
+import os
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+
+"""
+Opt-in instrumentation for the load hook, extended commands and renders.
+.pymolrc.py imports this module, which wraps cmd.png and cmd.extend, so every
+command registered afterwards is timed. Nothing is measured until you run
+'instrument on'. While it is off, the wrappers only check one flag.
+Each record holds the wall and CPU time and an atom count. Records are written
+as JSON lines to LOG_PATH, and instrument_summary prints a table of them.
+"""
+
+LOG_PATH = os.path.join(os.path.expanduser("~"), 'tmp', 'pymol_instrument.jsonl')
+MAX_RECORDS = 100000
+
+STATE = {'enabled': False, 'log': None}
+RECORDS = deque(maxlen=MAX_RECORDS)
+_DISABLED = nullcontext()
+
+def record(kind:str, name:str, wall:float, cpu:float, atoms):
+    """
+    Stores one measurement and writes it to the JSON lines log
+    """
+    entry = {'time': time.time(), 'kind': kind, 'name': name,
+             'wall_s': round(wall, 6), 'cpu_s': round(cpu, 6), 'atoms': atoms}
+    RECORDS.append(entry)
+    if STATE['log'] is not None:
+        STATE['log'].write(json.dumps(entry) + '\n')
+        STATE['log'].flush()
+
+def _count_atoms(selection:str):
+    try:
+        return cmd.count_atoms(selection)
+    except Exception:
+        return None
+
+@contextmanager
+def _timer(kind:str, name:str, selection:str=None):
+    atoms_before = None if selection else _count_atoms('all')
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        yield
+    finally:
+        wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+        if selection:
+            atoms = _count_atoms(selection)
+        else:
+            atoms_after = _count_atoms('all')
+            atoms = None if atoms_before is None or atoms_after is None else atoms_after - atoms_before
+        record(kind, name, wall, cpu, atoms)
+
+def timed(kind:str, name:str, selection:str=None):
+    """
+    Inputs: Kind of step (load, fetch, step, command, render), its name and an
+    optional selection to count the atoms of
+    Returns: a context manager that times the block when instrumentation is on.
+    Without a selection the atom count is the change in atoms of the session.
+    """
+    if not STATE['enabled']:
+        return _DISABLED
+    return _timer(kind, name, selection)
+
+def wrap(function, kind:str, name:str, selection:str=None):
+    """
+    Returns: function that is timed when instrumentation is on
+    """
+    @functools.wraps(function)
+    def instrumented(*args, **kwargs):
+        if not STATE['enabled']:
+            return function(*args, **kwargs)
+        with _timer(kind, name, selection):
+            return function(*args, **kwargs)
+    instrumented.instrumented = True
+    return instrumented
+
+def _instrumented_extend(name, function=None):
+    """
+    cmd.extend that times the registered command (also works as a decorator)
+    """
+    if function is None:
+        function, name = name, name.__name__
+    if not getattr(function, 'instrumented', False):
+        function = wrap(function, 'command', name)
+    return _original_extend(name, function)
+
+def instrument(action:str='on', log_path:str=None):
+    """
+    Input: on or off, and optionally the path of the JSON lines log
+    e.g. instrument on, ~/tmp/load_timings.jsonl
+    """
+    if STATE['log'] is not None:
+        STATE['log'].close()
+        STATE['log'] = None
+    STATE['enabled'] = action.strip().lower() in ('on', '1', 'true', 'yes')
+    if STATE['enabled']:
+        log_path = os.path.expanduser(log_path or LOG_PATH)
+        os.makedirs(os.path.dirname(log_path), exist_ok=True)
+        STATE['log'] = open(log_path, 'a')
+        print(f"Instrumentation on, writing to {log_path}", flush=True)
+    else:
+        print("Instrumentation off", flush=True)
+
+def instrument_summary(kind:str=''):
+    """
+    Input: Optional kind to show (load, fetch, step, command or render)
+    Prints calls, total/mean/max wall time, CPU time and atoms per recorded step
+    Returns: list of summary rows
+    """
+    groups = {}
+    for entry in RECORDS:
+        if kind and entry['kind'] != kind:
+            continue
+        groups.setdefault((entry['kind'], entry['name']), []).append(entry)
+
+    rows = []
+    for (group_kind, name), entries in groups.items():
+        walls = [entry['wall_s'] for entry in entries]
+        atoms = [entry['atoms'] for entry in entries if entry['atoms'] is not None]
+        rows.append({'kind': group_kind, 'name': name, 'calls': len(entries), 'total_s': sum(walls),
+                     'mean_s': sum(walls) / len(walls), 'max_s': max(walls),
+                     'cpu_s': sum(entry['cpu_s'] for entry in entries),
+                     'atoms': max(atoms) if atoms else None})
+    rows.sort(key=lambda row: row['total_s'], reverse=True)
+
+    print(f"{'kind':<9}{'name':<36}{'calls':>6}{'total s':>10}{'mean s':>9}{'max s':>9}{'cpu s':>9}{'atoms':>10}")
+    for row in rows:
+        atoms = '' if row['atoms'] is None else row['atoms']
+        print(f"{row['kind']:<9}{row['name'][:35]:<36}{row['calls']:>6}{row['total_s']:>10.3f}"
+              f"{row['mean_s']:>9.3f}{row['max_s']:>9.3f}{row['cpu_s']:>9.3f}{atoms:>10}")
+    return rows
+
+def clear_instrument():
+    RECORDS.clear()
+    print("Instrumentation records cleared", flush=True)
+
+# ==== Install ====
+#Only wrap once, even if this module is reloaded
+if not getattr(cmd.extend, 'instrumented', False):
+    _original_extend = cmd.extend
+    _instrumented_extend.instrumented = True
+    cmd.extend = _instrumented_extend
+else:
+    _original_extend = cmd.extend.__globals__['_original_extend']
+if not getattr(cmd.png, 'instrumented', False):
+    cmd.png = wrap(cmd.png, 'render', 'png', 'visible')
+
+cmd.extend("instrument", instrument)
+cmd.extend("instrument_summary", instrument_summary)
+cmd.extend("clear_instrument", clear_instrument)
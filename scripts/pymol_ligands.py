@@ -0,0 +1,90 @@
+from pymol import cmd
+import numpy as np
+
+import pymol_neighbours
+import pymol_scene
+
+"""
+Ligand instances and their binding pockets for the lesson 3 ligand sweep.
+The load hook puts every ligand into one {name}_organics object (or selection).
+ligand_instances splits it into the bound molecules (bonded residues stay
+together, e.g. a glycan), skipping crystallisation additives and fragments
+smaller than MIN_LIGAND_ATOMS. protein_coordinates pulls the protein atoms
+once and pocket_selection finds the pocket residues of each ligand on the grid of
+pymol_neighbours.nearest_distances, so dozens of ligands need one pass each
+over an array instead of a within selection each.
+
+e.g. list_ligands 1EMA_organics
+"""
+
+POCKET_CUTOFF = 4.0 #Angstrom from any ligand atom
+MIN_LIGAND_ATOMS = 6
+#Buffer, cryo and precipitant molecules that are not ligands of interest
+EXCLUDED_RESNAMES = ('GOL', 'EDO', 'PEG', 'PG4', 'PGE', '1PE', 'P6G', 'DMS', 'ACT', 'FMT', 'MPD', 'BME',
+                     'TRS', 'EPE', 'MES', 'IMD', 'CIT', 'SO4', 'PO4', 'ACY', 'IPA', 'EOH', 'MOH')
+
+def ligand_instances(selection:str, min_atoms:int=MIN_LIGAND_ATOMS, excluded=EXCLUDED_RESNAMES):
+    """
+    Inputs: Ligand object or selection (e.g. 1EMA_organics), the smallest
+    ligand to keep and the residue names to skip
+    Returns: list of ligand dictionaries (name, resn, chain, resi, atoms,
+    selection) in chain and residue order
+    """
+    residues = {}
+    cmd.iterate(selection, "residues.setdefault((model, chain, resv, resi, segi, resn), []).append(index)",
+                space={'residues': residues})
+    excluded = {name.upper() for name in excluded}
+    assigned, ligands = set(), []
+    for key in sorted(residues):
+        model, chain, _, resi, _, resn = key
+        if key in assigned or resn.upper() in excluded:
+            continue
+        #The residues of the same molecule (bonded to this one) within the ligand selection
+        molecule = {}
+        cmd.iterate(f"(bymolecule ({pymol_neighbours.index_selection(model, residues[key])})) and ({selection})",
+                    "molecule.setdefault((model, chain, resv, resi, segi, resn), []).append(index)",
+                    space={'molecule': molecule})
+        molecule = {item: indices for item, indices in molecule.items() if item not in assigned}
+        assigned.update(molecule)
+        keys = [(model, index) for item, indices in molecule.items() for index in indices]
+        if len(keys) < int(min_atoms):
+            continue
+        resns = '_'.join(sorted({item[5] for item in molecule}))
+        ligands.append({'name': cmd.get_legal_name(f"{resns}_{chain}{resi}"), 'resn': resns, 'chain': chain,
+                        'resi': resi, 'atoms': len(keys), 'selection': pymol_scene.atoms_selection(keys)})
+    return ligands
+
+def protein_coordinates(protein:str, state:int=1):
+    """
+    Input: Protein object or selection
+    Returns: list of (object, index) and the (N, 3) coordinates of its protein atoms
+    """
+    rows = []
+    cmd.iterate_state(state, f"({protein}) and polymer.protein", "rows.append((model, index, x, y, z))",
+                      space={'rows': rows})
+    return [(model, index) for model, index, *_ in rows], np.array([row[2:] for row in rows], dtype=float).reshape(-1, 3)
+
+def pocket_selection(keys:list, coords, ligand:str, cutoff:float=POCKET_CUTOFF, state:int=1):
+    """
+    Inputs: Protein atoms and coordinates from protein_coordinates, ligand selection and cutoff in Angstrom
+    Returns: selection of the whole protein residues in contact with the ligand ('none' if there are none)
+    """
+    centres = cmd.get_coords(ligand, state)
+    if centres is None or not len(keys):
+        return 'none'
+    distances = pymol_neighbours.nearest_distances(coords, centres, float(cutoff))
+    near = [keys[index] for index in np.nonzero(np.isfinite(distances))[0]]
+    return f"byres ({pymol_scene.atoms_selection(near)})" if near else 'none'
+
+def list_ligands(selection:str, min_atoms:int=MIN_LIGAND_ATOMS):
+    """
+    Input: Ligand object or selection
+    Prints and returns the ligand instances
+    """
+    ligands = ligand_instances(selection, int(min_atoms))
+    for ligand in ligands:
+        print(f"{ligand['name']:<24}{ligand['atoms']:>5} atoms", flush=True)
+    print(f"{len(ligands)} ligands in {selection}", flush=True)
+    return ligands
+
+cmd.extend("list_ligands", list_ligands)
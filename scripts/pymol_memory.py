@@ -0,0 +1,35 @@
+import sys
+
+"""
+Memory use of the running process, for the load reports in .pymolrc.py,
+bulk_load and the figure service workers. Reads /proc/self/status on Linux,
+otherwise psutil (when installed) or resource, which only knows the peak.
+Does not need PyMOL.
+"""
+
+def memory_mb(peak:bool=False):
+    """
+    Input: True for the peak resident memory instead of the current one
+    Returns: resident memory of this process in MB (the peak where the
+    current one can't be read), or None if it can't be read at all
+    """
+    field = 'VmHWM:' if peak else 'VmRSS:'
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith(field):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    if not peak:
+        try:
+            import psutil
+            return psutil.Process().memory_info().rss / 1024.0**2
+        except ImportError:
+            pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / 1024.0**2 if sys.platform == 'darwin' else maxrss / 1024.0
@@ -0,0 +1,248 @@
+from pymol import cmd
+import json
+import math
+import os
+import shutil
+import subprocess
+import time
+from concurrent.futures import as_completed
+
+import pymol_parallel_layers
+
+"""
+Parallel movie renderer for multi-state objects (MD snapshots, NMR ensembles)
+and rotation/rocking sequences.
+The scene is saved once to the frame directory (movie_session.pse) together
+with the job settings (movie.json). The frames are split into chunks that
+headless PyMOL workers ray trace, each with its own share of max_threads.
+Frames are written to the frame directory as they finish, and the ones that
+are ready (in order) are streamed from disk into ffmpeg, so no frame is kept
+in memory. Running the same command again resumes an interrupted job from the
+saved scene: frames already on disk are not rendered again.
+
+Modes (combine with +, e.g. states+rock):
+    states  one frame per state of the scene (cycled if there are more frames)
+    rotate  a full turn about the y axis
+    rock    a rocking motion of +/- ROCK_ANGLE degrees
+    movie   the frames of the movie already defined in the session (mset/mview)
+
+e.g. render_movie ~/tmp/movie/nmr.mp4, states+rock, frames=200
+From a shell: pymol -cq ensemble.pse -d "render_movie ~/tmp/movie/ensemble.gif, states"
+"""
+
+WIDTH = 800
+HEIGHT = 600
+DPI = 150
+ANTIALIAS = 1
+FPS = 25
+WORKERS = 3
+CHUNK_SIZE = 20 #Frames per worker task
+ROCK_ANGLE = 15.0 #Degrees
+AXIS = 'y'
+FFMPEG = shutil.which('ffmpeg') or 'ffmpeg'
+#ffmpeg output options per movie format
+ENCODER_OPTIONS = {
+    'mp4': ['-c:v', 'libx264', '-pix_fmt', 'yuv420p', '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2'],
+    'gif': ['-filter_complex', 'split[a][b];[a]palettegen[p];[b][p]paletteuse'],
+}
+SESSION_NAME = 'movie_session.pse'
+MANIFEST_NAME = 'movie.json'
+
+LOADED_MARKER = '_movie_session'
+_LOADED = {'key': None}
+
+def frame_path(frame_dir:str, index:int):
+    return os.path.join(frame_dir, f'frame_{index:05d}.png')
+
+def frame_specs(modes:list, frames:int, states:int, movie_frames:int):
+    """
+    Inputs: Modes, number of frames, states of the scene and frames of the session movie
+    Returns: list of (index, state, angle, movie frame) for every frame, 0 meaning unchanged
+    """
+    specs = []
+    for index in range(frames):
+        state = index % states + 1 if 'states' in modes else 0
+        angle = 0.0
+        if 'rotate' in modes:
+            angle = 360.0 * index / frames
+        elif 'rock' in modes:
+            angle = ROCK_ANGLE * math.sin(2 * math.pi * index / frames)
+        movie_frame = index % movie_frames + 1 if 'movie' in modes else 0
+        specs.append((index, state, angle, movie_frame))
+    return specs
+
+def render_frames(session_path:str, frames:list, frame_dir:str, view, image:dict, max_threads:int):
+    """
+    Runs in a worker. Loads the saved scene (once per worker and job) and ray
+    traces the frames that are not on disk yet.
+    Returns: (frames rendered, seconds)
+    """
+    from pymol import cmd
+
+    start = time.perf_counter()
+    key = (session_path, os.path.getmtime(session_path))
+    #Other tasks on the shared pool replace the session, which also removes the marker
+    if _LOADED['key'] != key or LOADED_MARKER not in cmd.get_names('selections'):
+        cmd.load(session_path)
+        cmd.select(LOADED_MARKER, 'none', enable=0)
+        _LOADED['key'] = key
+    cmd.set('max_threads', max_threads)
+    cmd.set('antialias', image['ANTIALIAS'])
+
+    rendered = 0
+    for index, state, angle, movie_frame in frames:
+        path = frame_path(frame_dir, index)
+        if os.path.exists(path):
+            continue
+        if movie_frame:
+            cmd.frame(movie_frame)
+        else:
+            cmd.set_view(view)
+            if angle:
+                cmd.turn(AXIS, angle)
+        if state:
+            cmd.set('state', state)
+        partial = path[:-len('.png')] + '.part.png'
+        cmd.png(partial, width=image['WIDTH'], height=image['HEIGHT'], dpi=image['DPI'], ray=1)
+        os.replace(partial, path) #Only complete frames count when resuming
+        rendered += 1
+    return rendered, time.perf_counter() - start
+
+def start_encoder(output:str, fps:int):
+    """
+    Input: Movie path (.mp4 or .gif) and frame rate
+    The movie is written to <output>.part, finish_encoder moves it into place.
+    Returns: ffmpeg process reading PNG frames from stdin, or None if ffmpeg is missing
+    """
+    movie_format = output.rsplit('.', 1)[-1].lower()
+    if movie_format not in ENCODER_OPTIONS:
+        raise ValueError(f"Unknown movie format {movie_format}, choose from {', '.join(ENCODER_OPTIONS)}")
+    command = [FFMPEG, '-y', '-loglevel', 'error', '-f', 'image2pipe', '-framerate', str(fps),
+               '-c:v', 'png', '-i', '-'] + ENCODER_OPTIONS[movie_format] + ['-f', movie_format, output + '.part']
+    try:
+        return subprocess.Popen(command, stdin=subprocess.PIPE)
+    except FileNotFoundError:
+        print(f"{FFMPEG} not found, the frames are kept without encoding", flush=True)
+        return None
+
+def finish_encoder(encoder, output:str, complete:bool):
+    """
+    Inputs: ffmpeg process from start_encoder, movie path and True if every frame was streamed
+    Moves the movie into place if it is complete and ffmpeg succeeded, otherwise
+    stops ffmpeg and removes the partial movie, so a truncated movie never replaces output.
+    Returns: True if the movie was saved
+    """
+    if not complete:
+        encoder.kill()
+    try:
+        encoder.stdin.close()
+    except BrokenPipeError:
+        pass
+    encoder.wait()
+    partial = output + '.part'
+    if complete and encoder.returncode == 0 and os.path.exists(partial):
+        os.replace(partial, output)
+        return True
+    if os.path.exists(partial):
+        os.remove(partial)
+    return False
+
+def render_movie(output:str, mode:str='rotate', frames:int=0, workers:int=WORKERS, fps:int=FPS,
+                 frame_dir:str=''):
+    """
+    Inputs: Movie path (.mp4 or .gif), modes, number of frames (0: one per state
+    or movie frame, 120 for rotations), worker processes, frame rate and the
+    frame directory (defaults to <output>_frames)
+    Returns: path of the movie, or of the frame directory if it was not encoded
+    """
+    output = os.path.abspath(os.path.expanduser(output))
+    frame_dir = os.path.abspath(os.path.expanduser(frame_dir or os.path.splitext(output)[0] + '_frames'))
+    modes = [item.strip().lower() for item in str(mode).split('+') if item.strip()]
+    unknown = set(modes) - {'states', 'rotate', 'rock', 'movie'}
+    if unknown or not modes:
+        print(f"Unknown mode {mode}, combine states, rotate, rock and movie", flush=True)
+        return None
+    if output.rsplit('.', 1)[-1].lower() not in ENCODER_OPTIONS:
+        print(f"Unknown movie format {output}, choose from {', '.join(ENCODER_OPTIONS)}", flush=True)
+        return None
+
+    image = {'WIDTH': WIDTH, 'HEIGHT': HEIGHT, 'DPI': DPI, 'ANTIALIAS': ANTIALIAS}
+    manifest = os.path.join(frame_dir, MANIFEST_NAME)
+    session = os.path.join(frame_dir, SESSION_NAME)
+    if os.path.exists(manifest) and os.path.exists(session):
+        #Resume from the saved scene and settings, not the current session
+        with open(manifest) as handle:
+            job = json.load(handle)
+        if job['modes'] != modes or job['image'] != image or int(frames) not in (0, job['frames']):
+            print(f"{frame_dir} holds frames of a different movie, choose another output "
+                  f"or delete the directory to start again", flush=True)
+            return None
+        done = sum(1 for index in range(job['frames']) if os.path.exists(frame_path(frame_dir, index)))
+        print(f"Resuming from the saved scene, {done}/{job['frames']} frames already rendered", flush=True)
+    else:
+        states, movie_frames = max(1, cmd.count_states('all')), max(1, cmd.count_frames())
+        frames = int(frames) or (movie_frames if 'movie' in modes else states if 'states' in modes else 120)
+        job = {'modes': modes, 'frames': frames, 'states': states, 'movie_frames': movie_frames,
+               'view': list(cmd.get_view()), 'image': image}
+        os.makedirs(frame_dir, exist_ok=True)
+        cmd.save(session)
+        with open(manifest, 'w') as handle:
+            json.dump(job, handle, indent=2)
+        done = 0
+    frames = job['frames']
+
+    start = time.perf_counter()
+    workers = max(1, int(workers))
+    max_threads = pymol_parallel_layers.threads_per_worker(workers)
+    specs = frame_specs(modes, frames, job['states'], job['movie_frames'])
+    todo = [spec for spec in specs if not os.path.exists(frame_path(frame_dir, spec[0]))]
+    pool = pymol_parallel_layers.get_pool(workers)
+    futures = [pool.submit(render_frames, session, todo[i:i + CHUNK_SIZE], frame_dir, tuple(job['view']),
+                           image, max_threads) for i in range(0, len(todo), CHUNK_SIZE)]
+
+    encoder = start_encoder(output, fps)
+    process = encoder #stream_ready drops encoder when ffmpeg stops reading
+    streamed, rendered_now = 0, 0
+
+    def stream_ready():
+        nonlocal streamed, encoder
+        while encoder is not None and streamed < frames and os.path.exists(frame_path(frame_dir, streamed)):
+            with open(frame_path(frame_dir, streamed), 'rb') as handle:
+                try:
+                    encoder.stdin.write(handle.read())
+                except BrokenPipeError:
+                    print("The encoder stopped, the frames are kept in the frame directory", flush=True)
+                    encoder = None
+                    return
+            streamed += 1
+
+    stream_ready()
+    for future in as_completed(futures):
+        try:
+            rendered, seconds = future.result()
+        except Exception as error:
+            print(f"Rendering frames failed: {error}", flush=True)
+            continue
+        done += rendered
+        rendered_now += rendered #Frames from an earlier run do not count towards the rate
+        print(f"{done}/{frames} frames ({rendered_now / (time.perf_counter() - start):.1f} frames/s)", flush=True)
+        stream_ready()
+
+    missing = frames - sum(1 for index in range(frames) if os.path.exists(frame_path(frame_dir, index)))
+    stream_ready()
+    saved = process is not None and finish_encoder(process, output, encoder is not None and not missing and streamed == frames)
+    if missing:
+        print(f"Movie not encoded ({missing} frames missing), run the same command again to resume. "
+              f"Frames: {frame_dir}", flush=True)
+        return frame_dir
+    if process is None:
+        print(f"Movie not encoded, {FFMPEG} was not found. All {frames} frames are in {frame_dir}, "
+              f"install ffmpeg (or set FFMPEG) and run the same command again to encode them", flush=True)
+        return frame_dir
+    if not saved:
+        print(f"Movie not encoded, {FFMPEG} failed. All {frames} frames are in {frame_dir}", flush=True)
+        return frame_dir
+    print(f"Saved {output}: {frames} frames in {time.perf_counter() - start:.1f} s", flush=True)
+    return output
+
+cmd.extend("render_movie", render_movie)
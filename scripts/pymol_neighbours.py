@@ -0,0 +1,198 @@
+from pymol import cmd
+import hashlib
+import itertools
+from collections import OrderedDict
+import numpy as np
+
+"""
+Active site neighbour search for the load hook in .pymolrc.py.
+Instead of one 'within X of organic' selection per category, the coordinates
+of an object are pulled once and every water, inorganic and protein atom is
+measured against the organics on a uniform grid in a single pass.
+Results are cached by a hash of the coordinates, so loading the same
+structure again skips the search.
+"""
+
+#Cutoffs in Angstrom from any organic atom
+DEFAULT_CUTOFFS = {'water': 3.5, 'inorganic': 3.5, 'residues': 3.5}
+CACHE_SIZE = 64
+
+#Selections for the atom classes that are searched around the organics
+ATOM_CLASSES = {
+    'organic': 'organic',
+    'water': 'resname HOH',
+    'inorganic': 'inorganic',
+    'residues': 'polymer.protein',
+}
+
+_CACHE = OrderedDict()
+CACHE_STATS = {'hits': 0, 'misses': 0}
+
+def nearest_distances(points, centres, cutoff:float):
+    """
+    Inputs: (N, 3) array of points, (M, 3) array of centres and a cutoff
+    Hashes the centres into a grid with a cell size of the cutoff so every
+    point is only compared with the centres in its 27 neighbouring cells.
+    Returns: (N,) array of the distance to the nearest centre, inf if no
+    centre is within the cutoff
+    """
+    points = np.asarray(points, dtype=float).reshape(-1, 3)
+    centres = np.asarray(centres, dtype=float).reshape(-1, 3)
+    distances = np.full(len(points), np.inf)
+    if not len(points) or not len(centres) or cutoff <= 0:
+        return distances
+
+    origin = centres.min(axis=0) - cutoff
+    shape = np.floor((centres.max(axis=0) + cutoff - origin) / cutoff).astype(np.int64) + 1
+    centre_keys = np.ravel_multi_index(np.floor((centres - origin) / cutoff).astype(np.int64).T, shape)
+    order = np.argsort(centre_keys, kind='stable')
+    centre_keys = centre_keys[order]
+    centres = centres[order]
+
+    #Points outside the padded bounding box of the centres can't be in range
+    point_cells = np.floor((points - origin) / cutoff).astype(np.int64)
+    inside = np.all((point_cells >= 0) & (point_cells < shape), axis=1)
+    candidates = np.nonzero(inside)[0]
+    point_cells = point_cells[candidates]
+
+    for offset in itertools.product((-1, 0, 1), repeat=3):
+        cells = point_cells + offset
+        valid = np.all((cells >= 0) & (cells < shape), axis=1)
+        if not valid.any():
+            continue
+        indices = candidates[valid]
+        keys = np.ravel_multi_index(cells[valid].T, shape)
+        start = np.searchsorted(centre_keys, keys, side='left')
+        count = np.searchsorted(centre_keys, keys, side='right') - start
+        #Walk the centres of each cell together, one slot at a time
+        for slot in range(int(count.max())):
+            has_slot = count > slot
+            point_indices = indices[has_slot]
+            step = np.linalg.norm(points[point_indices] - centres[start[has_slot] + slot], axis=1)
+            distances[point_indices] = np.minimum(distances[point_indices], step)
+
+    distances[distances > cutoff] = np.inf
+    return distances
+
+def coordinate_hash(coords):
+    """
+    Input: coordinate array
+    Returns: sha1 hex digest of the coordinates
+    """
+    return hashlib.sha1(np.ascontiguousarray(coords, dtype=np.float32).tobytes()).hexdigest()
+
+def _class_indices(name:str, expression:str):
+    """
+    Returns: sorted array of the object atom indices (1 based) in a class
+    """
+    return np.array(sorted(index for model, index in cmd.index(f"{name} and ({expression})")), dtype=np.int64)
+
+def _class_coordinates(name:str, expression:str, state:int):
+    """
+    Returns: object atom indices and (N, 3) coordinates of the atoms of a class that have coordinates in the state
+    """
+    rows = []
+    cmd.iterate_state(state, f"{name} and ({expression})", "rows.append((index, x, y, z))", space={'rows': rows})
+    rows.sort()
+    return np.array([row[0] for row in rows], dtype=np.int64), np.array([row[1:] for row in rows], dtype=float).reshape(-1, 3)
+
+def find_active_site(name:str, cutoffs:dict=None, state:int=1):
+    """
+    Inputs: Object name, dictionary of cutoffs (water, inorganic, residues)
+    Searches the waters, inorganics and protein atoms within the cutoffs of
+    the organics of the object in one pass.
+    Returns: dictionary of object atom index arrays for 'organic', 'water',
+    'inorganic' and 'residues' (protein atoms in contact, before byres)
+    """
+    cutoffs = dict(DEFAULT_CUTOFFS, **(cutoffs or {}))
+    coords = cmd.get_coords(name, state)
+    if coords is None:
+        return {category: np.zeros(0, dtype=np.int64) for category in ATOM_CLASSES}
+
+    key = (coordinate_hash(coords), len(coords), tuple(sorted(cutoffs.items())))
+    if key in _CACHE:
+        _CACHE.move_to_end(key)
+        CACHE_STATS['hits'] += 1
+        print(f"Active site of {name} found in the neighbour cache", flush=True)
+        return _CACHE[key]
+    CACHE_STATS['misses'] += 1
+
+    classes = {category: _class_indices(name, expression) for category, expression in ATOM_CLASSES.items()}
+    if len(coords) != cmd.count_atoms(name):
+        #Some atoms have no coordinates in this state, only search the ones that do (indices and coordinates together)
+        class_coords = {}
+        for category, expression in ATOM_CLASSES.items():
+            indices, class_coords[category] = _class_coordinates(name, expression, state)
+            if category != 'organic':
+                classes[category] = indices
+    else:
+        class_coords = {category: coords[indices - 1] for category, indices in classes.items()}
+
+    #One pass over every candidate atom with the largest cutoff, then split by class
+    searched = [category for category in ('water', 'inorganic', 'residues') if len(classes[category])]
+    result = {'organic': classes['organic']}
+    if searched:
+        points = np.concatenate([class_coords[category] for category in searched])
+        distances = nearest_distances(points, class_coords['organic'], max(cutoffs[category] for category in searched))
+        offset = 0
+        for category in searched:
+            count = len(classes[category])
+            in_range = distances[offset:offset + count] <= cutoffs[category]
+            result[category] = classes[category][in_range]
+            offset += count
+    for category in ('water', 'inorganic', 'residues'):
+        result.setdefault(category, np.zeros(0, dtype=np.int64))
+
+    _CACHE[key] = result
+    while len(_CACHE) > CACHE_SIZE:
+        _CACHE.popitem(last=False)
+    return result
+
+def index_selection(name:str, indices):
+    """
+    Inputs: Object name and atom indices
+    Returns: selection string with consecutive indices collapsed into ranges
+    e.g. 1EMA and index 1-5+9
+    """
+    indices = sorted(set(int(index) for index in indices))
+    if not indices:
+        return f"{name} and none"
+    ranges = []
+    start = previous = indices[0]
+    for index in indices[1:] + [None]:
+        if index is not None and index == previous + 1:
+            previous = index
+            continue
+        ranges.append(str(start) if start == previous else f"{start}-{previous}")
+        if index is not None:
+            start = previous = index
+    return f"{name} and index {'+'.join(ranges)}"
+
+def active_site_selections(name:str, cutoffs:dict=None):
+    """
+    Input: Object name and dictionary of cutoffs
+    Returns: dictionary of selection strings for the load hook
+    (water, inorganic, organic and residues)
+    """
+    site = find_active_site(name, cutoffs)
+    return {
+        'water': index_selection(name, site['water']),
+        'inorganic': index_selection(name, site['inorganic']),
+        'organic': f"{name} and organic",
+        'residues': f"byres ({index_selection(name, site['residues'])})",
+    }
+
+def neighbour_cache_stats():
+    """
+    Prints and returns the hit/miss counts of the neighbour cache
+    """
+    print(f"Neighbour cache: {CACHE_STATS['hits']} hits, {CACHE_STATS['misses']} misses, {len(_CACHE)} entries", flush=True)
+    return dict(CACHE_STATS, entries=len(_CACHE))
+
+def clear_neighbour_cache():
+    _CACHE.clear()
+    CACHE_STATS.update(hits=0, misses=0)
+    print("Neighbour cache cleared", flush=True)
+
+cmd.extend("neighbour_cache_stats", neighbour_cache_stats)
+cmd.extend("clear_neighbour_cache", clear_neighbour_cache)
@@ -0,0 +1,99 @@
+from pymol import cmd
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pymol_batch
+
+"""
+Renders the lesson 3 figure layers in parallel worker processes.
+The prepared session is snapshot once with cmd.get_session and sent to one
+headless PyMOL worker per layer. Each worker replays the (cheap) scene setup
+of the layers before its own without ray tracing them, so it reaches exactly
+the settings the sequential path has at that point, then ray traces only its
+own layer. max_threads is split between the workers.
+"""
+
+#Layers in the order run_selection renders them, and the images they save
+LAYERS = ('protein', 'active_site', 'transparent')
+LAYER_IMAGES = {'protein': (4,), 'active_site': (3,), 'transparent': (1, 2)}
+
+#Lesson 3 globals that change the images, copied into every worker
+LESSON_GLOBALS = ('WIDTH', 'HEIGHT', 'DPI', 'ANTIALIAS', 'LIGAND_COLOR', 'RENDER_CACHE',
+                  'TRANSPARENT_OBJECT_COLOR', 'TRANSPARENT_OBJECT_TRANSPARENCY')
+
+_POOL = {'pool': None, 'workers': 0}
+
+def get_pool(workers:int):
+    """
+    Input: Number of workers
+    Returns: a process pool of headless PyMOL workers, reused between calls
+    (a bigger pool replaces it, jobs already queued on the old one still finish)
+    """
+    if _POOL['pool'] is None or _POOL['workers'] < workers:
+        if _POOL['pool'] is not None:
+            _POOL['pool'].shutdown(wait=False)
+        context = multiprocessing.get_context('spawn')
+        _POOL['pool'] = ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                            initializer=pymol_batch.start_headless_pymol, initargs=(None,))
+        _POOL['workers'] = workers
+    return _POOL['pool']
+
+def threads_per_worker(workers:int):
+    """
+    Input: Number of workers
+    Returns: ray tracing threads for each worker so the total matches the cores
+    """
+    return max(1, (os.cpu_count() or 1) // max(1, workers))
+
+def render_layer(session:dict, layer:str, protein:str, active_site:list, resi_list, image_dir:str,
+                 pymol_view, lesson_globals:dict, max_threads:int):
+    """
+    Runs in a worker. Restores the session snapshot and renders one layer.
+    Returns: (layer, seconds, list of saved images)
+    """
+    from pymol import cmd
+    import pymol_scripting_lesson3 as lesson3
+
+    start = time.perf_counter()
+    cmd.set_session(session)
+    cmd.set('max_threads', max_threads)
+    for name, value in lesson_globals.items():
+        setattr(lesson3, name, value)
+    cmd.set('antialias', lesson3.ANTIALIAS) #The snapshot may come from a draft render
+
+    position = LAYERS.index(layer)
+    transparent_object = lesson3.protein_figure(protein, resi_list, image_dir, pymol_view, render=(layer == 'protein'))
+    if position >= 1:
+        lesson3.active_site_figure(protein, active_site, image_dir, pymol_view, render=(layer == 'active_site'))
+    if position >= 2:
+        lesson3.transparent_figure(protein, transparent_object, image_dir, pymol_view, render=True)
+
+    images = [os.path.join(image_dir, f'{protein}_{number}.png') for number in LAYER_IMAGES[layer]]
+    return layer, time.perf_counter() - start, images
+
+def render_figures_parallel(protein:str, active_site:list, resi_list, image_dir:str, pymol_view,
+                            lesson_globals:dict, workers:int=3, layers=LAYERS):
+    """
+    Inputs: Same as render_figures in lesson 3, the lesson 3 globals, the number of workers
+    and the layers to render
+    Snapshots the current session and renders every layer in its own worker.
+    Returns: dictionary of layer -> list of saved images
+    """
+    workers = max(1, min(int(workers), len(layers)))
+    max_threads = threads_per_worker(workers)
+    start = time.perf_counter()
+    session = cmd.get_session()
+    pool = get_pool(workers)
+    futures = [pool.submit(render_layer, session, layer, protein, list(active_site), resi_list, image_dir,
+                           tuple(pymol_view), lesson_globals, max_threads) for layer in layers]
+
+    images = {}
+    for future in futures:
+        layer, seconds, layer_images = future.result()
+        images[layer] = layer_images
+        print(f"Rendered {layer} layer in {seconds:.1f} s", flush=True)
+    print(f"Rendered {len(layers)} layers with {workers} workers ({max_threads} threads each) "
+          f"in {time.perf_counter() - start:.1f} s", flush=True)
+    return images
@@ -0,0 +1,166 @@
+import io
+import struct
+import zlib
+import numpy as np
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+"""
+PNG reading and writing for the figure compositing and post-processing.
+Uses PIL when it is installed, otherwise the small zlib based codec here
+(8 bit, non interlaced, as PyMOL writes them). Does not need PyMOL, so it
+can run in plain worker processes.
+"""
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+#PNG color type -> channels
+PNG_CHANNELS = {0: 1, 2: 3, 4: 2, 6: 4}
+
+# ==== PNG codec ====
+def _paeth(left, up, up_left):
+    """
+    Paeth predictor for arrays of neighbouring bytes (as signed integers)
+    """
+    estimate = left + up - up_left
+    distance_left, distance_up, distance_up_left = np.abs(estimate - left), np.abs(estimate - up), np.abs(estimate - up_left)
+    return np.where((distance_left <= distance_up) & (distance_left <= distance_up_left), left,
+                    np.where(distance_up <= distance_up_left, up, up_left))
+
+def _unfilter(raw:bytes, height:int, width:int, channels:int):
+    """
+    Reverses the PNG scanline filters. A byte depends on the pixels to its
+    left, above and above left, so the pixels are restored one anti-diagonal
+    (y + x) at a time, every row of a diagonal at once with its own filter.
+    Returns: uint8 array (height, width * channels)
+    """
+    rows = np.frombuffer(raw, dtype=np.uint8).reshape(height, width * channels + 1)
+    kinds = rows[:, 0].astype(np.intp)
+    if kinds.size and kinds.max() > 4:
+        raise ValueError(f"Unknown PNG filter type {kinds.max()}")
+    lines = rows[:, 1:].reshape(height, width, channels).astype(np.int16)
+    #Padded by a zero row above and a zero column to the left, pixel (y, x) is pixels[y + 1, x + 1]
+    pixels = np.zeros((height + 1, width + 1, channels), dtype=np.int16)
+    for diagonal in range(height + width - 1):
+        ys = np.arange(max(0, diagonal - width + 1), min(height, diagonal + 1))
+        xs = diagonal - ys
+        left, up, up_left = pixels[ys + 1, xs], pixels[ys, xs + 1], pixels[ys, xs]
+        predictions = np.stack([np.zeros_like(left), left, up, (left + up) >> 1, _paeth(left, up, up_left)])
+        pixels[ys + 1, xs + 1] = (lines[ys, xs] + predictions[kinds[ys], np.arange(len(ys))]) & 0xFF
+    return pixels[1:, 1:].astype(np.uint8).reshape(height, width * channels)
+
+def decode_png(data:bytes):
+    """
+    Input: PNG file contents (8 bit gray, gray alpha, RGB or RGBA, not interlaced)
+    Returns: uint8 RGBA array (height, width, 4)
+    """
+    if data[:8] != PNG_SIGNATURE:
+        raise ValueError("Not a PNG file")
+    position, idat = 8, []
+    while position < len(data):
+        length, kind = struct.unpack('>I4s', data[position:position + 8])
+        chunk = data[position + 8:position + 8 + length]
+        if kind == b'IHDR':
+            width, height, depth, color_type, _, _, interlace = struct.unpack('>IIBBBBB', chunk)
+        elif kind == b'IDAT':
+            idat.append(chunk)
+        elif kind == b'IEND':
+            break
+        position += 12 + length
+    if depth != 8 or interlace or color_type not in PNG_CHANNELS:
+        raise ValueError(f"Unsupported PNG (bit depth {depth}, color type {color_type}, interlace {interlace}), install Pillow")
+
+    channels = PNG_CHANNELS[color_type]
+    pixels = _unfilter(zlib.decompress(b''.join(idat)), height, width, channels).reshape(height, width, channels)
+    if channels == 4:
+        return pixels
+    rgba = np.full((height, width, 4), 255, dtype=np.uint8)
+    rgba[..., :3] = pixels[..., :1] if channels <= 2 else pixels
+    if channels == 2:
+        rgba[..., 3] = pixels[..., 1]
+    return rgba
+
+def _filter_rows(pixels:np.ndarray, channels:int, adaptive:bool):
+    """
+    Input: uint8 array (height, width * channels)
+    Returns: uint8 array (height, 1 + width * channels) of filter byte and filtered row.
+    Adaptive picks the filter with the smallest sum of absolute values per row (like libpng).
+    """
+    height, stride = pixels.shape
+    rows = np.zeros((height, stride + 1), dtype=np.uint8)
+    if not adaptive:
+        rows[:, 1:] = pixels
+        return rows
+    current = pixels.astype(np.int16)
+    left = np.zeros_like(current)
+    left[:, channels:] = current[:, :-channels]
+    up = np.zeros_like(current)
+    up[1:] = current[:-1]
+    up_left = np.zeros_like(current)
+    up_left[1:, channels:] = current[:-1, :-channels]
+    candidates = np.stack([current, current - left, current - up, current - ((left + up) >> 1),
+                           current - _paeth(left, up, up_left)]) & 0xFF
+    signed = candidates.astype(np.uint8).view(np.int8).astype(np.int32)
+    choice = np.abs(signed).sum(axis=2).argmin(axis=0)
+    rows[:, 0] = choice
+    rows[:, 1:] = candidates[choice, np.arange(height)]
+    return rows
+
+def encode_png(rgba:np.ndarray, level:int=6, adaptive:bool=False):
+    """
+    Inputs: uint8 RGBA array (height, width, 4), zlib level and whether to filter the rows
+    Returns: PNG file contents
+    """
+    height, width, _ = rgba.shape
+    raw = _filter_rows(np.ascontiguousarray(rgba).reshape(height, width * 4), 4, adaptive)
+
+    def chunk(kind, body):
+        return struct.pack('>I', len(body)) + kind + body + struct.pack('>I', zlib.crc32(kind + body) & 0xFFFFFFFF)
+    header = struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0)
+    return PNG_SIGNATURE + chunk(b'IHDR', header) + chunk(b'IDAT', zlib.compress(raw.tobytes(), level)) + chunk(b'IEND', b'')
+
+def read_png(path:str):
+    """
+    Returns: uint8 RGBA array (height, width, 4) of a PNG file
+    """
+    if Image is not None:
+        with Image.open(path) as image:
+            return np.asarray(image.convert('RGBA'))
+    with open(path, 'rb') as handle:
+        return decode_png(handle.read())
+
+def png_to_array(data:bytes):
+    """
+    Input: PNG file contents
+    Returns: uint8 RGBA array (height, width, 4)
+    """
+    if Image is not None:
+        with Image.open(io.BytesIO(data)) as image:
+            return np.asarray(image.convert('RGBA'))
+    return decode_png(data)
+
+def write_png(path:str, rgba:np.ndarray):
+    if Image is not None:
+        Image.fromarray(rgba, 'RGBA').save(path)
+        return
+    with open(path, 'wb') as handle:
+        handle.write(encode_png(rgba))
+
+def downscale(rgba:np.ndarray, size:int):
+    """
+    Inputs: uint8 RGBA array and the longest side of the result in pixels
+    Returns: the image shrunk by averaging blocks of pixels (alpha weighted)
+    """
+    height, width, _ = rgba.shape
+    factor = max(1, -(-max(height, width) // int(size)))
+    if factor == 1:
+        return rgba
+    height, width = height // factor * factor, width // factor * factor
+    pixels = rgba[:height, :width].astype(np.float32)
+    alpha = pixels[..., 3:4] / 255.0
+    blocks = lambda values: values.reshape(height // factor, factor, width // factor, factor, -1).mean(axis=(1, 3))
+    mean_alpha = blocks(alpha)
+    colors = blocks(pixels[..., :3] * alpha) / np.maximum(mean_alpha, 1e-6)
+    return np.clip(np.rint(np.concatenate([colors, mean_alpha * 255.0], axis=2)), 0, 255).astype(np.uint8)
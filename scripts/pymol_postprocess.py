@@ -0,0 +1,273 @@
+import html
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import pymol_png
+
+"""
+Post-processing of rendered images in a background process pool.
+Every image is re-encoded (FORMAT png: lossless, the smaller of the original
+and an optimised encoding is kept; webp or jpeg: a copy at QUALITY, needs
+Pillow) and gets a thumbnail in thumbnails/. finish_gallery then builds a
+contact sheet of the thumbnails and a static HTML gallery (index.html) for
+the output directory, with the batch report timings when there is one.
+submit_images returns at once and the workers run at a lower priority, so
+rendering never waits for them.
+
+Usage from a shell (on images that are already rendered):
+    python pymol_postprocess.py ~/tmp/batch --format webp --quality 85
+"""
+
+#Post-processing Settings
+FORMAT = 'png' #png (lossless optimisation), webp or jpeg
+QUALITY = 90
+LOSSLESS_WEBP = False
+KEEP_ORIGINALS = True #Keep the rendered png next to a webp/jpeg copy
+THUMBNAIL_SIZE = 256
+THUMBNAIL_DIRECTORY = 'thumbnails'
+CONTACT_SHEET_NAME = 'contact_sheet.png'
+GALLERY_NAME = 'index.html'
+COLUMNS = 6
+WORKERS = 2
+NICE = 10 #Added to the worker priority, rendering comes first
+IMAGE_EXTENSIONS = ('.png', '.webp', '.jpg', '.jpeg')
+
+_POOL = {'pool': None, 'workers': 0}
+
+# ==== Worker ====
+def _lower_priority():
+    if hasattr(os, 'nice'):
+        os.nice(NICE)
+
+def _atomic_write(path:str, write):
+    temporary = f"{path}.{os.getpid()}.part"
+    write(temporary)
+    os.replace(temporary, path)
+
+def _save(rgba:np.ndarray, path:str, image_format:str, quality:int):
+    """
+    Writes an RGBA array as png, webp or jpeg (jpeg on a white background)
+    """
+    if image_format == 'png' or pymol_png.Image is None:
+        data = pymol_png.encode_png(rgba, level=9, adaptive=True)
+        _atomic_write(path, lambda temporary: open(temporary, 'wb').write(data))
+        return
+    image = pymol_png.Image.fromarray(rgba, 'RGBA')
+    if image_format == 'jpeg':
+        background = pymol_png.Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        _atomic_write(path, lambda temporary: background.save(temporary, 'JPEG', quality=quality, optimize=True))
+    else:
+        _atomic_write(path, lambda temporary: image.save(temporary, 'WEBP', quality=quality, lossless=LOSSLESS_WEBP, method=6))
+
+def output_format(image_format:str):
+    """
+    Returns: (format, extension) actually used, png when Pillow is missing for webp/jpeg
+    """
+    image_format = image_format.lower().replace('jpg', 'jpeg')
+    if image_format not in ('png', 'webp', 'jpeg'):
+        raise ValueError(f"Unknown image format {image_format}, choose from png, webp or jpeg")
+    if image_format != 'png' and pymol_png.Image is None:
+        return 'png', '.png'
+    return image_format, {'png': '.png', 'webp': '.webp', 'jpeg': '.jpg'}[image_format]
+
+def process_image(path:str, root:str, image_format:str=FORMAT, quality:int=QUALITY,
+                  thumbnail_size:int=THUMBNAIL_SIZE, keep_originals:bool=KEEP_ORIGINALS):
+    """
+    Runs in a worker. Re-encodes one image and writes its thumbnail.
+    Returns: dictionary of the source, image and thumbnail paths (relative to root), sizes and seconds
+    """
+    start = time.perf_counter()
+    image_format, extension = output_format(image_format)
+    rgba = pymol_png.read_png(path)
+    before = os.path.getsize(path)
+    relative = os.path.relpath(path, root)
+    stem = os.path.splitext(path)[0]
+
+    if image_format == 'png':
+        #Lossless: only replace the render when the optimised file is smaller
+        data = pymol_png.encode_png(rgba, level=9, adaptive=True)
+        if len(data) < before:
+            _atomic_write(path, lambda temporary: open(temporary, 'wb').write(data))
+        output = path
+    else:
+        output = stem + extension
+        _save(rgba, output, image_format, int(quality))
+        if not keep_originals:
+            os.remove(path)
+
+    thumbnail = os.path.join(root, THUMBNAIL_DIRECTORY, os.path.splitext(relative)[0] + extension)
+    os.makedirs(os.path.dirname(thumbnail), exist_ok=True)
+    small = pymol_png.downscale(rgba, int(thumbnail_size))
+    if pymol_png.Image is not None:
+        #Pillow resamples better than the block average
+        image = pymol_png.Image.fromarray(rgba, 'RGBA')
+        image.thumbnail((int(thumbnail_size), int(thumbnail_size)), pymol_png.Image.LANCZOS)
+        small = np.asarray(image)
+    _save(small, thumbnail, image_format, int(quality))
+    return {'source': relative, 'image': os.path.relpath(output, root), 'thumbnail': os.path.relpath(thumbnail, root),
+            'width': int(rgba.shape[1]), 'height': int(rgba.shape[0]),
+            'bytes_before': before, 'bytes_after': os.path.getsize(output), 'seconds': time.perf_counter() - start}
+
+# ==== Pool ====
+def get_pool(workers:int=WORKERS):
+    """
+    Returns: the post-processing process pool, reused between calls
+    """
+    if _POOL['pool'] is None or _POOL['workers'] < workers:
+        if _POOL['pool'] is not None:
+            _POOL['pool'].shutdown(wait=False)
+        context = multiprocessing.get_context('spawn')
+        _POOL['pool'] = ProcessPoolExecutor(max_workers=max(1, int(workers)), mp_context=context,
+                                            initializer=_lower_priority)
+        _POOL['workers'] = workers
+    return _POOL['pool']
+
+def submit_images(paths:list, root:str, workers:int=WORKERS, **options):
+    """
+    Inputs: Image paths, the output directory they are under, workers and process_image options
+    Queues the images and returns at once.
+    Returns: list of futures of process_image results
+    """
+    requested = options.get('image_format', FORMAT)
+    if output_format(requested)[0] != requested.lower().replace('jpg', 'jpeg'):
+        print(f"Pillow is not installed, optimising PNGs instead of writing {requested}", flush=True)
+    pool = get_pool(workers)
+    root = os.path.abspath(os.path.expanduser(root))
+    return [pool.submit(process_image, os.path.abspath(path), root, **options)
+            for path in paths if os.path.exists(path) and path.lower().endswith('.png')]
+
+def collect(futures:list):
+    """
+    Waits for the submitted images
+    Returns: list of the process_image results (failures are printed and left out)
+    """
+    records = []
+    for future in futures:
+        try:
+            records.append(future.result())
+        except Exception as error:
+            print(f"Post-processing failed: {type(error).__name__}: {error}", flush=True)
+    return records
+
+# ==== Contact sheet and gallery ====
+def contact_sheet(root:str, records:list, columns:int=COLUMNS, thumbnail_size:int=THUMBNAIL_SIZE):
+    """
+    Inputs: Output directory, process_image results, columns and thumbnail size
+    Pastes the thumbnails on a white grid (labelled when Pillow is installed).
+    Returns: path of the contact sheet
+    """
+    cell, padding, label = int(thumbnail_size), 8, 16 if pymol_png.Image is not None else 0
+    columns = max(1, min(int(columns), len(records)))
+    rows = -(-len(records) // columns)
+    sheet = np.full((rows * (cell + padding + label) + padding, columns * (cell + padding) + padding, 4), 255, dtype=np.uint8)
+    for index, record in enumerate(records):
+        thumbnail = pymol_png.read_png(os.path.join(root, record['thumbnail'])) if record['thumbnail'].endswith('.png') \
+            else np.asarray(pymol_png.Image.open(os.path.join(root, record['thumbnail'])).convert('RGBA'))
+        height, width = thumbnail.shape[:2]
+        top = padding + (index // columns) * (cell + padding + label) + (cell - height) // 2
+        left = padding + (index % columns) * (cell + padding) + (cell - width) // 2
+        alpha = thumbnail[..., 3:4].astype(np.float32) / 255.0
+        region = sheet[top:top + height, left:left + width, :3].astype(np.float32)
+        sheet[top:top + height, left:left + width, :3] = np.rint(thumbnail[..., :3] * alpha + region * (1 - alpha)).astype(np.uint8)
+
+    path = os.path.join(root, CONTACT_SHEET_NAME)
+    if label:
+        from PIL import ImageDraw
+        image = pymol_png.Image.fromarray(sheet, 'RGBA')
+        draw = ImageDraw.Draw(image)
+        for index, record in enumerate(records):
+            x = padding + (index % columns) * (cell + padding)
+            y = padding + (index // columns) * (cell + padding + label) + cell + 2
+            draw.text((x, y), record['source'][-40:], fill=(0, 0, 0, 255))
+        sheet = np.asarray(image)
+    _atomic_write(path, lambda temporary: open(temporary, 'wb').write(pymol_png.encode_png(sheet, level=9, adaptive=True)))
+    return path
+
+def gallery(root:str, records:list, report:dict=None):
+    """
+    Inputs: Output directory, process_image results and the batch report (optional)
+    Writes a static HTML page of the thumbnails grouped by directory, linking to the images.
+    Returns: path of the page
+    """
+    results = {result['name']: result for result in (report or {}).get('results', [])}
+    groups = {}
+    for record in sorted(records, key=lambda record: record['source']):
+        groups.setdefault(os.path.dirname(record['source']) or '.', []).append(record)
+
+    sections = []
+    for group, items in groups.items():
+        result = results.get(group.split(os.sep)[0])
+        details = ''
+        if result:
+            details = f" &middot; {result['seconds']:.1f} s" + (f" &middot; RMSD {result['rmsd']:.2f}" if 'rmsd' in result else '')
+        cards = ''.join(
+            f'<figure><a href="{html.escape(item["image"])}"><img loading="lazy" src="{html.escape(item["thumbnail"])}"></a>'
+            f'<figcaption>{html.escape(os.path.basename(item["image"]))}<br>{item["width"]}x{item["height"]}, '
+            f'{item["bytes_after"] / 1e6:.2f} MB</figcaption></figure>' for item in items)
+        sections.append(f'<h2>{html.escape(group)}{details}</h2><div class="grid">{cards}</div>')
+
+    title = html.escape(os.path.basename(root.rstrip(os.sep)) or root)
+    page = (f'<!DOCTYPE html><html><head><meta charset="utf-8"><title>{title}</title><style>'
+            'body{font-family:sans-serif;margin:2em}.grid{display:flex;flex-wrap:wrap;gap:1em}'
+            'figure{margin:0;width:' + str(THUMBNAIL_SIZE) + 'px}img{max-width:100%;background:#eee}'
+            'figcaption{font-size:12px;color:#444}</style></head><body>'
+            f'<h1>{title}</h1><p>{len(records)} images &middot; <a href="{CONTACT_SHEET_NAME}">contact sheet</a></p>'
+            + ''.join(sections) + '</body></html>')
+    path = os.path.join(root, GALLERY_NAME)
+    with open(path, 'w') as handle:
+        handle.write(page)
+    return path
+
+def finish_gallery(root:str, futures:list, report:dict=None):
+    """
+    Inputs: Output directory, the futures from submit_images and the batch report (optional)
+    Waits for the images, then writes the contact sheet and the HTML gallery.
+    Returns: summary dictionary (images, bytes before and after, contact sheet, gallery)
+    """
+    root = os.path.abspath(os.path.expanduser(root))
+    records = collect(futures)
+    if not records:
+        return {'images': 0}
+    summary = {'images': len(records), 'bytes_before': sum(record['bytes_before'] for record in records),
+               'bytes_after': sum(record['bytes_after'] for record in records),
+               'contact_sheet': contact_sheet(root, records), 'gallery': gallery(root, records, report)}
+    print(f"Post-processed {summary['images']} images: {summary['bytes_before'] / 1e6:.1f} MB -> "
+          f"{summary['bytes_after'] / 1e6:.1f} MB, gallery saved as {summary['gallery']}", flush=True)
+    return summary
+
+def find_images(root:str):
+    """
+    Returns: the rendered PNGs under root, without the thumbnails and contact sheet
+    """
+    images = []
+    for directory, directories, names in os.walk(root):
+        directories[:] = [name for name in directories if name != THUMBNAIL_DIRECTORY]
+        images += [os.path.join(directory, name) for name in sorted(names)
+                   if name.lower().endswith('.png') and name != CONTACT_SHEET_NAME]
+    return images
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="Re-encode rendered images, make thumbnails, a contact sheet and an HTML gallery")
+    parser.add_argument('directory', help="Output directory of a batch (or any directory of PNGs)")
+    parser.add_argument('--format', default=FORMAT, choices=('png', 'webp', 'jpeg'))
+    parser.add_argument('--quality', type=int, default=QUALITY)
+    parser.add_argument('--thumbnail-size', type=int, default=THUMBNAIL_SIZE)
+    parser.add_argument('--workers', type=int, default=WORKERS)
+    parser.add_argument('--drop-originals', action='store_true', help="Remove the PNGs after a webp/jpeg copy is made")
+    options = parser.parse_args()
+    root = os.path.abspath(os.path.expanduser(options.directory))
+    report_path = os.path.join(root, 'batch_report.json')
+    report = json.load(open(report_path)) if os.path.exists(report_path) else None
+    futures = submit_images(find_images(root), root, options.workers, image_format=options.format,
+                            quality=options.quality, thumbnail_size=options.thumbnail_size,
+                            keep_originals=not options.drop_originals)
+    summary = finish_gallery(root, futures, report)
+    sys.exit(0 if summary['images'] else 1)
@@ -0,0 +1,116 @@
+from pymol import cmd
+import hashlib
+import os
+import shutil
+
+import pymol_disk_cache
+
+"""
+Content addressed cache for ray traced images.
+The key is a hash of everything that changes the picture: the coordinates,
+representations, colors and labels of the enabled objects, the view, the
+render settings, the image size and the PyMOL version. An unchanged layer is
+copied from the cache instead of being ray traced again.
+The cache directory is kept under MAX_CACHE_BYTES by evicting the least
+recently used images.
+"""
+
+CACHE_DIRECTORY = os.path.join(os.path.expanduser("~"), '.cache', 'pymol_render_cache')
+MAX_CACHE_BYTES = 2 * 1024**3 #2 GB
+
+#Global settings that change a ray traced image
+RENDER_SETTINGS = (
+    'ray_trace_mode', 'ray_trace_gain', 'ray_trace_slope_factor', 'ray_trace_color',
+    'ray_trace_fog', 'ray_shadows', 'ray_opaque_background', 'ray_transparency_contrast',
+    'antialias', 'bg_rgb', 'fog', 'fog_start', 'depth_cue', 'ambient', 'direct', 'reflect',
+    'specular', 'shininess', 'light_count', 'two_sided_lighting', 'orthoscopic', 'field_of_view',
+    'transparency', 'cartoon_transparency', 'sphere_transparency', 'stick_transparency',
+    'cartoon_fancy_helices', 'cartoon_side_chain_helper', 'cartoon_gap_cutoff', 'cartoon_trace_atoms',
+    'stick_radius', 'stick_ball', 'stick_ball_ratio', 'sphere_scale', 'valence',
+    'surface_quality', 'label_font_id', 'label_size', 'label_color',
+)
+#Settings that can also be set on an object
+OBJECT_SETTINGS = ('cartoon_color', 'cartoon_transparency', 'transparency', 'sphere_transparency', 'stick_transparency')
+
+CACHE_STATS = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+def render_key(width:int, height:int, dpi:float, ray:int):
+    """
+    Inputs: Image width, height, dpi and ray flag as passed to cmd.png
+    Returns: sha256 hex digest of the current scene and render settings
+    """
+    digest = hashlib.sha256()
+    def add(label, value):
+        digest.update(f"{label}={value}\n".encode())
+
+    state = cmd.get_state()
+    add('version', cmd.get_version()[0])
+    add('image', (int(width), int(height), float(dpi), int(ray), state))
+    add('view', tuple(round(value, 4) for value in cmd.get_view()))
+    for setting in RENDER_SETTINGS:
+        add(setting, cmd.get(setting))
+
+    colors = set()
+    for name in sorted(cmd.get_names('public_objects', enabled_only=1)):
+        add('object', name)
+        coords = cmd.get_coords(name, state)
+        if coords is not None:
+            digest.update(coords.tobytes())
+        space = {'atoms': []}
+        cmd.iterate(name, "atoms.append((reps, color, label, s.cartoon_color))", space=space)
+        add('atoms', space['atoms'])
+        colors.update(atom[1] for atom in space['atoms'])
+        for setting in OBJECT_SETTINGS:
+            add(setting, cmd.get(setting, name))
+    #Custom colors (set_color) can be redefined without changing the color index
+    for color in sorted(colors):
+        add('color', (color, cmd.get_color_tuple(color)))
+    return digest.hexdigest()
+
+def cached_png(filename:str, width:int=0, height:int=0, dpi:float=-1.0, ray:int=0):
+    """
+    Inputs: Same as cmd.png
+    Copies the image from the cache when the scene is unchanged, otherwise
+    renders it with cmd.png and stores it in the cache.
+    Returns: the path of the saved image
+    """
+    if not filename.endswith('.png'):
+        filename += '.png'
+    cached = os.path.join(CACHE_DIRECTORY, render_key(width, height, dpi, ray) + '.png')
+
+    if pymol_disk_cache.touch(cached):
+        try:
+            shutil.copyfile(cached, filename)
+            CACHE_STATS['hits'] += 1
+            print(f"Render cache hit: {filename}", flush=True)
+            return filename
+        except FileNotFoundError: #Evicted by another worker in the meantime
+            pass
+
+    CACHE_STATS['misses'] += 1
+    cmd.png(filename, width=width, height=height, dpi=dpi, ray=ray)
+    if os.path.exists(filename):
+        #The layer workers share the cache, so an entry only appears once it is complete
+        pymol_disk_cache.write_atomic(cached, source=filename)
+        CACHE_STATS['evictions'] += pymol_disk_cache.evict(CACHE_DIRECTORY, '.png', MAX_CACHE_BYTES)
+    return filename
+
+def render_cache_stats():
+    """
+    Prints and returns the hit/miss counts and the size of the render cache
+    """
+    images, size = pymol_disk_cache.usage(CACHE_DIRECTORY, '.png')
+    lookups = CACHE_STATS['hits'] + CACHE_STATS['misses']
+    hit_rate = 100.0 * CACHE_STATS['hits'] / lookups if lookups else 0.0
+    print(f"Render cache: {CACHE_STATS['hits']} hits, {CACHE_STATS['misses']} misses ({hit_rate:.0f}% hit rate), \
+          \n {CACHE_STATS['evictions']} evictions, {images} images, {size / 1024**2:.1f} of {MAX_CACHE_BYTES / 1024**2:.0f} MB \
+          \n in {CACHE_DIRECTORY}", flush=True)
+    return dict(CACHE_STATS, images=images, bytes=size)
+
+def clear_render_cache():
+    pymol_disk_cache.clear(CACHE_DIRECTORY)
+    CACHE_STATS.update(hits=0, misses=0, evictions=0)
+    print("Render cache cleared", flush=True)
+
+cmd.extend("render_cache_stats", render_cache_stats)
+cmd.extend("clear_render_cache", clear_render_cache)
@@ -0,0 +1,121 @@
+from pymol import cmd
+import math
+import time
+import numpy as np
+
+"""
+Fast residue extraction for selections.
+cmd.get_model builds a chempy Atom for every atom just to read the residue
+numbers. get_residue_index only visits one atom per residue (the CA, plus
+every atom of residues without one) in a single iterate call, and returns a
+compact NumPy array of (object, chain, resi, icode) that keeps insertion
+codes and chains apart.
+"""
+
+RESIDUE_FIELDS = ('object', 'chain', 'resi', 'icode')
+
+def residue_array(rows):
+    """
+    Input: List of (object, chain, resi, icode) tuples
+    Returns: sorted residue array, string fields wide enough that no object name is cut
+    """
+    rows = sorted(rows)
+    width = lambda field: max([len(row[field]) for row in rows] + [1])
+    dtype = np.dtype([('object', f'U{width(0)}'), ('chain', f'U{width(1)}'), ('resi', 'i8'), ('icode', f'U{width(3)}')])
+    return np.array(rows, dtype=dtype)
+
+def is_residue_array(residues):
+    return isinstance(residues, np.ndarray) and residues.dtype.names == RESIDUE_FIELDS
+
+def get_residue_index(selection:str='sele'):
+    """
+    Input: Selection as a string
+    Returns: sorted structured array of the unique residues in the selection
+    with the fields object, chain, resi (number) and icode (insertion code)
+    """
+    #One atom per amino acid, all atoms of residues without a CA (ligands, nucleic acids...)
+    sampled = f"(bca. ({selection})) or (({selection}) and not byres (bca. ({selection})))"
+    space = {'residues': set()}
+    cmd.iterate(sampled, "residues.add((model, chain, resv, resi))", space=space)
+    rows = [(model, chain, resv, resi.lstrip('-').lstrip('0123456789'))
+            for model, chain, resv, resi in space['residues']]
+    return residue_array(rows)
+
+def as_residue_index(residues):
+    """
+    Input: Residue array, or a plain list of residue numbers/strings (e.g. [195, '52A'])
+    Returns: residue array, plain numbers get an empty object and chain
+    """
+    if is_residue_array(residues):
+        return residues
+    rows = set()
+    for residue in residues:
+        residue = str(residue).strip()
+        icode = residue.lstrip('-').lstrip('0123456789')
+        rows.add(('', '', int(residue[:len(residue) - len(icode)]), icode))
+    return residue_array(rows)
+
+def get_model_residues(selection:str='sele'):
+    """
+    The original get_model based extraction, kept as the benchmark reference
+    (without the int cast, so insertion codes don't crash it)
+    """
+    model = cmd.get_model(selection)
+    residue_set = set()
+    for atom in model.atom:
+        residue_set.add((atom.chain, atom.resi))
+    return sorted(residue_set)
+
+def _scaled_copy(selection:str, min_atoms:int, name:str='_residue_benchmark'):
+    """
+    Creates an object with copies of the selection (new chain per copy) until it
+    holds at least min_atoms atoms
+    Returns: the object name
+    """
+    copies = max(1, math.ceil(min_atoms / max(1, cmd.count_atoms(selection))))
+    parts = []
+    for copy in range(copies):
+        part = f"{name}_{copy}"
+        cmd.create(part, selection)
+        cmd.alter(part, f"chain = chain + '{copy}'")
+        parts.append(part)
+    cmd.create(name, " or ".join(parts))
+    for part in parts:
+        cmd.delete(part)
+    return name
+
+def benchmark_residue_index(selection:str='all', min_atoms:int=100000, repeats:int=3):
+    """
+    Input: Selection, minimum atom count and number of repeats
+    Times get_model against get_residue_index. If the selection is smaller than
+    min_atoms, a temporary scaled copy of it is used.
+    e.g. benchmark_residue_index 1EMA, 100000
+    Returns: dictionary of the best timings in seconds and the speedup
+    """
+    min_atoms, repeats = int(min_atoms), int(repeats)
+    scaled = None
+    if cmd.count_atoms(selection) < min_atoms:
+        scaled = _scaled_copy(selection, min_atoms)
+        selection = scaled
+    atoms = cmd.count_atoms(selection)
+
+    timings = {}
+    for label, function in (('get_model', get_model_residues), ('get_residue_index', get_residue_index)):
+        best = float('inf')
+        for repeat in range(repeats):
+            start = time.perf_counter()
+            function(selection)
+            best = min(best, time.perf_counter() - start)
+        timings[label] = best
+    timings['speedup'] = timings['get_model'] / timings['get_residue_index'] if timings['get_residue_index'] else float('inf')
+
+    if scaled:
+        cmd.delete(scaled)
+    print(f"Residue extraction on {atoms} atoms (best of {repeats}) \
+          \n get_model:         {timings['get_model']:.3f} s \
+          \n get_residue_index: {timings['get_residue_index']:.3f} s \
+          \n speedup:           {timings['speedup']:.1f}x", flush=True)
+    return timings
+
+cmd.extend("get_residue_index", get_residue_index)
+cmd.extend("benchmark_residue_index", benchmark_residue_index)
@@ -0,0 +1,216 @@
+from pymol import cmd
+
+import pymol_neighbours
+
+"""
+Scene diffing for the lesson 3 figures.
+Instead of hide everything -> show -> color, a figure gives its target scene:
+the representations each selection should show (everything else is hidden),
+colors and objects to enable. apply_scene reads the current representations
+and color of every atom (iterate reps, color), and only shows, hides or
+colors the atoms that differ, so unchanged cartoons and sticks are not rebuilt.
+Only the objects in the target scene are read, atoms of other objects in
+scope are hidden with one hide call. Above DIFF_MAX_ATOMS atoms the per atom
+diff costs more than it saves, so the scene is applied with hide everything
+-> show -> color (a fixed number of C calls) instead.
+ensure_object reuses a copy made by an earlier run instead of creating another.
+snapshot_scene/restore_scene store and recall the scene (cmd.scene) around
+render_figures, so repeated runs start from, and return to, the same scene.
+Only atoms are diffed, other objects (measurements, maps...) are left as they are.
+"""
+
+#Representation -> bit in the reps value of iterate
+REPRESENTATIONS = {'sticks': 0, 'spheres': 1, 'surface': 2, 'labels': 3, 'nb_spheres': 4, 'cartoon': 5,
+                   'ribbon': 6, 'lines': 7, 'mesh': 8, 'dots': 9, 'nonbonded': 11}
+SNAPSHOT_PREFIX = 'figure_snapshot_'
+DIFF_MAX_ATOMS = 50000 #Larger scenes are applied with hide everything + show
+
+SCENE_STATS = {'operations': 0, 'atoms_changed': 0, 'objects_reused': 0, 'objects_created': 0}
+_CREATED = {} #Object name -> (source selection, atom count, atom state after creation)
+
+def atom_state(selection:str='all'):
+    """
+    Returns: dictionary of (object, index) -> [reps, color] for the atoms of the selection
+    """
+    state = {}
+    cmd.iterate(selection, 'state[(model, index)] = [reps, color]', space={'state': state})
+    return state
+
+def atom_keys(selection:str):
+    """
+    Returns: list of (object, index) for the atoms of the selection
+    """
+    keys = []
+    cmd.iterate(selection, 'keys.append((model, index))', space={'keys': keys})
+    return keys
+
+def atoms_selection(keys:list):
+    """
+    Input: List of (object, index)
+    Returns: selection string of the atoms, with the indices of every object in ranges
+    """
+    indices = {}
+    for name, index in keys:
+        indices.setdefault(name, []).append(index)
+    return ' or '.join(f"({pymol_neighbours.index_selection(name, object_indices)})"
+                       for name, object_indices in indices.items())
+
+def representation_mask(representations):
+    if isinstance(representations, str):
+        representations = representations.split()
+    mask = 0
+    for name in representations:
+        mask |= 1 << REPRESENTATIONS[name]
+    return mask
+
+def apply_atom_state(target:dict, current:dict):
+    """
+    Inputs: Target and current dictionaries of (object, index) -> [reps, color]
+    Shows, hides and colors only the atoms whose state differs.
+    Returns: number of PyMOL operations
+    """
+    operations = 0
+    for name, bit in REPRESENTATIONS.items():
+        flag = 1 << bit
+        show = [key for key, (reps, color) in current.items() if not reps & flag and target[key][0] & flag]
+        hide = [key for key, (reps, color) in current.items() if reps & flag and not target[key][0] & flag]
+        if show:
+            cmd.show(name, atoms_selection(show))
+        if hide:
+            cmd.hide(name, atoms_selection(hide))
+        operations += bool(show) + bool(hide)
+        SCENE_STATS['atoms_changed'] += len(show) + len(hide)
+
+    colors = {}
+    for key, (reps, color) in current.items():
+        if target[key][1] is not None and target[key][1] != color:
+            colors.setdefault(target[key][1], []).append(key)
+    for color, keys in colors.items():
+        cmd.color(color, atoms_selection(keys))
+        SCENE_STATS['atoms_changed'] += len(keys)
+    operations += len(colors)
+    SCENE_STATS['operations'] += operations
+    return operations
+
+def scene_objects(selections:list):
+    """
+    Input: List of selections
+    Returns: sorted list of the objects the selections touch
+    """
+    names = set()
+    for selection in selections:
+        names.update(cmd.get_object_list(f"({selection})") or [])
+    return sorted(names)
+
+def apply_scene(representations:list, colors:list=(), enable:list=(), scope:str='all'):
+    """
+    Inputs: list of (selection, representations) to show, everything else in
+    scope is hidden; list of (selection, color), later entries win; objects to enable
+    Returns: number of PyMOL operations needed to reach the scene
+    """
+    existing = set(cmd.get_names('objects'))
+    objects = scene_objects([selection for selection, _ in list(representations) + list(colors)] +
+                            [name for name in enable if name in existing])
+    operations = 0
+    others = f"({scope}) and not ({' or '.join(objects)})" if objects else f"({scope})"
+    if cmd.count_atoms(others):
+        cmd.hide('everything', others)
+        operations += 1
+    if objects:
+        scope = f"({scope}) and ({' or '.join(objects)})"
+        if cmd.count_atoms(scope) > DIFF_MAX_ATOMS:
+            operations += apply_scene_directly(representations, colors, scope)
+        else:
+            operations += apply_scene_diff(representations, colors, scope)
+
+    enabled = set(cmd.get_names('objects', enabled_only=1))
+    for name in enable:
+        if name in existing and name not in enabled:
+            cmd.enable(name)
+            operations += 1
+    return operations
+
+def apply_scene_diff(representations:list, colors:list, scope:str):
+    """
+    Shows, hides and colors only the atoms in scope that differ from the scene
+    Returns: number of PyMOL operations
+    """
+    current = atom_state(scope)
+    target = {key: [0, color] for key, (reps, color) in current.items()}
+    for selection, names in representations:
+        mask = representation_mask(names)
+        for key in atom_keys(f"({scope}) and ({selection})"):
+            target[key][0] |= mask
+    for selection, color in colors:
+        index = cmd.get_color_index(color)
+        for key in atom_keys(f"({scope}) and ({selection})"):
+            target[key][1] = index
+    return apply_atom_state(target, current)
+
+def apply_scene_directly(representations:list, colors:list, scope:str):
+    """
+    Hides everything in scope, then shows and colors the scene
+    Returns: number of PyMOL operations
+    """
+    cmd.hide('everything', scope)
+    operations = 1
+    for selection, names in representations:
+        for name in (names.split() if isinstance(names, str) else names):
+            cmd.show(name, f"({scope}) and ({selection})")
+            operations += 1
+    for selection, color in colors:
+        cmd.color(color, f"({scope}) and ({selection})")
+        operations += 1
+    SCENE_STATS['operations'] += operations
+    return operations
+
+def ensure_object(name:str, selection:str):
+    """
+    Inputs: Object name and the selection to copy
+    Creates the object, or reuses it when an earlier call copied the same
+    selection (only its representations and colors are reset to the copy's).
+    Returns: the object name
+    """
+    source_atoms = cmd.count_atoms(selection)
+    created = _CREATED.get(name)
+    if created and created[:2] == (selection, source_atoms) and name in cmd.get_names('objects') \
+            and cmd.count_atoms(name) == source_atoms:
+        current = atom_state(name)
+        if set(current) == set(created[2]):
+            apply_atom_state(created[2], current)
+            SCENE_STATS['objects_reused'] += 1
+            return name
+
+    cmd.delete(name)
+    cmd.create(name, selection)
+    _CREATED[name] = (selection, source_atoms, atom_state(name))
+    SCENE_STATS['objects_created'] += 1
+    return name
+
+def snapshot_scene(key:str):
+    """
+    Input: Name of the snapshot
+    Stores the view, representations, colors and enabled objects (cmd.scene)
+    Returns: scene name
+    """
+    scene = f"{SNAPSHOT_PREFIX}{key}"
+    cmd.scene(scene, 'store')
+    return scene
+
+def restore_scene(scene:str):
+    """
+    Input: Scene name from snapshot_scene
+    Recalls the scene and deletes it
+    """
+    cmd.scene(scene, 'recall', animate=0)
+    cmd.scene(scene, 'delete')
+
+def scene_stats():
+    """
+    Prints and returns the operations applied and the objects reused
+    """
+    print(f"Scene: {SCENE_STATS['operations']} show/hide/color operations on {SCENE_STATS['atoms_changed']} atoms, "
+          f"{SCENE_STATS['objects_reused']} objects reused, {SCENE_STATS['objects_created']} created", flush=True)
+    return dict(SCENE_STATS)
+
+cmd.extend("scene_stats", scene_stats)
@@ -1,60 +1,78 @@
 from pymol import cmd
 import os
 import sys
+import time
+
+#Make the course helper modules next to this script importable
+SCRIPT_DIR = os.path.dirname(os.path.abspath(globals().get('__script__') or __file__))
+if SCRIPT_DIR not in sys.path:
+    sys.path.insert(0, SCRIPT_DIR)
+import pymol_residues
+import pymol_settings_profiles
+import pymol_selections
 
 #https://pymol.org/dokuwiki/doku.php?id=setting:ray
 def ray_trace():
+    #Black and white, no shadows or fog, dark outline (the outline profile in pymol_settings_profiles.py)
+    pymol_settings_profiles.apply_profile('outline')
 
-    cmd.set('ray_trace_mode', 2) #Black and white
-    cmd.set('ray_shadows', 0) #Remove shadows
-    cmd.set('fog', 0) #Remove fog
-    cmd.set('ray_trace_gain', 20) #Create a dark outline
-    cmd.set('ray_trace_slope_factor', 5) #Remove some shadow constrast
+#Image size and anti-aliasing for quality('draft') and quality('final')
+QUALITY_PROFILES = {
+    'draft': {'antialias': 0, 'width': 400, 'height': 300},
+    'final': {'antialias': 4, 'width': 800, 'height': 600},
+}
+IMAGE_SIZE = {'width': 800, 'height': 600}
 
-def quality(anti_alias: int=4):
-    cmd.set('antialias', anti_alias)#Set the anti-aliasing level to highest available
+def quality(anti_alias=4):
+    """
+    Arguments: Anti-aliasing level, or a profile name from QUALITY_PROFILES
+    (draft or final), which also sets the image size of protein_figure
+    """
+    if str(anti_alias) in QUALITY_PROFILES:
+        profile = QUALITY_PROFILES[str(anti_alias)]
+        IMAGE_SIZE.update(width=profile['width'], height=profile['height'])
+        anti_alias = profile['antialias']
+    pymol_settings_profiles.apply_settings({'antialias': anti_alias})#Set the anti-aliasing level to highest available
 
 def protein_figure(protein:str, resi_list:list):
     """
-    Arguments: Protein object and list of selected residues
+    Arguments: Protein object and selected residues (residue array or
+    list of residue numbers)
 
     """
-    residue_string = "+".join(sorted(str(r) for r in resi_list))
-    min_resi = max(1, resi_list[0]-2)
-    max_resi = resi_list[-1] + 2
-
-    padded_resi = list(range(min_resi, max_resi + 1))
-    expanded_residue_string = "+".join(sorted(str(r) for r in padded_resi))
+    #Chain qualified residue ranges, padded by 2 residues around every run (see pymol_selections.py)
+    residues = pymol_residues.as_residue_index(resi_list)
+    residue_expression = pymol_selections.residue_expression(residues)
+    padded_expression = pymol_selections.residue_expression(residues, padding=2)
     
     cmd.hide('everything')
-    cmd.show('cartoon', f'{protein} and not resi {residue_string}')
-    cmd.create('hide', f'{protein} and resi {expanded_residue_string}')
-    cmd.set('ray_opaque_background', 1)
-    cmd.set('bg_rgb', [1,1,1])
-    cmd.png(f'{protein}_4', width=800, height=600, dpi=300, ray=1)
+    cmd.show('cartoon', f'{protein} and not ({residue_expression})')
+    cmd.create('hide', f'{protein} and ({padded_expression})')
+    pymol_settings_profiles.apply_settings({'ray_opaque_background': 1, 'bg_rgb': [1,1,1]})
+    start = time.perf_counter()
+    cmd.png(f'{protein}_4', width=IMAGE_SIZE['width'], height=IMAGE_SIZE['height'], dpi=300, ray=1)
+    print(f"Rendered {protein}_4 at {IMAGE_SIZE['width']}x{IMAGE_SIZE['height']} in {time.perf_counter() - start:.1f} s")
 
 def get_selection_residues(protein:str, selection_name:str):
     """
     Expands the selection to hide and creates an object that overlaps
+    Returns: residue array (object, chain, resi, icode) of the selection
     """
-    selection = cmd.get_model(selection_name)
-    residue_set = set()
-    for atom in selection.atom:
-        residue_set.add(int(atom.resi))
-    resi_list = sorted(residue_set)
+    resi_list = pymol_residues.get_residue_index(selection_name)
     
-    print(f"resi {resi_list}")
+    print(pymol_selections.residue_expression(resi_list))
     
     return resi_list
 
 def select_objects(protein:str, active_site:list):
     """
     Checks that the objects can be found in Pymol. 
+    Named selections count as objects (selection backed load hook).
     Exits if criteria are not met.
     Input: Protein string and active_site list
     Returns: Protein string and active site list
     """
-    objects = cmd.get_object_list()
+    objects = cmd.get_names('all')
     
     #check active site objects
     if set(active_site).issubset(objects):
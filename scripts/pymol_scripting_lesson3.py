@@ -1,6 +1,23 @@
 from pymol import cmd, util
+import json
 import os
 import sys
+import time
+
+#Make the course helper modules next to this script importable
+SCRIPT_DIR = os.path.dirname(os.path.abspath(globals().get('__script__') or __file__))
+if SCRIPT_DIR not in sys.path:
+    sys.path.insert(0, SCRIPT_DIR)
+import pymol_residues
+import pymol_render_cache
+import pymol_parallel_layers
+import pymol_draft
+import pymol_settings_profiles
+import pymol_scene
+import pymol_selections
+import pymol_views
+import pymol_composite
+import pymol_ligands
 
 """
 Global settings. These can go in setting file
@@ -15,6 +32,19 @@ WIDTH = 800
 HEIGHT = 600
 DPI = 300
 ANTIALIAS = 4
+#Serve unchanged layers from the render cache (see pymol_render_cache.py)
+RENDER_CACHE = True
+#Render the layers in separate worker processes when > 1 (see pymol_parallel_layers.py)
+RENDER_WORKERS = 1
+#Image settings for set_render_profile. Draft renders can be refined with accept_layers (see pymol_draft.py)
+RENDER_PROFILES = {
+    'draft': {'WIDTH': WIDTH // 2, 'HEIGHT': HEIGHT // 2, 'DPI': 72, 'ANTIALIAS': 0},
+    'preview': {'WIDTH': WIDTH, 'HEIGHT': HEIGHT, 'DPI': 150, 'ANTIALIAS': 1},
+    'final': {'WIDTH': WIDTH, 'HEIGHT': HEIGHT, 'DPI': DPI, 'ANTIALIAS': ANTIALIAS},
+}
+RENDER_PROFILE = 'final'
+#Blend the layers into {protein}_merged.png after rendering (see pymol_composite.py for the order)
+MERGE_LAYERS = True
 #Immediately get the current view for picture taking
 CURRENT_VIEW = cmd.get_view()
 
@@ -23,50 +53,91 @@ LIGAND_COLOR = 'limegreen'
 TRANSPARENT_OBJECT_COLOR = 'white'
 TRANSPARENT_OBJECT_TRANSPARENCY = 0.5
 SELECTION_NAME = 'sele'
+#Ligand sweep: pocket cutoff in Angstrom and whether to orient on every ligand (see pymol_ligands.py)
+POCKET_CUTOFF = pymol_ligands.POCKET_CUTOFF
+ORIENT_LIGANDS = True
 
 def pymol_settings():
-    #Ray trace and appearence settings
-    cmd.set('ray_shadows', 0) #Remove shadows
-    cmd.set('fog', 0) #Remove fog
-    cmd.set('ray_trace_gain', 20) #Create a dark outline
-    cmd.set('ray_trace_slope_factor', 5) #Remove some shadow constrast
-    cmd.set('antialias', ANTIALIAS)#Set the anti-aliasing level to highest available
-
-def transparent_figure(protein:str, transparent_object:str, image_dir:str, pymol_view:str):
+    #Ray trace and appearence settings: no shadows or fog, dark outline (see pymol_settings_profiles.py)
+    pymol_settings_profiles.apply_profile('figure', antialias=ANTIALIAS)
+
+def set_render_profile(profile:str='final'):
+    """
+    Input: Name of a profile in RENDER_PROFILES (draft, preview or final)
+    Switches the image size and anti-aliasing used for the figures.
+    """
+    global RENDER_PROFILE
+    if profile not in RENDER_PROFILES:
+        print(f"Unknown render profile {profile}, choose from: {', '.join(RENDER_PROFILES)}")
+        return
+    globals().update(RENDER_PROFILES[profile])
+    RENDER_PROFILE = profile
+    pymol_settings_profiles.apply_settings({'antialias': ANTIALIAS})
+    print(f"Render profile set to {profile}: {WIDTH}x{HEIGHT}, dpi {DPI}, antialias {ANTIALIAS}")
+
+def save_png(image:str):
+    """
+    Input: Image path as a string
+    Saves a ray traced png of the current scene with the image settings.
+    Goes through the render cache when RENDER_CACHE is on, otherwise the
+    image is also kept in memory for the merged figure (see pymol_composite.py).
+    """
+    if RENDER_CACHE:
+        pymol_composite.forget_layer(image)
+        pymol_render_cache.cached_png(image, width=WIDTH, height=HEIGHT, dpi=DPI, ray=1)
+    else:
+        pymol_composite.render_png(image, width=WIDTH, height=HEIGHT, dpi=DPI, ray=1)
+
+def save_views(image:str, pymol_view, render:bool=True):
+    """
+    Inputs: Image path, a view or a dictionary of view name -> view, and whether to render
+    Sets the view and saves the image. With several views the scene is reused
+    for all of them and each image goes to a sub directory named after its view.
+    """
+    if not isinstance(pymol_view, dict):
+        cmd.set_view(pymol_view)
+        if render:
+            save_png(image)
+        return
+    for name, view in pymol_view.items():
+        cmd.set_view(view)
+        if render:
+            view_dir = os.path.join(os.path.dirname(image), name)
+            os.makedirs(view_dir, exist_ok=True)
+            save_png(os.path.join(view_dir, os.path.basename(image)))
+
+def transparent_figure(protein:str, transparent_object:str, image_dir:str, pymol_view:str, render:bool=True):
     """
     Inputs: Takes in the transparent objects, image dir as string and current/
     /n view as a string
     Saves the transparent figure and the outline of the transparent figure.
+    With render=False only the scene is set up, no images are saved.
     """
-    cmd.hide("everything")
-    cmd.enable(transparent_object)
-    cmd.set('ray_trace_mode', 0) #In case you change the order of calling the figures.
-    cmd.show('cartoon', transparent_object)
-    cmd.set('cartoon_transparency', TRANSPARENT_OBJECT_TRANSPARENCY)
-    cmd.color(TRANSPARENT_OBJECT_COLOR, transparent_object)
+    #ray_trace_mode 0 in case you change the order of calling the figures.
+    pymol_settings_profiles.apply_profile('transparent_layer', cartoon_transparency=TRANSPARENT_OBJECT_TRANSPARENCY)
+    #Only the transparent cartoon is shown, only what changed is applied (see pymol_scene.py)
+    pymol_scene.apply_scene([(transparent_object, 'cartoon')], colors=[(transparent_object, TRANSPARENT_OBJECT_COLOR)],
+                            enable=[transparent_object])
 
     image = os.path.join(image_dir, f'{protein}_1')
-    cmd.set_view(pymol_view)
-    cmd.png(image, width=WIDTH, height=HEIGHT, dpi=DPI, ray=1)
+    save_views(image, pymol_view, render)
     
     image2 = os.path.join(image_dir, f'{protein}_2')
-    cmd.set('cartoon_transparency', 0)
-    cmd.set('ray_trace_mode', 2) #We don't need to set transparency on ray_trace_mode, 2
-    cmd.set_view(pymol_view)
-    cmd.png(image2, width=WIDTH, height=HEIGHT, dpi=DPI, ray=1)
+    pymol_settings_profiles.apply_profile('outline_layer') #We don't need to set transparency on ray_trace_mode, 2
+    save_views(image2, pymol_view, render)
+    if render:
+        print(f"Images saved in: {image} \
+              \n{image2}")
 
-    print(f"Images saved in: {image} \
-          \n{image2}")
-
-def active_site_figure(protein:str, active_site:list, image_dir:str, pymol_view:str):
+def active_site_figure(protein:str, active_site:list, image_dir:str, pymol_view:str, render:bool=True):
     """
     Inputs: Active site as a string, image directory as a string, 
     and the current view as a string
     Saves a foreground active site image to the image directory
+    With render=False only the scene is set up, no image is saved.
     
     """
-    cmd.hide('everything')
-    cmd.set('ray_trace_mode', 0)
+    pymol_settings_profiles.apply_profile('active_site_layer')
 
     if len(active_site) > 2:
         print("You may choose at most, 2 active site objects \
@@ -74,53 +145,50 @@ def active_site_figure(protein:str, active_site:list, image_dir:str, pymol_view:
             \nThe second should be the active site residues")
         sys.exit()
     
-    elif len(active_site) == 2:
+    ligand = active_site[0]
+    representations, colors, enable = [(ligand, 'spheres')], [], [ligand]
+    if len(active_site) == 2:
         residues = active_site[1]
-        cmd.enable(residues) #Makes sure that objects are not toggled off in the GUI
-        cmd.show('sticks', f'{residues} and not name n+o+c')
+        enable.append(residues) #Makes sure that objects are not toggled off in the GUI
+        representations.append((f'{residues} and not name n+o+c', 'sticks'))
         util.cbay(residues) #Better to set this color in global variables.
 
-    ligand = active_site[0]
-    cmd.enable(ligand) 
-    cmd.set('ray_opaque_background', 0)
     #If user sets the ligand_color_off in the command line, the color will represent the GUI
     if LIGAND_COLOR != None:
-        cmd.color(LIGAND_COLOR, ligand)
-    cmd.show('spheres', ligand)
+        colors.append((ligand, LIGAND_COLOR))
+    pymol_scene.apply_scene(representations, colors, enable)
     print(f"LIGAND_COLOR is now set to: {LIGAND_COLOR}")
     
     image = os.path.join(image_dir, f'{protein}_3')
-    cmd.set_view(pymol_view)
-    cmd.png(image, width=WIDTH, height=HEIGHT, dpi=DPI, ray=1)
-    print(f"Image saved as {image}")
+    save_views(image, pymol_view, render)
+    if render:
+        print(f"Image saved as {image}")
 
 
-def protein_figure(protein:str, resi_list:list, image_dir:str, pymol_view:str):
+def protein_figure(protein:str, resi_list:list, image_dir:str, pymol_view:str, render:bool=True):
     """
-    Inputs: Protein as a string, list of selected residues, and 
+    Inputs: Protein as a string, selected residues (residue array from
+    get_selection_residues or a list of residue numbers), and 
     image directory as a string
     saves a foreground protein image to the image directory
+    (with render=False only the scene is set up)
     Returns the string name of the object that will be in the foreground (transparent)
     """
-    cmd.set('ray_trace_mode', 2) #Black and white
-    #Expand the selection (padded_resi) and covert lists to a string
-    residue_string = "+".join(sorted(str(r) for r in resi_list))
-    min_resi = max(1, resi_list[0]-2)
-    max_resi = resi_list[-1] + 2
-
-    padded_resi = list(range(min_resi, max_resi + 1))
-    expanded_residue_string = "+".join(sorted(str(r) for r in padded_resi))
+    pymol_settings_profiles.apply_profile('protein_layer') #Black and white on an opaque white background
+    #Chain qualified residue ranges, padded by 2 residues around every run (see pymol_selections.py)
+    residues = pymol_residues.as_residue_index(resi_list)
+    selected = pymol_selections.cached_select(f'{protein}_figure_residues', pymol_selections.residue_expression(residues))
+    padded_expression = pymol_selections.residue_expression(residues, padding=2)
     
-    cmd.hide('everything')
-    cmd.show('cartoon', f'{protein} and not resi {residue_string}')
-    cmd.create(f'{protein}_transparent', f'{protein} and resi {expanded_residue_string}')
-    cmd.set('ray_opaque_background', 1)
-    cmd.set('bg_rgb', [1,1,1])
+    #Reuses the copy of an earlier run, then shows only the cartoon around the selected residues
+    transparent_object = pymol_scene.ensure_object(f'{protein}_transparent', f'{protein} and ({padded_expression})')
+    pymol_scene.apply_scene([(f'{protein} and not {selected}', 'cartoon'),
+                             (f'{transparent_object} and not {selected}', 'cartoon')])
     image = os.path.join(image_dir, f'{protein}_4')
-    cmd.set_view(pymol_view)
-    cmd.png(image, width=WIDTH, height=HEIGHT, dpi=DPI, ray=1)
-    print(f"Image saved in {image}")
-    return f'{protein}_transparent'
+    save_views(image, pymol_view, render)
+    if render:
+        print(f"Image saved in {image}")
+    return transparent_object
 
 def set_image_dir(image_dir:str=None):
     """
@@ -150,24 +218,21 @@ def set_image_dir(image_dir:str=None):
 def get_selection_residues(protein:str, selection_name:str):
     """
     Expands the selection to hide and creates an object that overlaps
+    Returns: residue array (object, chain, resi, icode) of the selection
     """
-    selection = cmd.get_model(selection_name)
-    residue_set = set()
-    for atom in selection.atom:
-        residue_set.add(int(atom.resi))
-    
-    resi_list = sorted(residue_set)
-    print(f"resi {resi_list}")
+    resi_list = pymol_residues.get_residue_index(selection_name)
+    print(pymol_selections.residue_expression(resi_list))
     return resi_list
 
 def select_objects(protein:str, active_site:list):
     """
     Checks that the objects can be found in Pymol. 
+    Named selections count as objects (selection backed load hook).
     Exits if criteria are not met.
     Input: Protein string and active_site list
     Returns: Protein string and active site list
     """
-    objects = cmd.get_object_list()
+    objects = cmd.get_names('all')
     
     #check active site objects
     if set(active_site).issubset(objects):
@@ -188,21 +253,85 @@ def select_objects(protein:str, active_site:list):
         sys.exit()
 
 
+def render_figures(protein:str, active_site:list, resi_list:list, image_dir:str, pymol_view:str, layers=None):
+    """
+    Inputs: Protein as a string, active site list (ligand, residues), list of
+    selected residues, image directory as a string, the view to render from
+    (or a dictionary of view name -> view, see save_views) and optionally the
+    layers to render (protein, active_site, transparent), all by default
+    Renders the layers in order: background (_4), active site (_3) and the
+    transparent foreground (_1, _2). The scene of a layer that is left out is
+    still set up, the layers after it depend on it.
+    With RENDER_WORKERS > 1 every layer is ray traced in its own worker process
+    from a snapshot of the session, the scene here is then only set up.
+    Draft renders are recorded so accept_layers can refine them in the background.
+    With several views every layer is set up once and rendered from each view
+    (in this process, RENDER_WORKERS only applies to a single view).
+    The settings and the scene the layers change are restored when the figures are done,
+    so running it again starts from the same scene.
+    With MERGE_LAYERS and all layers rendered, they are then blended into {protein}_merged.png.
+    Returns: list of the saved image paths
+    """
+    layers = tuple(layers or pymol_parallel_layers.LAYERS)
+    unknown = [layer for layer in layers if layer not in pymol_parallel_layers.LAYERS]
+    if unknown:
+        raise ValueError(f"Unknown layers {', '.join(unknown)}, choose from: {', '.join(pymol_parallel_layers.LAYERS)}")
+    multi_view = isinstance(pymol_view, dict)
+    render = RENDER_WORKERS <= 1 or multi_view
+    lesson_globals = {name: globals()[name] for name in pymol_parallel_layers.LESSON_GLOBALS}
+    if RENDER_PROFILE == 'draft' and not multi_view:
+        pymol_draft.record_draft(protein, active_site, resi_list, image_dir, pymol_view, lesson_globals, RENDER_PROFILES)
+    if not render:
+        pymol_parallel_layers.render_figures_parallel(protein, active_site, resi_list, image_dir, pymol_view,
+                                                      lesson_globals, RENDER_WORKERS, layers)
+    #Settings and the scene the layers change are restored afterwards (see pymol_settings_profiles.py and pymol_scene.py)
+    snapshot = pymol_scene.snapshot_scene(protein)
+    with pymol_settings_profiles.settings_profile():
+        #Create the background protein figure
+        start = time.perf_counter()
+        render_layer = render and 'protein' in layers
+        protein_transparent_object = protein_figure(protein, resi_list, image_dir, pymol_view, render=render_layer)
+        if render_layer:
+            pymol_draft.record_timing('protein', RENDER_PROFILE, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        render_layer = render and 'active_site' in layers
+        active_site_figure(protein, active_site, image_dir, pymol_view, render=render_layer)
+        if render_layer:
+            pymol_draft.record_timing('active_site', RENDER_PROFILE, time.perf_counter() - start)
+
+        if 'transparent' in layers:
+            start = time.perf_counter()
+            transparent_figure(protein=protein, transparent_object=protein_transparent_object, image_dir=image_dir, pymol_view=pymol_view, render=render)
+            if render:
+                pymol_draft.record_timing('transparent', RENDER_PROFILE, time.perf_counter() - start)
+    pymol_scene.restore_scene(snapshot)
+    cmd.disable(protein_transparent_object)
+    directories = [os.path.join(image_dir, name) for name in pymol_view] if multi_view else [image_dir]
+    numbers = [number for layer in layers for number in pymol_parallel_layers.LAYER_IMAGES[layer]]
+    images = [os.path.join(directory, f'{protein}_{number}.png') for directory in directories for number in numbers]
+    if MERGE_LAYERS and set(layers) == set(pymol_parallel_layers.LAYERS):
+        for directory in directories:
+            try:
+                images.append(pymol_composite.composite_figure(protein, directory))
+            except ValueError as error: #e.g. layers rendered with different profiles
+                print(f"Could not merge the layers in {directory}: {error}", flush=True)
+    return images
+
 # ==== Main Execution ====
 #Pymol recieves all arguments as a string so need to parse it.
 def run_selection(arg_string:str, _self=None):
-    global LIGAND_COLOR
+    global LIGAND_COLOR, CURRENT_VIEW
+    CURRENT_VIEW = cmd.get_view() #The camera when the command is run, not when the script was loaded
     pymol_settings()
     args = arg_string.split()
     if len(args) < 2 or len(args) > 4:
         print("Usage: run_selection protein_name ligand residues(optional) ligand_color_off(optional)")
         return
     protein = args[0]
-    if len(args) == 3: 
-        active_sites = args[1:]
+    active_sites = args[1:3]
     #Allow the user to turn automated ligand color off. Color will fall back to the GUI color.
-    elif len(args) == 4:
-        active_sites = args[1:3]
+    if len(args) == 4:
         ligand_color_off = args[-1]
         print(ligand_color_off)
         if ligand_color_off == 'ligand_color_off':
@@ -213,21 +342,100 @@ def run_selection(arg_string:str, _self=None):
     protein, active_site = select_objects(protein, active_sites)
     resi_list = get_selection_residues(protein=protein, selection_name=SELECTION_NAME)
     image_dir = set_image_dir(IMAGE_DIRECTORY)
-    #Create the background protein figure
-    protein_transparent_object = protein_figure(protein, resi_list, image_dir, CURRENT_VIEW)
-    active_site_figure(protein, active_sites, image_dir, CURRENT_VIEW)
-    transparent_figure(protein=protein, transparent_object=protein_transparent_object, image_dir=image_dir, pymol_view=CURRENT_VIEW)
+    render_figures(protein, active_site, resi_list, image_dir, CURRENT_VIEW)
+
+def run_views(arg_string:str, _self=None):
+    """
+    Renders every layer for all views stored for the protein (see pymol_views.py)
+    Input: string of protein, ligand, residues (optional) and views=<pattern> (optional)
+    e.g. run_views 1EMA_A 1EMA_organics 1EMA_active_site_residues views=orbit_*
+    """
+    args = [arg for arg in arg_string.split() if not arg.startswith('views=')]
+    patterns = [arg[len('views='):] for arg in arg_string.split() if arg.startswith('views=')]
+    if len(args) < 2 or len(args) > 3:
+        print("Usage: run_views protein_name ligand residues(optional) views=pattern(optional)")
+        return
+    protein = args[0]
+    views = pymol_views.get_views(protein, patterns[0] if patterns else '*')
+    if not views:
+        print(f"No views stored for {protein}, use store_view or view_series first")
+        return
+    pymol_settings()
+    protein, active_site = select_objects(protein, args[1:3])
+    resi_list = get_selection_residues(protein=protein, selection_name=SELECTION_NAME)
+    image_dir = set_image_dir(IMAGE_DIRECTORY)
+    start = time.perf_counter()
+    images = render_figures(protein, active_site, resi_list, image_dir, views)
+    print(f"Rendered {len(images)} images for {len(views)} views in {time.perf_counter() - start:.1f} s")
+
+def run_ligand_sweep(arg_string:str, _self=None):
+    """
+    Renders every layer once per ligand instance, with its own pocket residues
+    cut out of the background and each figure set in a sub directory named after the ligand.
+    The protein is loaded and styled once, between ligands only the scene that
+    differs is changed (see pymol_scene.py).
+    Input: string of protein, ligand object or selection and cutoff=<Angstrom> (optional)
+    e.g. run_ligand_sweep 1EMA_A 1EMA_organics cutoff=4.5
+    Returns: list of the rendered ligands (also saved as ligand_sweep.json)
+    """
+    global CURRENT_VIEW
+    args = [arg for arg in arg_string.split() if not arg.startswith('cutoff=')]
+    cutoffs = [float(arg[len('cutoff='):]) for arg in arg_string.split() if arg.startswith('cutoff=')]
+    if len(args) != 2:
+        print("Usage: run_ligand_sweep protein_name ligands cutoff=4(optional)")
+        return
+    CURRENT_VIEW = cmd.get_view()
+    pymol_settings()
+    protein, (ligands,) = select_objects(args[0], args[1:])
+    instances = pymol_ligands.ligand_instances(ligands)
+    if not instances:
+        print(f"No ligands found in {ligands}")
+        return
+    image_dir = set_image_dir(IMAGE_DIRECTORY)
+    keys, coords = pymol_ligands.protein_coordinates(protein) #Once for all ligands
+
+    start = time.perf_counter()
+    sweep = []
+    for instance in instances:
+        ligand_start = time.perf_counter()
+        ligand = pymol_selections.cached_select(f"{protein}_{instance['name']}", instance['selection'])
+        pocket_expression = pymol_ligands.pocket_selection(keys, coords, ligand, cutoffs[0] if cutoffs else POCKET_CUTOFF)
+        pocket = pymol_selections.cached_select(f"{ligand}_pocket", f"({protein}) and ({pocket_expression})")
+        resi_list = pymol_residues.get_residue_index(pocket)
+        view = CURRENT_VIEW
+        if ORIENT_LIGANDS:
+            cmd.orient(f"{ligand} or {pocket}")
+            view = cmd.get_view()
+        ligand_dir = os.path.join(image_dir, instance['name'])
+        os.makedirs(ligand_dir, exist_ok=True)
+        print(f"Ligand {instance['name']}: {instance['atoms']} atoms, {len(resi_list)} pocket residues", flush=True)
+        images = render_figures(protein, [ligand, pocket], resi_list, ligand_dir, view)
+        sweep.append({'ligand': instance['name'], 'resn': instance['resn'], 'chain': instance['chain'],
+                      'resi': instance['resi'], 'atoms': instance['atoms'],
+                      'pocket': pymol_selections.residue_expression(resi_list), 'images': images,
+                      'seconds': time.perf_counter() - ligand_start})
+    cmd.set_view(CURRENT_VIEW)
+
+    report = os.path.join(image_dir, 'ligand_sweep.json')
+    with open(report, 'w') as handle:
+        json.dump(sweep, handle, indent=2)
+    print(f"Rendered {len(sweep)} ligands in {time.perf_counter() - start:.1f} s, summary saved as {report}")
+    return sweep
 
 # Register commands in PyMOL
 cmd.extend("select_objects", select_objects)
 cmd.extend("get_selection_residues", get_selection_residues)
 cmd.extend("run_selection", run_selection)
+cmd.extend("run_views", run_views)
+cmd.extend("run_ligand_sweep", run_ligand_sweep)
+cmd.extend("render_figures", render_figures)
 cmd.extend("get_selection_residues", get_selection_residues)
 cmd.extend("set_image_dir", set_image_dir)
 cmd.extend("protein_figure", protein_figure)
 cmd.extend("active_site_figure", active_site_figure)
 cmd.extend("transparent_figure", transparent_figure)
 cmd.extend("pymol_settings", pymol_settings)
+cmd.extend("set_render_profile", set_render_profile)
 
 print(f"PyMOL script loaded. \
       \n Select residues to hide and leave the selection labeled as {SELECTION_NAME} \
@@ -237,7 +445,11 @@ print(f"PyMOL script loaded. \
       \n e.g. run_selection 1EMA 1EMA_organics 1EMA_active_site_residues \
       \n If you wish to set the ligand colors in the GUI add <ligand_color_off> \
       \n to the end of the command: \
-      \n e.g. run_selection 1EMA 1EMA_organics 1EMA_active_site_residues ligand_color_off")
+      \n e.g. run_selection 1EMA 1EMA_organics 1EMA_active_site_residues ligand_color_off \
+      \n To frame a figure quickly: set_render_profile draft, run_selection ..., then \
+      \n accept_layers 4 3 1 refines the layers you keep in the background \
+      \n To render several views: view_series protein, orbit, 8, then run_views protein ligand residues \
+      \n To render every ligand with its own pocket: run_ligand_sweep protein ligands")
 
 #Function Tests for PDB ID: 1EMA
 #select_objects('1EMA_A', ['1EMA_organics', '1EMA_active_site_residues'])
@@ -0,0 +1,131 @@
+from pymol import cmd
+import re
+
+import pymol_residues
+
+"""
+Compact, chain-aware selection expressions for residue arrays
+(pymol_residues.get_residue_index).
+residue_expression collapses consecutive residue numbers into ranges and
+qualifies them by chain, e.g. (chain A and resi 195-207+210) or (chain B and resi 3-9)
+instead of resi 195+196+197+... Padding is added around every run of residues,
+so disjoint selections are padded at each gap, and runs whose padding meets
+are merged. Padding does not go below residue 1 (as the first lessons did),
+unless the selection itself starts below 1.
+cached_select only re-evaluates a named selection when its expression or the
+objects in the session changed, or alter was called. Expressions with distance
+or property operators (within, around, b >, ss...) and expressions that use
+another named selection (sele...) are always evaluated, because moving
+coordinates (superpose_all, states), alter or a new selection change their atoms.
+"""
+
+SELECTION_STATS = {'hits': 0, 'evaluated': 0}
+_SELECTIONS = {} #Selection name -> (expression, session key)
+_ALTERS = {'count': 0} #cmd.alter calls, alter can change the chains and residue numbers of a cached selection
+#Operators whose atoms depend on coordinates, the state or properties that alter can change
+DYNAMIC_OPERATORS = re.compile(
+    r"(?<![\w.\\])(within|around|expand|gap|near_to|beyond|w\.|a\.|x\.|nto\.|be\.|ss|pc\.|fc\.|"
+    r"partial_charge|formal_charge|state|present|rep|color|visible|v\.|flag|f\.|enabled)(?![\w.])"
+    r"|(?<![\w.\\])[bq]\s*[<>=]", re.IGNORECASE) #b and q only in comparisons, not chain B
+
+def _resi(number:int):
+    #Negative residue numbers need escaping in selections
+    return str(number).replace('-', '\\-')
+
+def residue_ranges(numbers, padding:int=0):
+    """
+    Input: Residue numbers and the number of residues to add on each side
+    (not below 1, unless the residue itself is)
+    Returns: sorted list of (first, last) ranges, overlapping or touching ranges merged
+    """
+    ranges = []
+    for number in sorted(set(int(number) for number in numbers)):
+        first, last = max(number - padding, min(number, 1)), number + padding
+        if ranges and first <= ranges[-1][1] + 1:
+            ranges[-1][1] = max(ranges[-1][1], last)
+        else:
+            ranges.append([first, last])
+    return [tuple(item) for item in ranges]
+
+def resi_expression(numbers, icodes=(), padding:int=0):
+    """
+    Inputs: Residue numbers, residue labels with insertion codes (e.g. 52A) and padding
+    Returns: resi expression, e.g. resi 195-207+210+52A
+    """
+    parts = [_resi(first) if first == last else f"{_resi(first)}-{_resi(last)}"
+             for first, last in residue_ranges(numbers, padding)]
+    parts += [label.replace('-', '\\-') for label in sorted(set(icodes))]
+    return f"resi {'+'.join(parts)}"
+
+def residue_expression(residues, padding:int=0):
+    """
+    Inputs: Residue array (or list of residue numbers) and padding in residues
+    Returns: selection expression with one range compressed resi term per chain.
+    Residues from a selection are chain qualified, plain residue numbers are not.
+    """
+    residues = pymol_residues.as_residue_index(residues)
+    if not len(residues):
+        return 'none'
+    terms = []
+    chains = sorted(set(zip((residues['object'] != '').tolist(), residues['chain'].tolist())))
+    for qualified, chain in chains:
+        mask = (residues['chain'] == chain) & ((residues['object'] != '') == qualified)
+        #Insertion code residues are padded around their number
+        numbers = residues['resi'][mask if padding else mask & (residues['icode'] == '')].tolist()
+        icodes = [f"{resi}{icode}" for resi, icode in zip(residues['resi'][mask].tolist(), residues['icode'][mask].tolist()) if icode]
+        expression = resi_expression(numbers, icodes, padding)
+        if qualified:
+            chain_id = chain or '""'
+            expression = f"chain {chain_id} and {expression}"
+        terms.append(expression)
+    return terms[0] if len(terms) == 1 else ' or '.join(f"({term})" for term in terms)
+
+def _session_key():
+    #Changes when objects are added, removed or change size, or atoms are altered
+    return tuple(cmd.get_names('objects')), cmd.count_atoms('all'), _ALTERS['count']
+
+def is_cacheable(expression:str):
+    """
+    Returns: True if the atoms of the expression only depend on the objects and their identifiers
+    """
+    return DYNAMIC_OPERATORS.search(expression) is None
+
+def uses_selections(expression:str):
+    """
+    Returns: True if the expression refers to a named selection, whose atoms can change at any time
+    """
+    return not set(re.findall(r"[\w.]+", expression)).isdisjoint(cmd.get_names('selections'))
+
+def cached_select(name:str, expression:str):
+    """
+    Inputs: Selection name and expression
+    Creates the named selection, unless the same expression was selected
+    for the same objects before (and does not depend on coordinates or properties).
+    Returns: the selection name
+    """
+    key = (expression, _session_key())
+    if _SELECTIONS.get(name) == key and is_cacheable(expression) and name in cmd.get_names('selections') \
+            and not uses_selections(expression):
+        SELECTION_STATS['hits'] += 1
+        return name
+    cmd.select(name, expression, enable=0)
+    _SELECTIONS[name] = key
+    SELECTION_STATS['evaluated'] += 1
+    return name
+
+def selection_stats():
+    """
+    Prints and returns how many selections were evaluated and reused
+    """
+    print(f"Selections: {SELECTION_STATS['evaluated']} evaluated, {SELECTION_STATS['hits']} reused", flush=True)
+    return dict(SELECTION_STATS)
+
+_original_alter = cmd.alter
+
+def counted_alter(*args, **kwargs):
+    #Cached selections are evaluated again after any alter
+    _ALTERS['count'] += 1
+    return _original_alter(*args, **kwargs)
+
+cmd.alter = counted_alter
+cmd.extend("selection_stats", selection_stats)
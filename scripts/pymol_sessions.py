@@ -0,0 +1,241 @@
+from pymol import cmd
+import fnmatch
+import gzip
+import io
+import json
+import os
+import pickle
+import time
+
+"""
+Session (.pse) index and partial session loading.
+A session file is a pickled dictionary, read_session unpickles it without
+building the scene: PyMOL classes (and any other class) are replaced by inert
+stubs, so nothing from the file is imported or run. From it session_info and
+index_sessions report the object names, types, atom and state counts,
+selections, the stored view and the non default settings. The index is kept in
+SESSION_INDEX and only re-read for sessions that changed.
+load_objects loads only the named objects of a session (cmd.set_session with
+partial=1), with their groups and the selections on them. Like loading a whole
+session, this does not run the .pymolrc.py load hook.
+
+e.g. find_sessions pdb_pse, *_organics *_active_site_residues
+     session_info pdb_pse/lesson3_gfp.pse
+     load_objects pdb_pse/lesson3_9COR.pse, 9COR_A 9COR_organics
+"""
+
+SESSION_INDEX = os.path.join(os.path.expanduser("~"), '.pymol', 'session_index.json')
+SESSION_EXTENSIONS = ('.pse', '.psw', '.pze', '.pzw')
+#Session keys kept when loading part of a session, the rest (settings, view, movie...) is left as it is
+PARTIAL_KEYS = ('version', 'colors', 'color_ext', 'unique_settings')
+
+#Object type codes in the session names list
+OBJECT_TYPES = {-1: 'selection', 1: 'molecule', 2: 'map', 3: 'mesh', 4: 'measurement', 5: 'callback', 6: 'cgo',
+                7: 'surface', 8: 'gadget', 9: 'calculator', 10: 'slice', 11: 'alignment', 12: 'group', 13: 'volume'}
+#Globals a session pickle may use for real, everything else becomes a stub
+SAFE_GLOBALS = {('_codecs', 'encode'), ('builtins', 'bytearray'), ('builtins', 'set'), ('builtins', 'frozenset')}
+
+_SETTING_NAMES = {}
+
+class _Stub:
+    """Stands in for a class from a session (e.g. pymol.Session_Storage)"""
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __setstate__(self, state):
+        self.__dict__['state'] = state
+
+class _SessionUnpickler(pickle.Unpickler):
+    def find_class(self, module, name):
+        if (module, name) in SAFE_GLOBALS:
+            return super().find_class(module, name)
+        return _Stub
+
+def is_session(path:str):
+    return str(path).lower().endswith(SESSION_EXTENSIONS)
+
+def read_session(path:str):
+    """
+    Input: Path to a .pse/.psw session (or gzipped .pze/.pzw)
+    Returns: the session dictionary, without loading it into PyMOL
+    """
+    with open(os.path.expanduser(path), 'rb') as handle:
+        data = handle.read()
+    if data[:2] == b'\x1f\x8b':
+        data = gzip.decompress(data)
+    return _SessionUnpickler(io.BytesIO(data)).load()
+
+def session_entries(session:dict):
+    """
+    Returns: list of the names entries [name, is selection, enabled, reps, type, data, group]
+    """
+    return [entry for entry in session.get('names', []) if entry]
+
+def atom_count(entry:list):
+    #Molecule data starts with [object, states, bonds, atoms, ...]
+    data = entry[5]
+    return data[3] if entry[4] == 1 and isinstance(data, list) and len(data) > 3 else 0
+
+def state_count(entry:list):
+    data = entry[5]
+    return data[1] if entry[4] == 1 and isinstance(data, list) and len(data) > 1 else 0
+
+def session_view(session:dict):
+    """
+    Returns: the session view as the 18 values of get_view, or None
+    """
+    view = session.get('view')
+    if not view or len(view) < 25:
+        return None
+    rotation = [view[row * 4 + column] for row in range(3) for column in range(3)]
+    return tuple(float(value) for value in rotation + list(view[16:25]))
+
+def setting_name(index:int):
+    if not _SETTING_NAMES:
+        try:
+            from pymol import setting
+            _SETTING_NAMES.update({setting._get_index(name): name for name in setting.get_name_list()})
+        except Exception:
+            pass
+    return _SETTING_NAMES.get(index, str(index))
+
+def session_info(path:str, quiet:int=0):
+    """
+    Input: Path to a session
+    Returns: dictionary of the objects, selections, view and settings of the session
+    """
+    path = os.path.abspath(os.path.expanduser(path))
+    start = time.perf_counter()
+    session = read_session(path)
+    objects, selections = [], []
+    for entry in session_entries(session):
+        if entry[1]:
+            selections.append(entry[0])
+            continue
+        objects.append({'name': entry[0], 'type': OBJECT_TYPES.get(entry[4], str(entry[4])),
+                        'atoms': atom_count(entry), 'states': state_count(entry),
+                        'enabled': bool(entry[2]), 'group': entry[6] if len(entry) > 6 else ''})
+    info = {'file': path, 'size': os.path.getsize(path), 'mtime': os.path.getmtime(path),
+            'version': session.get('version'), 'objects': objects, 'selections': selections,
+            'view': session_view(session), 'views': sorted(session.get('view_dict') or {}),
+            'settings': {setting_name(item[0]): item[2] for item in session.get('settings') or [] if len(item) > 2}}
+    if not int(quiet):
+        print(f"{path} ({info['size'] / 1e6:.1f} MB, read in {time.perf_counter() - start:.2f} s)", flush=True)
+        for item in objects:
+            print(f"  {item['name']:<32}{item['type']:<12}{item['atoms']:>8} atoms{item['states']:>5} states", flush=True)
+        if selections:
+            print(f"  Selections: {', '.join(selections)}", flush=True)
+    return info
+
+def load_index():
+    if not os.path.exists(SESSION_INDEX):
+        return {}
+    with open(SESSION_INDEX) as handle:
+        return json.load(handle)
+
+def save_index(index:dict):
+    os.makedirs(os.path.dirname(SESSION_INDEX), exist_ok=True)
+    temporary = f"{SESSION_INDEX}.{os.getpid()}.tmp"
+    with open(temporary, 'w') as handle:
+        json.dump(index, handle)
+    os.replace(temporary, SESSION_INDEX)
+
+def index_sessions(path:str='.', refresh:int=0):
+    """
+    Inputs: Session file or directory (searched recursively) and 1 to re-read every session
+    Reads the sessions that are new or changed since they were last indexed.
+    Returns: dictionary of session path -> session_info
+    """
+    path = os.path.abspath(os.path.expanduser(path))
+    if os.path.isdir(path):
+        files = sorted(os.path.join(root, name) for root, _, names in os.walk(path) for name in names if is_session(name))
+    else:
+        files = [path]
+    index, sessions, read = load_index(), {}, 0
+    for file in files:
+        info = index.get(file)
+        if int(refresh) or not info or info['size'] != os.path.getsize(file) or info['mtime'] != os.path.getmtime(file):
+            try:
+                info = session_info(file, quiet=1)
+            except Exception as error:
+                print(f"Could not read {file}: {error}", flush=True)
+                continue
+            index[file] = info
+            read += 1
+        sessions[file] = info
+    if read:
+        save_index(index)
+    print(f"Indexed {len(sessions)} sessions ({read} read, {len(sessions) - read} unchanged)", flush=True)
+    return sessions
+
+def find_sessions(path:str='.', objects:str='*_organics *_active_site_residues'):
+    """
+    Inputs: Session file or directory and object name patterns
+    Returns: list of the sessions with an object matching every pattern
+    e.g. find_sessions pdb_pse, *_organics *_active_site_residues
+    """
+    patterns = objects.replace(',', ' ').split() if isinstance(objects, str) else list(objects)
+    found = []
+    for file, info in index_sessions(path).items():
+        names = [item['name'] for item in info['objects']]
+        matches = [fnmatch.filter(names, pattern) for pattern in patterns]
+        if all(matches):
+            found.append(file)
+            print(f"{file}: {', '.join(name for names in matches for name in names)}", flush=True)
+    if not found:
+        print(f"No sessions with objects matching {' '.join(patterns)}", flush=True)
+    return found
+
+def partial_session(session:dict, objects):
+    """
+    Inputs: Session dictionary and object names or patterns
+    Returns: the session with only the matching objects, their groups and the
+    selections on them, and the list of object names kept
+    """
+    patterns = objects.replace(',', ' ').split() if isinstance(objects, str) else list(objects)
+    entries = session_entries(session)
+    kept = {entry[0] for entry in entries if not entry[1] and any(fnmatch.fnmatch(entry[0], pattern) for pattern in patterns)}
+    groups = {entry[0]: entry[6] for entry in entries if not entry[1] and len(entry) > 6}
+    for name in list(kept): #Parent groups, so the objects stay in them
+        while groups.get(name):
+            name = groups[name]
+            kept.add(name)
+
+    names = [None]
+    for entry in entries:
+        if not entry[1]:
+            if entry[0] in kept:
+                names.append(entry)
+            continue
+        members = [member for member in entry[5] if member and member[0] in kept]
+        if members:
+            names.append(entry[:5] + [members] + entry[6:])
+    partial = {key: session[key] for key in PARTIAL_KEYS if key in session}
+    partial['names'] = names
+    return partial, [entry[0] for entry in names[1:] if not entry[1]]
+
+def load_objects(path:str, objects:str, view:int=1, quiet:int=0):
+    """
+    Inputs: Session path, object names or patterns (e.g. 9COR_A 9COR_organics)
+    and 1 to also set the session view
+    Loads only those objects from the session into the current one
+    Returns: list of the loaded object names
+    """
+    start = time.perf_counter()
+    session = read_session(path)
+    partial, names = partial_session(session, objects)
+    if not names:
+        print(f"No objects matching {objects} in {path}", flush=True)
+        return []
+    cmd.set_session(partial, partial=1)
+    stored_view = session_view(session)
+    if int(view) and stored_view:
+        cmd.set_view(stored_view)
+    if not int(quiet):
+        print(f"Loaded {', '.join(names)} from {path} in {time.perf_counter() - start:.2f} s", flush=True)
+    return names
+
+cmd.extend("session_info", session_info)
+cmd.extend("index_sessions", index_sessions)
+cmd.extend("find_sessions", find_sessions)
+cmd.extend("load_objects", load_objects)
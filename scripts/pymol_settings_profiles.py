@@ -0,0 +1,150 @@
+from pymol import cmd
+import math
+from contextlib import contextmanager
+
+"""
+Named settings profiles that only set what changed.
+A profile is a dictionary of setting -> value. apply_profile reads the current
+value of every setting (get_setting_tuple), compares it by setting type with
+the target (colors by RGB, booleans by on/off...) and only calls cmd.set for
+the ones that differ, because every set can invalidate representations.
+settings_profile is a context manager that restores the settings it changed
+on exit. settings_stats prints how many sets (and representation rebuilds)
+were avoided.
+
+.pymolrc.py adds its display and render profiles, the lessons use the others.
+"""
+
+PROFILES = {
+    #Black and white outline (lesson 2 ray_trace)
+    'outline': {'ray_trace_mode': 2, 'ray_shadows': 0, 'fog': 0, 'ray_trace_gain': 20, 'ray_trace_slope_factor': 5},
+    #Lesson 3 figure settings (pymol_settings), antialias is added by the lesson
+    'figure': {'ray_shadows': 0, 'fog': 0, 'ray_trace_gain': 20, 'ray_trace_slope_factor': 5},
+    #Lesson 3 layers
+    'protein_layer': {'ray_trace_mode': 2, 'ray_opaque_background': 1, 'bg_rgb': [1, 1, 1]},
+    'active_site_layer': {'ray_trace_mode': 0, 'ray_opaque_background': 0},
+    'transparent_layer': {'ray_trace_mode': 0, 'cartoon_transparency': 0.5},
+    'outline_layer': {'ray_trace_mode': 2, 'cartoon_transparency': 0},
+}
+
+#Settings whose change makes PyMOL rebuild representations
+REBUILD_PREFIXES = ('cartoon_', 'stick_', 'sphere_', 'surface_', 'ribbon_', 'line_', 'valence')
+
+SETTINGS_STATS = {'applied': 0, 'skipped': 0, 'rebuilds_avoided': 0, 'restored': 0}
+_STACK = []
+
+# Setting types from get_setting_tuple
+BOOLEAN, INTEGER, FLOAT, FLOAT3, COLOR, STRING = 1, 2, 3, 4, 5, 6
+
+def current_value(name:str):
+    """
+    Returns: (setting type, value) with float3 settings as a tuple
+    """
+    setting_type, value = cmd.get_setting_tuple(name)
+    return setting_type, (tuple(value) if len(value) > 1 else value[0])
+
+def target_value(setting_type:int, value):
+    """
+    Inputs: Setting type and the value as it would be given to cmd.set
+    Returns: the value in the form get_setting_tuple reports it
+    """
+    if setting_type == BOOLEAN:
+        if isinstance(value, str):
+            return int(value.strip().lower() in ('on', 'true', 'yes', '1'))
+        return int(bool(value))
+    if setting_type == INTEGER:
+        return int(value)
+    if setting_type == FLOAT:
+        return float(value)
+    if setting_type == FLOAT3:
+        return tuple(cmd.get_color_tuple(value) if isinstance(value, str) else (float(item) for item in value))
+    if setting_type == COLOR:
+        return value if isinstance(value, int) else cmd.get_color_index(str(value))
+    return str(value)
+
+def is_current(name:str, value):
+    """
+    Returns: True if the setting already has the value
+    """
+    try:
+        setting_type, current = current_value(name)
+        target = target_value(setting_type, value)
+    except Exception:
+        return False #Unknown names or values, let cmd.set handle them
+    if setting_type == FLOAT:
+        return math.isclose(current, target, abs_tol=1e-6)
+    if setting_type == FLOAT3:
+        return len(current) == len(target) and all(math.isclose(a, b, abs_tol=1e-4) for a, b in zip(current, target))
+    return current == target
+
+def apply_settings(settings:dict):
+    """
+    Input: Dictionary of setting -> value
+    Sets only the settings that differ from the current values.
+    Returns: dictionary of the previous values of the changed settings
+    """
+    previous = {}
+    for name, value in settings.items():
+        if is_current(name, value):
+            SETTINGS_STATS['skipped'] += 1
+            if name.startswith(REBUILD_PREFIXES):
+                SETTINGS_STATS['rebuilds_avoided'] += 1
+            continue
+        try:
+            previous[name] = current_value(name)[1]
+        except Exception:
+            pass
+        cmd.set(name, value)
+        SETTINGS_STATS['applied'] += 1
+    if _STACK:
+        #Keep the oldest value of each setting for the innermost settings_profile block
+        for name, value in previous.items():
+            _STACK[-1].setdefault(name, value)
+    return previous
+
+def apply_profile(name:str, **overrides):
+    """
+    Input: Profile name from PROFILES, settings given as keywords replace the profile values
+    e.g. apply_profile outline
+    Returns: dictionary of the previous values of the changed settings
+    """
+    if name not in PROFILES:
+        print(f"Unknown settings profile {name}, choose from: {', '.join(PROFILES)}", flush=True)
+        return {}
+    return apply_settings(dict(PROFILES[name], **overrides))
+
+def restore_settings(previous:dict):
+    """
+    Input: Previous values returned by apply_settings or apply_profile
+    """
+    for name, value in previous.items():
+        cmd.set(name, list(value) if isinstance(value, tuple) else value)
+        SETTINGS_STATS['restored'] += 1
+
+@contextmanager
+def settings_profile(name:str=None, **overrides):
+    """
+    Inputs: Profile name (or None to only track settings applied inside the block)
+    and settings that replace the profile values
+    Applies the profile and restores every setting changed through this module
+    inside the block on exit
+    """
+    _STACK.append({})
+    try:
+        if name is not None:
+            apply_profile(name, **overrides)
+        yield
+    finally:
+        restore_settings(_STACK.pop())
+
+def settings_stats():
+    """
+    Prints and returns the counts of applied, skipped and restored settings
+    """
+    print(f"Settings: {SETTINGS_STATS['applied']} applied, {SETTINGS_STATS['skipped']} redundant sets skipped "
+          f"({SETTINGS_STATS['rebuilds_avoided']} representation rebuilds avoided), "
+          f"{SETTINGS_STATS['restored']} restored", flush=True)
+    return dict(SETTINGS_STATS)
+
+cmd.extend("apply_profile", apply_profile)
+cmd.extend("settings_stats", settings_stats)
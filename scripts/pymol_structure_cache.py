@@ -0,0 +1,162 @@
+from pymol import cmd
+import gzip
+import os
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import pymol_disk_cache
+
+"""
+Local structure mirror for the fetch hook in .pymolrc.py (STRUCTURE_CACHE = True).
+Fetched entries are stored gzip compressed (e.g. 1ema.cif.gz) in
+MIRROR_DIRECTORY and loaded from there next time. The mirror is kept under
+MAX_MIRROR_BYTES by evicting the least recently used files.
+prefetch downloads a list of IDs concurrently in a thread pool.
+The source is pluggable: a URL template (e.g. a local HTTP stand-in,
+http://localhost:8000/{code}.{ext}) or a function (code, ext) -> bytes.
+With OFFLINE = True only the mirror is used.
+"""
+
+MIRROR_DIRECTORY = os.path.join(os.path.expanduser("~"), '.cache', 'pymol_structures')
+MAX_MIRROR_BYTES = 5 * 1024**3 #5 GB
+SOURCE = "https://files.rcsb.org/download/{CODE}.{ext}"
+OFFLINE = False
+PREFETCH_WORKERS = 8
+TIMEOUT = 60 #seconds per download
+#fetch types that the mirror stores, other types (maps, assemblies...) go to PyMOL's fetch
+FETCH_TYPES = {'': 'cif', 'cif': 'cif', 'mmcif': 'cif', 'pdb': 'pdb'}
+
+CACHE_STATS = {'hits': 0, 'downloads': 0, 'failures': 0, 'evictions': 0}
+#Downloads of the same entry are serialised by a fixed pool of lock stripes
+LOCK_STRIPES = 64
+_locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+
+def set_structure_source(source:str=None, offline:str=None):
+    """
+    Inputs: URL template with {code}/{CODE} and {ext}, and optionally on/off for offline mode
+    e.g. set_structure_source http://localhost:8000/{code}.{ext}
+    """
+    global SOURCE, OFFLINE
+    if source:
+        SOURCE = source
+    if offline is not None:
+        OFFLINE = str(offline).strip().lower() in ('on', '1', 'true', 'yes')
+    print(f"Structure source: {SOURCE if isinstance(SOURCE, str) else SOURCE.__name__}, offline: {OFFLINE}", flush=True)
+
+def mirror_path(code:str, ext:str='cif'):
+    return os.path.join(MIRROR_DIRECTORY, f"{code.lower()}.{ext}.gz")
+
+def _lock_for(path:str):
+    return _locks[hash(path) % LOCK_STRIPES]
+
+def download(code:str, ext:str='cif'):
+    """
+    Input: Entry ID and file type (cif or pdb)
+    Returns: the file contents from SOURCE as bytes (gzip or plain)
+    """
+    if callable(SOURCE):
+        return SOURCE(code, ext)
+    url = SOURCE.format(code=code.lower(), CODE=code.upper(), ext=ext)
+    with urllib.request.urlopen(url, timeout=TIMEOUT) as response:
+        return response.read()
+
+def get_structure(code:str, ext:str='cif'):
+    """
+    Input: Entry ID and file type (cif or pdb)
+    Returns: path of the compressed file in the mirror, downloaded if needed
+    Raises FileNotFoundError when it is not mirrored and OFFLINE is on
+    """
+    path = mirror_path(code, ext)
+    with _lock_for(path):
+        if pymol_disk_cache.touch(path):
+            CACHE_STATS['hits'] += 1
+            return path
+        if OFFLINE:
+            raise FileNotFoundError(f"{code}.{ext} is not in the mirror {MIRROR_DIRECTORY} (offline)")
+
+        try:
+            data = download(code, ext)
+        except Exception:
+            CACHE_STATS['failures'] += 1
+            raise
+        if data[:2] != b'\x1f\x8b':
+            data = gzip.compress(data)
+        pymol_disk_cache.write_atomic(path, data) #Never leave a half written entry
+        CACHE_STATS['downloads'] += 1
+    CACHE_STATS['evictions'] += pymol_disk_cache.evict(MIRROR_DIRECTORY, '.gz', MAX_MIRROR_BYTES)
+    return path
+
+def prefetch(codes, ext:str='cif', workers:int=PREFETCH_WORKERS):
+    """
+    Inputs: Space separated IDs (or a list), file type and number of download threads
+    e.g. prefetch 1ema 9ax6 9cor
+    Downloads every entry that is not mirrored yet, concurrently.
+    Returns: dictionary of ID -> mirror path (None if it failed)
+    """
+    if isinstance(codes, str):
+        codes = codes.replace(',', ' ').split()
+    codes = list(dict.fromkeys(code.lower() for code in codes))
+    start = time.perf_counter()
+
+    def fetch_one(code):
+        try:
+            return code, get_structure(code, ext)
+        except Exception as error:
+            print(f"Prefetch of {code} failed: {error}", flush=True)
+            return code, None
+    with ThreadPoolExecutor(max_workers=max(1, min(int(workers), len(codes) or 1))) as pool:
+        paths = dict(pool.map(fetch_one, codes))
+
+    mirrored = sum(1 for path in paths.values() if path)
+    print(f"Prefetched {mirrored}/{len(codes)} entries in {time.perf_counter() - start:.1f} s", flush=True)
+    return paths
+
+def cached_fetch(load, code, name='', state=0, finish=1, discrete=-1, multiplex=-2, zoom=-1,
+                 type='', async_=0, path='', file=None, quiet=1, **kwargs):
+    """
+    Inputs: The load function to use and the arguments of cmd.fetch
+    Loads the entries from the mirror, downloading the missing ones concurrently.
+    Returns: list of loaded object names, or None if this fetch needs
+    PyMOL's own fetch (other types, files, chain suffixes, or entries that
+    could not be mirrored, e.g. offline or the source is unreachable)
+    """
+    ext = FETCH_TYPES.get(str(type).lower())
+    codes = str(code).replace(',', ' ').split()
+    if ext is None or file or not codes or any(len(code) != 4 or not code.isalnum() for code in codes):
+        return None
+    if name and len(codes) > 1:
+        return None
+
+    if len(codes) > 1:
+        paths = prefetch(codes, ext)
+    else:
+        try:
+            paths = {codes[0].lower(): get_structure(codes[0], ext)}
+        except Exception as error:
+            print(f"Mirror fetch of {codes[0]} failed, using PyMOL's fetch: {error}", flush=True)
+            return None
+    if not all(paths.get(code.lower()) for code in codes):
+        return None
+    object_names = []
+    for code in codes:
+        object_name = name or code
+        load(paths[code.lower()], object_name, state=int(state), finish=finish, discrete=discrete,
+             quiet=quiet, multiplex=multiplex, zoom=zoom)
+        object_names.append(object_name)
+    return object_names
+
+def structure_cache_stats():
+    """
+    Prints and returns the counters and the size of the mirror
+    """
+    entries, size = pymol_disk_cache.usage(MIRROR_DIRECTORY, '.gz')
+    print(f"Structure mirror: {CACHE_STATS['hits']} hits, {CACHE_STATS['downloads']} downloads, "
+          f"{CACHE_STATS['failures']} failures, {CACHE_STATS['evictions']} evictions", flush=True)
+    print(f"{entries} entries, {size / 1024**2:.1f} of {MAX_MIRROR_BYTES / 1024**2:.0f} MB in {MIRROR_DIRECTORY}", flush=True)
+    return dict(CACHE_STATS, entries=entries, bytes=size)
+
+cmd.extend("prefetch", prefetch)
+cmd.extend("set_structure_source", set_structure_source)
+cmd.extend("structure_cache_stats", structure_cache_stats)
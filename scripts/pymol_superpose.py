@@ -0,0 +1,246 @@
+from pymol import cmd
+import os
+import time
+import numpy as np
+
+"""
+Batched superposition of a series of structures onto a reference.
+The CA atoms of every object are pulled in one iterate_state call, the
+residues of each object are paired with the reference by chain and residue
+number or by a global sequence alignment, and all the Kabsch fits are solved
+together on padded NumPy arrays (with the outlier rejection cycles of
+cmd.align). Every structure is then moved with one homogeneous 4x4
+transform_object, the objects the load hook made from it (chain copies
+{name}_A, {name}_organics...) move with their parent. After superpose_all
+one view, e.g. the lesson 3 CURRENT_VIEW, fits the whole series.
+
+e.g. superpose_all 1EMA, mapping=sequence
+"""
+
+MAPPING = 'number' #number: same chain and residue number, sequence: global sequence alignment
+CYCLES = 5
+CUTOFF = 2.0 #Outlier rejection in RMS units, like cmd.align
+MIN_PAIRS = 3
+MAX_ALIGNMENT_CELLS = 25000000 #Larger sequence alignments fall back to residue numbers
+#Needleman-Wunsch scores
+MATCH, MISMATCH, GAP = 2, -1, -2
+#Objects the load hook and the figures make from a structure, besides one per chain
+COMPANION_SUFFIXES = ('organics', 'inorganics', 'active_site_water', 'active_site_residues', 'transparent')
+
+ONE_LETTER = {'ALA': 'A', 'ARG': 'R', 'ASN': 'N', 'ASP': 'D', 'CYS': 'C', 'GLN': 'Q', 'GLU': 'E', 'GLY': 'G',
+              'HIS': 'H', 'ILE': 'I', 'LEU': 'L', 'LYS': 'K', 'MET': 'M', 'PHE': 'F', 'PRO': 'P', 'SER': 'S',
+              'THR': 'T', 'TRP': 'W', 'TYR': 'Y', 'VAL': 'V', 'MSE': 'M', 'SEC': 'U', 'PYL': 'O'}
+
+_REFERENCES = {} #Reference file or code -> CA atoms, so batch workers load it once
+
+def ca_atoms(objects:list, state:int=1):
+    """
+    Input: Object names
+    Returns: dictionary of object -> {'keys': [(chain, resi)], 'sequence': str, 'coords': (N, 3) array}
+    """
+    atoms = {name: {'keys': [], 'sequence': [], 'coords': []} for name in objects}
+    if not objects:
+        return atoms
+    cmd.iterate_state(state, f"({' or '.join(objects)}) and polymer.protein and name CA and not alt B",
+                      "atoms[model]['keys'].append((chain, resi)); atoms[model]['sequence'].append(resn); "
+                      "atoms[model]['coords'].append((x, y, z))", space={'atoms': atoms})
+    for item in atoms.values():
+        item['sequence'] = ''.join(ONE_LETTER.get(resn, 'X') for resn in item['sequence'])
+        item['coords'] = np.array(item['coords'], dtype=float).reshape(-1, 3)
+    return atoms
+
+def align_sequences(first:str, second:str):
+    """
+    Inputs: Two one letter sequences
+    Global alignment with linear gaps, every row of the score matrix in one NumPy step.
+    Returns: (indices in first, indices in second) of the aligned residues
+    """
+    first_codes = np.frombuffer(first.encode(), dtype=np.uint8)
+    second_codes = np.frombuffer(second.encode(), dtype=np.uint8)
+    rows, columns = len(first), len(second)
+    positions = np.arange(columns + 1)
+    scores = np.zeros((rows + 1, columns + 1), dtype=np.int32)
+    scores[0] = GAP * positions
+    for row in range(1, rows + 1):
+        substitution = np.where(second_codes == first_codes[row - 1], MATCH, MISMATCH)
+        best = np.empty(columns + 1, dtype=np.int32)
+        best[0] = GAP * row
+        best[1:] = np.maximum(scores[row - 1, :-1] + substitution, scores[row - 1, 1:] + GAP)
+        #Gaps along the row: the best of every earlier cell plus the gap penalty for the distance
+        scores[row] = np.maximum.accumulate(best - GAP * positions) + GAP * positions
+
+    first_indices, second_indices = [], []
+    row, column = rows, columns
+    while row > 0 and column > 0:
+        score = scores[row, column]
+        if score == scores[row - 1, column - 1] + (MATCH if first[row - 1] == second[column - 1] else MISMATCH):
+            row, column = row - 1, column - 1
+            first_indices.append(row)
+            second_indices.append(column)
+        elif score == scores[row - 1, column] + GAP:
+            row -= 1
+        else:
+            column -= 1
+    return np.array(first_indices[::-1], dtype=np.int64), np.array(second_indices[::-1], dtype=np.int64)
+
+def map_residues(mobile:dict, reference:dict, mapping:str=MAPPING):
+    """
+    Inputs: CA atoms of a structure and of the reference (from ca_atoms) and the mapping
+    Returns: (mobile indices, reference indices) of the paired CA atoms
+    """
+    if mapping == 'sequence' and len(mobile['sequence']) * len(reference['sequence']) <= MAX_ALIGNMENT_CELLS:
+        return align_sequences(mobile['sequence'], reference['sequence'])
+    lookup = {key: index for index, key in enumerate(reference['keys'])}
+    pairs = [(index, lookup[key]) for index, key in enumerate(mobile['keys']) if key in lookup]
+    if not pairs:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    mobile_indices, reference_indices = zip(*pairs)
+    return np.array(mobile_indices, dtype=np.int64), np.array(reference_indices, dtype=np.int64)
+
+def kabsch(mobile, reference, weights):
+    """
+    Inputs: (K, N, 3) mobile and reference coordinates and (K, N) weights (0 for padding and outliers)
+    Returns: (K, 3, 3) rotations and (K, 3) translations with reference ~ rotation @ mobile + translation
+    """
+    total = np.maximum(weights.sum(axis=1), 1e-12)[:, None]
+    mobile_centre = np.einsum('kn,kni->ki', weights, mobile) / total
+    reference_centre = np.einsum('kn,kni->ki', weights, reference) / total
+    covariance = np.einsum('kn,kni,knj->kij', weights, mobile - mobile_centre[:, None], reference - reference_centre[:, None])
+    u, _, vt = np.linalg.svd(covariance)
+    v = np.transpose(vt, (0, 2, 1))
+    sign = np.sign(np.linalg.det(v @ np.transpose(u, (0, 2, 1))))
+    correction = np.tile(np.eye(3), (len(mobile), 1, 1))
+    correction[:, 2, 2] = np.where(sign == 0, 1, sign) #No reflections
+    rotations = v @ correction @ np.transpose(u, (0, 2, 1))
+    translations = reference_centre - np.einsum('kij,kj->ki', rotations, mobile_centre)
+    return rotations, translations
+
+def fit_all(pairs:list, cycles:int=CYCLES, cutoff:float=CUTOFF):
+    """
+    Input: List of (mobile coordinates, reference coordinates) of the paired atoms, one per structure
+    Fits every structure at once, then drops the pairs further apart than
+    cutoff x RMSD and fits again, for the given number of cycles.
+    Returns: (K, 4, 4) homogeneous matrices, RMSD and number of pairs used per structure
+    """
+    count, width = len(pairs), max(len(mobile) for mobile, _ in pairs)
+    mobile, reference = np.zeros((count, width, 3)), np.zeros((count, width, 3))
+    weights = np.zeros((count, width))
+    for index, (mobile_coords, reference_coords) in enumerate(pairs):
+        mobile[index, :len(mobile_coords)] = mobile_coords
+        reference[index, :len(reference_coords)] = reference_coords
+        weights[index, :len(mobile_coords)] = 1.0
+
+    for cycle in range(int(cycles) + 1):
+        rotations, translations = kabsch(mobile, reference, weights)
+        fitted = np.einsum('kij,knj->kni', rotations, mobile) + translations[:, None]
+        distances = np.linalg.norm(fitted - reference, axis=2)
+        rmsd = np.sqrt((weights * distances ** 2).sum(axis=1) / np.maximum(weights.sum(axis=1), 1e-12))
+        if cycle == int(cycles):
+            break
+        kept = weights * (distances <= float(cutoff) * rmsd[:, None])
+        enough = kept.sum(axis=1) >= MIN_PAIRS
+        changed = enough & (kept.sum(axis=1) < weights.sum(axis=1))
+        if not changed.any():
+            break
+        weights[changed] = kept[changed]
+
+    matrices = np.tile(np.eye(4), (count, 1, 1))
+    matrices[:, :3, :3] = rotations
+    matrices[:, :3, 3] = translations
+    return matrices, rmsd, weights.sum(axis=1).astype(int)
+
+def is_companion(name:str, parent:str, chains):
+    """
+    Inputs: Object name, possible parent object and the chains of the parent
+    Returns: True if the object is made from the parent by the load hook or the
+    lesson 3 figures ({parent}_A, {parent}_organics, {parent}_A_transparent...),
+    not a structure of its own such as {parent}_apo
+    """
+    if name == parent or not name.startswith(f"{parent}_"):
+        return False
+    suffix = name[len(parent) + 1:]
+    if suffix.endswith('_transparent'):
+        suffix = suffix[:-len('_transparent')]
+    return suffix in COMPANION_SUFFIXES or suffix in chains
+
+def top_level_objects(names:list):
+    """
+    Returns: the objects that are not companions of another object in the list
+    """
+    chains = {name: cmd.get_chains(name) for name in names}
+    return [name for name in names if not any(is_companion(name, other, chains[other]) for other in names)]
+
+def companions(name:str, names:list):
+    chains = cmd.get_chains(name)
+    return [other for other in names if is_companion(other, name, chains)]
+
+def superpose_to(reference:dict, fits:dict, mapping:str=MAPPING, cycles:int=CYCLES, cutoff:float=CUTOFF):
+    """
+    Inputs: CA atoms of the reference, dictionary of object to fit -> objects to move
+    with it, the residue mapping and the outlier rejection
+    Returns: dictionary of object -> {'rmsd', 'pairs', 'matrix'} for the structures that were moved
+    """
+    atoms = ca_atoms(list(fits))
+    names, pairs = [], []
+    for name in fits:
+        mobile_indices, reference_indices = map_residues(atoms[name], reference, mapping)
+        if len(mobile_indices) < MIN_PAIRS:
+            print(f"Skipping {name}: {len(mobile_indices)} residues pair with the reference", flush=True)
+            continue
+        names.append(name)
+        pairs.append((atoms[name]['coords'][mobile_indices], reference['coords'][reference_indices]))
+    if not names:
+        return {}
+
+    matrices, rmsd, used = fit_all(pairs, cycles, cutoff)
+    results = {}
+    for name, matrix, deviation, count in zip(names, matrices, rmsd, used):
+        for moved in fits[name]:
+            cmd.transform_object(moved, matrix.flatten().tolist(), state=0, homogenous=1)
+        results[name] = {'rmsd': float(deviation), 'pairs': int(count), 'matrix': matrix.tolist()}
+    return results
+
+def reference_atoms(reference:str, state:int=1):
+    """
+    Input: Reference file or PDB code
+    Loads it without the load hook, once per process
+    Returns: CA atoms of the reference
+    """
+    import pymol
+    if reference in _REFERENCES:
+        return _REFERENCES[reference]
+    name = '_superpose_reference'
+    if os.path.exists(os.path.expanduser(reference)):
+        getattr(pymol, '_original_load', cmd.load)(os.path.expanduser(reference), name)
+    else:
+        getattr(pymol, '_original_fetch', cmd.fetch)(reference, name)
+    _REFERENCES[reference] = ca_atoms([name], state)[name]
+    cmd.delete(name)
+    return _REFERENCES[reference]
+
+def superpose_all(reference:str, objects:str='', mapping:str=MAPPING, cycles:int=CYCLES, cutoff:float=CUTOFF, zoom:int=1):
+    """
+    Inputs: Reference object, objects to superpose (default: every other structure),
+    residue mapping (number or sequence), outlier rejection cycles and cutoff, and 1 to zoom on the series
+    e.g. superpose_all 1EMA, mapping=sequence
+    Returns: dictionary of object -> RMSD, pairs and matrix
+    """
+    start = time.perf_counter()
+    names = cmd.get_names('objects')
+    if reference not in names:
+        print(f"Reference object {reference} not found", flush=True)
+        return {}
+    chosen = objects.replace(',', ' ').split() if objects else top_level_objects(names)
+    reference_chains = cmd.get_chains(reference)
+    mobile = [name for name in chosen if name != reference and not is_companion(name, reference, reference_chains)]
+    fits = {name: [name] + companions(name, names) for name in mobile}
+    results = superpose_to(ca_atoms([reference])[reference], fits, mapping, int(cycles), float(cutoff))
+    for name, result in results.items():
+        print(f"{name:<24} RMSD {result['rmsd']:6.2f} over {result['pairs']:>5} CA", flush=True)
+    print(f"Superposed {len(results)} of {len(mobile)} structures onto {reference} in {time.perf_counter() - start:.2f} s",
+          flush=True)
+    if int(zoom) and results:
+        cmd.zoom(' or '.join([reference] + list(results)))
+    return results
+
+cmd.extend("superpose_all", superpose_all)
@@ -0,0 +1,129 @@
+from pymol import cmd
+import fnmatch
+import json
+import os
+
+"""
+Named views per structure, stored on disk so they survive sessions.
+The registry is a JSON file of structure -> view name -> 18 get_view values.
+view_series adds an orbit (turns about y) or tilt (turns about x) series
+around the current view, e.g. orbit_000 ... orbit_007.
+Lesson 3 run_views renders every figure layer for all the views of a structure.
+
+e.g. store_view 1EMA_A, front
+     view_series 1EMA_A, orbit, 8
+     run_views 1EMA_A 1EMA_organics 1EMA_active_site_residues
+"""
+
+VIEW_REGISTRY = os.path.join(os.path.expanduser("~"), '.pymol', 'views.json')
+#Axis and default angle range in degrees per series kind
+SERIES = {'orbit': ('y', 360.0), 'tilt': ('x', 30.0)}
+
+def load_registry():
+    """
+    Returns: dictionary of structure -> view name -> view
+    """
+    if not os.path.exists(VIEW_REGISTRY):
+        return {}
+    with open(VIEW_REGISTRY) as handle:
+        return json.load(handle)
+
+def save_registry(registry:dict):
+    os.makedirs(os.path.dirname(VIEW_REGISTRY), exist_ok=True)
+    temporary = f"{VIEW_REGISTRY}.{os.getpid()}.tmp"
+    with open(temporary, 'w') as handle:
+        json.dump(registry, handle, indent=1)
+    os.replace(temporary, VIEW_REGISTRY) #Never leave a half written registry
+
+def store_view(structure:str, name:str, view=None):
+    """
+    Inputs: Structure (e.g. the protein object), view name and the view (defaults to the current one)
+    e.g. store_view 1EMA_A, front
+    """
+    registry = load_registry()
+    registry.setdefault(structure, {})[name] = [float(value) for value in (view or cmd.get_view())]
+    save_registry(registry)
+    print(f"Stored view {name} for {structure}", flush=True)
+
+def get_views(structure:str, pattern:str='*'):
+    """
+    Inputs: Structure and a view name pattern (e.g. orbit_*)
+    Returns: dictionary of view name -> view tuple, sorted by name
+    """
+    views = load_registry().get(structure, {})
+    return {name: tuple(views[name]) for name in sorted(views) if fnmatch.fnmatch(name, pattern)}
+
+def recall_view(structure:str, name:str):
+    """
+    Inputs: Structure and view name
+    Sets the stored view
+    """
+    views = get_views(structure, name)
+    if name not in views:
+        print(f"No view {name} stored for {structure}", flush=True)
+        return
+    cmd.set_view(views[name])
+
+def list_views(structure:str=''):
+    """
+    Input: Structure (all structures if empty)
+    Prints and returns the stored view names
+    """
+    registry = load_registry()
+    structures = [structure] if structure else sorted(registry)
+    names = {name: sorted(registry.get(name, {})) for name in structures}
+    for name, view_names in names.items():
+        print(f"{name}: {', '.join(view_names) or 'no views'}", flush=True)
+    return names
+
+def delete_views(structure:str, pattern:str='*'):
+    """
+    Inputs: Structure and a view name pattern
+    e.g. delete_views 1EMA_A, orbit_*
+    """
+    registry = load_registry()
+    views = registry.get(structure, {})
+    deleted = [name for name in list(views) if fnmatch.fnmatch(name, pattern)]
+    for name in deleted:
+        del views[name]
+    if not views:
+        registry.pop(structure, None)
+    save_registry(registry)
+    print(f"Deleted {len(deleted)} views of {structure}", flush=True)
+
+def view_series(structure:str, kind:str='orbit', steps:int=8, degrees:float=None, prefix:str=''):
+    """
+    Inputs: Structure, orbit or tilt, number of views, angle range in degrees
+    (360 for an orbit, 30 for a tilt from -15 to +15) and the name prefix (defaults to the kind)
+    Stores the series around the current view.
+    Returns: dictionary of view name -> view
+    """
+    if kind not in SERIES:
+        print(f"Unknown series {kind}, choose from: {', '.join(SERIES)}", flush=True)
+        return {}
+    axis, default_degrees = SERIES[kind]
+    steps, degrees = max(1, int(steps)), float(degrees if degrees is not None else default_degrees)
+    if kind == 'orbit':
+        angles = [degrees * step / steps for step in range(steps)]
+    else:
+        angles = [degrees * (step / max(1, steps - 1) - 0.5) for step in range(steps)]
+
+    base = cmd.get_view()
+    views = {}
+    for step, angle in enumerate(angles):
+        cmd.set_view(base)
+        cmd.turn(axis, angle)
+        views[f"{prefix or kind}_{step:03d}"] = [float(value) for value in cmd.get_view()]
+    cmd.set_view(base)
+
+    registry = load_registry()
+    registry.setdefault(structure, {}).update(views)
+    save_registry(registry)
+    print(f"Stored {len(views)} {kind} views for {structure}", flush=True)
+    return views
+
+cmd.extend("store_view", store_view)
+cmd.extend("recall_view", recall_view)
+cmd.extend("list_views", list_views)
+cmd.extend("delete_views", delete_views)
+cmd.extend("view_series", view_series)
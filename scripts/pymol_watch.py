@@ -0,0 +1,276 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import queue
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pymol_batch
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    FileSystemEventHandler, Observer = object, None
+
+"""
+Watch-folder mode for the lesson 3 figure pipeline.
+Structures dropped into the watched directory are loaded through the
+.pymolrc.py load hook and rendered by headless PyMOL workers (the same
+run_job as pymol_batch.py), as they arrive.
+New and changed files are picked up with inotify (watchdog) or, when
+watchdog is not installed, by polling the directory every POLL_SECONDS. A
+file is only rendered once its size and modification time have not changed
+for SETTLE_SECONDS, so a file that is still being written is left alone.
+Files are identified by the SHA-256 of their content: a copy or a rename of a
+structure that was already rendered is skipped. The record of what was
+rendered (RECORD_NAME in the output directory) is saved after every job, so a
+restart only renders what is new.
+
+The job columns of pymol_batch.py (protein, ligand, active_site, residues,
+view, layers, reference) are the same for every file and can use {name}.
+
+Usage from a shell (use the python that PyMOL is installed into):
+    python pymol_watch.py ~/incoming --output-dir ~/tmp/watch
+    python pymol_watch.py ~/incoming --protein {name}_A --ligand {name}_organics --once
+"""
+
+#Watch Settings
+WATCH_EXTENSIONS = ('.pdb', '.ent', '.cif', '.mmcif', '.pdb.gz', '.ent.gz', '.cif.gz', '.bcif')
+SETTLE_SECONDS = 5.0 #A file must be unchanged this long before it is rendered
+POLL_SECONDS = 2.0
+WORKERS = 1
+OUTPUT_DIRECTORY = os.path.join(os.path.expanduser("~"), 'tmp', 'watch')
+RECORD_NAME = 'watch_record.json'
+#Job columns for every file (see pymol_batch.py)
+JOB_TEMPLATE = {'protein': '{name}', 'ligand': '{name}_organics', 'active_site': '',
+                'residues': 'byres (all within 5 of {name}_organics)'}
+
+# ==== Record ====
+def load_record(path:str):
+    """
+    Returns: the record of rendered files {'files': path -> file state, 'rendered': sha256 -> result}
+    """
+    if not os.path.exists(path):
+        return {'files': {}, 'rendered': {}}
+    with open(path) as handle:
+        return json.load(handle)
+
+def save_record(path:str, record:dict):
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, 'w') as handle:
+        json.dump(record, handle, indent=2)
+    os.replace(temporary, path)
+
+def file_hash(path:str, block_size:int=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as handle:
+        for block in iter(lambda: handle.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def is_structure(path:str):
+    name = os.path.basename(path).lower()
+    return name.endswith(WATCH_EXTENSIONS) and not name.startswith('.')
+
+def scan(directory:str):
+    """
+    Returns: dictionary of structure path -> (size, mtime) under the directory
+    """
+    found = {}
+    for root, _, names in os.walk(directory):
+        for name in names:
+            path = os.path.join(root, name)
+            if is_structure(path):
+                try:
+                    info = os.stat(path)
+                except OSError: #Removed while scanning
+                    continue
+                found[path] = (info.st_size, info.st_mtime)
+    return found
+
+# ==== Change detection ====
+class _ChangeHandler(FileSystemEventHandler):
+    """Puts the path of every created, modified or moved structure on a queue"""
+    def __init__(self, changes:queue.Queue):
+        self.changes = changes
+
+    def on_any_event(self, event):
+        if event.is_directory:
+            return
+        path = getattr(event, 'dest_path', '') or event.src_path
+        if is_structure(path):
+            self.changes.put(path)
+
+class Debouncer:
+    """
+    Tracks candidate files until their size and mtime have been stable for settle seconds
+    """
+    def __init__(self, settle:float=SETTLE_SECONDS):
+        self.settle = settle
+        self.pending = {} #path -> ((size, mtime), time it last changed)
+
+    def touch(self, path:str, state=None):
+        if state is None:
+            try:
+                info = os.stat(path)
+            except OSError:
+                self.pending.pop(path, None)
+                return
+            state = (info.st_size, info.st_mtime)
+        previous = self.pending.get(path)
+        if previous is None or previous[0] != state:
+            self.pending[path] = (state, time.monotonic())
+
+    def ready(self):
+        """
+        Returns: list of (path, (size, mtime)) of the pending files that have settled (and drops them from pending)
+        """
+        now, settled = time.monotonic(), []
+        for path, (state, changed) in list(self.pending.items()):
+            self.touch(path)
+            if path not in self.pending or self.pending[path][1] != changed:
+                continue
+            if now - changed >= self.settle:
+                settled.append((path, state))
+                del self.pending[path]
+        return settled
+
+# ==== Watcher ====
+def make_watch_job(path:str, template:dict):
+    row = dict(template, file=path)
+    row.setdefault('name', os.path.basename(path).split('.')[0])
+    return pymol_batch.make_job(row)
+
+def watch(directory:str, output_dir:str=OUTPUT_DIRECTORY, template:dict=None, workers:int=WORKERS,
+          rc_path:str=pymol_batch.RC_PATH, settle:float=SETTLE_SECONDS, poll:float=POLL_SECONDS,
+          once:bool=False, retry_failed:bool=False):
+    """
+    Inputs: Directory to watch, output directory, job columns, worker processes,
+    the .pymolrc.py to run in each worker, debounce and poll seconds, True to
+    render what is there and stop, and True to render failed files again
+    Renders every new or changed structure until interrupted (Ctrl+C).
+    Returns: the record dictionary
+    """
+    directory = os.path.abspath(os.path.expanduser(directory))
+    output_dir = os.path.abspath(os.path.expanduser(output_dir))
+    os.makedirs(output_dir, exist_ok=True)
+    template = dict(JOB_TEMPLATE if template is None else template)
+    record_path = os.path.join(output_dir, RECORD_NAME)
+    record = load_record(record_path)
+    if retry_failed:
+        record['rendered'] = {digest: result for digest, result in record['rendered'].items() if result['ok']}
+
+    debouncer, changes, observer = Debouncer(settle), queue.Queue(), None
+    known = scan(directory)
+    for path, state in known.items():
+        #Files that changed (or arrived) while the watcher was not running
+        seen = record['files'].get(path, {})
+        if seen.get('state') != list(state) or (seen.get('sha256') not in record['rendered'] and 'error' not in seen):
+            debouncer.touch(path, state)
+    if not once and Observer is not None:
+        observer = Observer()
+        observer.schedule(_ChangeHandler(changes), directory, recursive=True)
+        observer.start()
+    mode = 'render existing files' if once else 'inotify' if observer else f"polling every {poll:g} s"
+    print(f"Watching {directory} ({mode}), {len(debouncer.pending)} files to check, images in {output_dir}", flush=True)
+
+    context = multiprocessing.get_context('spawn')
+    pool = ProcessPoolExecutor(max_workers=max(1, int(workers)), mp_context=context,
+                               initializer=pymol_batch.start_headless_pymol, initargs=(rc_path,))
+    running = {} #future -> (path, sha256, file state)
+    last_poll = time.monotonic()
+    try:
+        while True:
+            if observer is not None:
+                try:
+                    while True:
+                        debouncer.touch(changes.get(timeout=0.5 if debouncer.pending or running else poll))
+                except queue.Empty:
+                    pass
+            elif not once and time.monotonic() - last_poll >= poll:
+                current = scan(directory)
+                for path, state in current.items():
+                    if known.get(path) != state:
+                        debouncer.touch(path, state)
+                known, last_poll = current, time.monotonic()
+
+            for path, state in debouncer.ready():
+                state = list(state)
+                try:
+                    digest = file_hash(path) if state[0] else None
+                except FileNotFoundError: #Removed before it settled
+                    continue
+                except OSError as error:
+                    digest = None
+                    print(f"Cannot read {path}: {error}", flush=True)
+                if digest is None:
+                    #Empty or unreadable, failed until the file changes
+                    record['files'][path] = {'sha256': None, 'state': state, 'error': 'empty or unreadable file'}
+                    save_record(record_path, record)
+                    print(f"{os.path.basename(path):<24} {0.0:8.2f} s  FAILED (empty or unreadable file)", flush=True)
+                    continue
+                done = record['rendered'].get(digest)
+                record['files'][path] = {'sha256': digest, 'state': state}
+                if done or digest in (item[1] for item in running.values()):
+                    if done:
+                        print(f"Skipping {path}: already rendered as {done['name']}", flush=True)
+                    continue
+                try:
+                    job = make_watch_job(path, template)
+                except (KeyError, ValueError) as error:
+                    print(f"Skipping {path}: {error}", flush=True)
+                    continue
+                print(f"Rendering {path}", flush=True)
+                running[pool.submit(pymol_batch.run_job, job, output_dir)] = (path, digest, state)
+
+            for future in [future for future in running if future.done()]:
+                path, digest, state = running.pop(future)
+                try:
+                    result = future.result()
+                except Exception as error:
+                    #The worker process itself died
+                    result = {'name': os.path.basename(path).split('.')[0], 'file': path, 'ok': False,
+                              'error': f"{type(error).__name__}: {error}", 'images': [], 'seconds': 0.0}
+                result['rendered_at'] = time.time()
+                record['rendered'][digest] = result
+                save_record(record_path, record)
+                status = 'ok' if result['ok'] else f"FAILED ({result['error']})"
+                print(f"{result['name']:<24} {result['seconds']:8.2f} s  {status}", flush=True)
+
+            if once and not debouncer.pending and not running:
+                save_record(record_path, record)
+                return record
+            if observer is None:
+                time.sleep(min(poll, 0.5))
+    except KeyboardInterrupt:
+        print("Stopping, unfinished files are rendered on the next start", flush=True)
+    finally:
+        if observer is not None:
+            observer.stop()
+            observer.join()
+        pool.shutdown(wait=False, cancel_futures=True)
+    return record
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="Render the lesson 3 figures for structures as they arrive in a directory")
+    parser.add_argument('directory', help="Directory to watch (searched recursively)")
+    parser.add_argument('--output-dir', default=OUTPUT_DIRECTORY)
+    parser.add_argument('--workers', type=int, default=WORKERS)
+    parser.add_argument('--rc', default=pymol_batch.RC_PATH, help="pymolrc to run in each worker")
+    parser.add_argument('--settle', type=float, default=SETTLE_SECONDS, help="Seconds a file must be unchanged")
+    parser.add_argument('--poll', type=float, default=POLL_SECONDS, help="Seconds between scans without watchdog")
+    parser.add_argument('--once', action='store_true', help="Render the files that are there and stop")
+    parser.add_argument('--retry-failed', action='store_true', help="Render files that failed before again")
+    for column in ('protein', 'ligand', 'active_site', 'residues', 'view', 'layers', 'reference'):
+        parser.add_argument(f"--{column.replace('_', '-')}", default=JOB_TEMPLATE.get(column))
+    options = parser.parse_args()
+    template = {column: getattr(options, column) for column in
+                ('protein', 'ligand', 'active_site', 'residues', 'view', 'layers', 'reference') if getattr(options, column)}
+    record = watch(options.directory, options.output_dir, template, options.workers, options.rc,
+                   options.settle, options.poll, options.once, options.retry_failed)
+    failed = any('error' in item for item in record['files'].values())
+    sys.exit(1 if failed or not all(result['ok'] for result in record['rendered'].values()) else 0)
@@ -0,0 +1,27 @@
+import os
+import sys
+import types
+
+"""
+The scripts are flat modules in scripts/, most of them import pymol.cmd at the
+top. Without PyMOL a minimal pymol.cmd is put in its place, so the NumPy and
+file helpers can be tested; anything that calls into PyMOL needs the real one.
+"""
+
+SCRIPTS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts')
+sys.path.insert(0, SCRIPTS)
+
+try:
+    import pymol
+    from pymol import cmd
+except ImportError:
+    def _missing(*args, **kwargs):
+        raise RuntimeError("PyMOL is not installed")
+
+    cmd = types.ModuleType('pymol.cmd')
+    cmd.extend = lambda name, function=None: function
+    cmd.__getattr__ = lambda name: _missing
+    pymol = types.ModuleType('pymol')
+    pymol.cmd = cmd
+    sys.modules['pymol'] = pymol
+    sys.modules['pymol.cmd'] = cmd
@@ -0,0 +1,34 @@
+import os
+
+import numpy as np
+
+import pymol_composite as composite
+import pymol_png
+
+class PngCmd:
+    """cmd.png that returns the PNG data when there is no file name, like recent PyMOL versions"""
+    def __init__(self, image):
+        self.image = image
+
+    def png(self, filename, **kwargs):
+        assert filename is None
+        return pymol_png.encode_png(self.image)
+
+def test_rendered_layers_are_composited_from_memory(tmp_path, monkeypatch):
+    image = np.zeros((4, 5, 4), dtype=np.uint8)
+    image[..., 1], image[..., 3] = 200, 255
+    monkeypatch.setattr(composite, 'cmd', PngCmd(image))
+    path = composite.render_png(str(tmp_path / '1EMA_4'))
+    assert path == str(tmp_path / '1EMA_4.png') and os.path.exists(path)
+    monkeypatch.setattr(composite, 'read_png', lambda path: None) #The file must not be read back
+    assert np.array_equal(composite.read_layer(path), image)
+
+def test_layers_written_since_are_read_from_disk(tmp_path, monkeypatch):
+    image = np.full((4, 5, 4), 255, dtype=np.uint8)
+    monkeypatch.setattr(composite, 'cmd', PngCmd(image))
+    path = composite.render_png(str(tmp_path / '1EMA_4.png'))
+    newer = np.zeros_like(image)
+    with open(path, 'wb') as handle:
+        handle.write(pymol_png.encode_png(newer))
+    os.utime(path, ns=(0, 0))
+    assert np.array_equal(composite.read_layer(path), newer)
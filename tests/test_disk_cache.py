@@ -0,0 +1,25 @@
+import os
+
+import pymol_disk_cache as disk_cache
+
+def test_evict_removes_least_recently_used(tmp_path):
+    for age, name in enumerate(('old', 'middle', 'new')):
+        path = tmp_path / f'{name}.png'
+        path.write_bytes(b'x' * 100)
+        os.utime(path, (age, age))
+    (tmp_path / 'other.txt').write_bytes(b'x' * 1000) #Not an entry
+    assert disk_cache.evict(str(tmp_path), '.png', 250) == 1
+    assert sorted(os.listdir(tmp_path)) == ['middle.png', 'new.png', 'other.txt']
+    assert disk_cache.usage(str(tmp_path), '.png') == (2, 200)
+
+def test_write_atomic_leaves_no_part_files(tmp_path):
+    path = str(tmp_path / 'cache' / 'entry.gz')
+    disk_cache.write_atomic(path, b'data')
+    source = tmp_path / 'image.png'
+    source.write_bytes(b'image')
+    disk_cache.write_atomic(str(tmp_path / 'cache' / 'image.png'), source=str(source))
+    assert sorted(os.listdir(tmp_path / 'cache')) == ['entry.gz', 'image.png']
+    assert open(path, 'rb').read() == b'data'
+    assert not disk_cache.touch(str(tmp_path / 'cache' / 'missing.png'))
+    disk_cache.clear(str(tmp_path / 'cache'))
+    assert disk_cache.usage(str(tmp_path / 'cache'), '.png') == (0, 0)
@@ -0,0 +1,26 @@
+import os
+import subprocess
+import sys
+
+import pymol_movie
+
+def fake_encoder(output):
+    """Stands in for ffmpeg: copies stdin to <output>.part"""
+    script = "import shutil, sys; shutil.copyfileobj(sys.stdin.buffer, open(sys.argv[1], 'wb'))"
+    return subprocess.Popen([sys.executable, '-c', script, output + '.part'], stdin=subprocess.PIPE)
+
+def test_complete_movie_replaces_output(tmp_path):
+    output = str(tmp_path / 'movie.mp4')
+    encoder = fake_encoder(output)
+    encoder.stdin.write(b'frames')
+    assert pymol_movie.finish_encoder(encoder, output, complete=True)
+    assert open(output, 'rb').read() == b'frames' and not os.path.exists(output + '.part')
+
+def test_incomplete_movie_keeps_previous_output(tmp_path):
+    output = str(tmp_path / 'movie.mp4')
+    with open(output, 'wb') as handle:
+        handle.write(b'previous')
+    encoder = fake_encoder(output)
+    encoder.stdin.write(b'half')
+    assert not pymol_movie.finish_encoder(encoder, output, complete=False)
+    assert open(output, 'rb').read() == b'previous' and not os.path.exists(output + '.part')
@@ -0,0 +1,69 @@
+import numpy as np
+
+import pymol_neighbours as neighbours
+
+def brute_force(points, centres, cutoff):
+    distances = np.linalg.norm(points[:, None] - centres[None], axis=2).min(axis=1)
+    distances[distances > cutoff] = np.inf
+    return distances
+
+def test_nearest_distances_matches_brute_force():
+    generator = np.random.default_rng(4)
+    for cutoff in (1.0, 3.5, 7.0):
+        points = generator.uniform(-20, 20, size=(2000, 3))
+        centres = generator.uniform(-5, 5, size=(60, 3))
+        found = neighbours.nearest_distances(points, centres, cutoff)
+        expected = brute_force(points, centres, cutoff)
+        assert np.array_equal(np.isfinite(found), np.isfinite(expected))
+        assert np.allclose(found[np.isfinite(found)], expected[np.isfinite(expected)])
+        assert np.isfinite(found).any()
+
+def test_nearest_distances_crowded_cells_and_edges():
+    #Many centres in one cell, points exactly at the cutoff and on cell borders
+    centres = np.vstack([np.zeros((50, 3)) + 0.01 * np.arange(50)[:, None], [[10.0, 0.0, 0.0]]])
+    points = np.array([[3.5, 0.0, 0.0], [0.0, 0.0, 4.0], [13.5, 0.0, 0.0], [10.0, 3.5, 0.0], [30.0, 30.0, 30.0]])
+    found = neighbours.nearest_distances(points, centres, 3.5)
+    assert np.allclose(found, brute_force(points, centres, 3.5))
+
+def test_nearest_distances_empty_inputs():
+    assert neighbours.nearest_distances(np.zeros((0, 3)), np.ones((2, 3)), 3.5).shape == (0,)
+    assert np.all(np.isinf(neighbours.nearest_distances(np.ones((3, 3)), np.zeros((0, 3)), 3.5)))
+
+def test_index_selection_ranges():
+    assert neighbours.index_selection('1EMA', [9, 1, 2, 3, 4, 5, 5]) == '1EMA and index 1-5+9'
+    assert neighbours.index_selection('1EMA', []) == '1EMA and none'
+
+class PartialStateCmd:
+    """An object whose atoms 2 and 4 have no coordinates in the state"""
+    def __init__(self):
+        self.atoms = [(1, 'organic', (0.0, 0.0, 0.0)), (2, 'residues', None), (3, 'residues', (2.0, 0.0, 0.0)),
+                      (4, 'water', None), (5, 'water', (3.0, 0.0, 0.0)), (6, 'water', (9.0, 0.0, 0.0)),
+                      (7, 'residues', (20.0, 0.0, 0.0))]
+
+    def _category(self, selection):
+        return next(category for category, expression in neighbours.ATOM_CLASSES.items() if f"({expression})" in selection)
+
+    def _atoms(self, selection):
+        return [atom for atom in self.atoms if atom[1] == self._category(selection)]
+
+    def get_coords(self, selection, state):
+        return np.array([atom[2] for atom in self.atoms if atom[2] is not None])
+
+    def count_atoms(self, selection):
+        return len(self.atoms)
+
+    def index(self, selection):
+        return [('obj', atom[0]) for atom in self._atoms(selection)]
+
+    def iterate_state(self, state, selection, expression, space):
+        for index, _, xyz in self._atoms(selection):
+            if xyz is not None:
+                space['rows'].append((index,) + xyz)
+
+def test_find_active_site_with_missing_coordinates(monkeypatch):
+    monkeypatch.setattr(neighbours, 'cmd', PartialStateCmd())
+    neighbours.clear_neighbour_cache()
+    site = neighbours.find_active_site('obj', {'water': 3.5, 'inorganic': 3.5, 'residues': 3.5})
+    assert site['residues'].tolist() == [3]
+    assert site['water'].tolist() == [5]
+    assert site['organic'].tolist() == [1]
@@ -0,0 +1,106 @@
+import glob
+import os
+import struct
+import zlib
+
+import numpy as np
+import pytest
+
+import pymol_png
+
+def paeth(left, up, up_left):
+    estimate = left + up - up_left
+    distances = (abs(estimate - left), abs(estimate - up), abs(estimate - up_left))
+    return (left, up, up_left)[distances.index(min(distances))]
+
+def predictor(kind, row, previous, index, channels):
+    left = row[index - channels] if index >= channels else 0
+    up = previous[index]
+    up_left = previous[index - channels] if index >= channels else 0
+    return (0, left, up, (left + up) // 2, paeth(left, up, up_left))[kind]
+
+def reference_png(pixels, color_type, filters):
+    """PNG written one byte at a time, row r filtered with filters[r]"""
+    height, width, channels = pixels.shape
+    raw, previous = bytearray(), [0] * (width * channels)
+    for kind, row in zip(filters, pixels.reshape(height, -1).tolist()):
+        raw.append(kind)
+        raw += bytes((value - predictor(kind, row, previous, index, channels)) & 0xFF for index, value in enumerate(row))
+        previous = row
+    chunk = lambda kind, body: struct.pack('>I', len(body)) + kind + body + struct.pack('>I', zlib.crc32(kind + body))
+    header = struct.pack('>IIBBBBB', width, height, 8, color_type, 0, 0, 0)
+    return pymol_png.PNG_SIGNATURE + chunk(b'IHDR', header) + chunk(b'IDAT', zlib.compress(bytes(raw))) + chunk(b'IEND', b'')
+
+def reference_decode(data):
+    """Unfilters the RGBA rows of a PNG one byte at a time"""
+    width, height = struct.unpack('>II', data[16:24])
+    position, idat = 8, b''
+    while position < len(data):
+        length, kind = struct.unpack('>I4s', data[position:position + 8])
+        if kind == b'IDAT':
+            idat += data[position + 8:position + 8 + length]
+        position += 12 + length
+    raw, stride, rows, previous = zlib.decompress(idat), width * 4, [], [0] * (width * 4)
+    for r in range(height):
+        kind, filtered, row = raw[r * (stride + 1)], raw[r * (stride + 1) + 1:(r + 1) * (stride + 1)], []
+        for index, value in enumerate(filtered):
+            row.append((value + predictor(kind, row, previous, index, 4)) & 0xFF)
+        rows.append(row)
+        previous = row
+    return np.array(rows, dtype=np.uint8).reshape(height, width, 4)
+
+def sample_image(seed=6, height=12, width=9):
+    generator = np.random.default_rng(seed)
+    #Smooth gradients with noise, so every filter type is worth choosing somewhere
+    y, x = np.mgrid[:height, :width]
+    image = np.stack([x * 20, y * 15, (x + y) * 9, np.full_like(x, 200)], axis=2)
+    image = image + generator.integers(0, 4, size=image.shape) * (generator.random((height, 1, 1)) < 0.5)
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+@pytest.mark.parametrize('kind', range(5))
+def test_decode_every_filter(kind):
+    image = sample_image()
+    assert np.array_equal(pymol_png.decode_png(reference_png(image, 6, [kind] * len(image))), image)
+
+def test_decode_mixed_filters():
+    #Every row has its own filter, wide and tall images walk the diagonals differently
+    for height, width in ((12, 9), (5, 31), (23, 2)):
+        image = sample_image(height=height, width=width)
+        filters = [(row * 3) % 5 for row in range(height)]
+        assert np.array_equal(pymol_png.decode_png(reference_png(image, 6, filters)), image)
+
+def test_decode_gray_and_rgb():
+    image = sample_image()
+    gray = reference_png(image[..., :1], 0, [4] * len(image))
+    assert np.array_equal(pymol_png.decode_png(gray)[..., 2], image[..., 0])
+    rgb = pymol_png.decode_png(reference_png(image[..., :3], 2, [1, 2, 3, 4] * 3))
+    assert np.array_equal(rgb[..., :3], image[..., :3]) and np.all(rgb[..., 3] == 255)
+
+@pytest.mark.parametrize('adaptive', (False, True))
+def test_encode_round_trip(adaptive):
+    image = sample_image()
+    data = pymol_png.encode_png(image, adaptive=adaptive)
+    assert np.array_equal(reference_decode(data), image)
+    assert np.array_equal(pymol_png.decode_png(data), image)
+
+def test_adaptive_filters_are_used():
+    image = sample_image(height=40, width=30)
+    rows = pymol_png._filter_rows(image.reshape(40, -1), 4, adaptive=True)
+    assert len(set(rows[:, 0].tolist())) > 1
+
+def test_repository_images_round_trip():
+    paths = sorted(glob.glob(os.path.join(os.path.dirname(__file__), '..', 'media', '**', '*.png'), recursive=True))
+    if not paths:
+        pytest.skip("No PNGs in media/")
+    #PNGs written by PyMOL (libpng filters), decoded and encoded again
+    image = pymol_png.decode_png(open(min(paths, key=os.path.getsize), 'rb').read())[:256, :256]
+    assert image.shape[2] == 4 and image.any()
+    assert np.array_equal(pymol_png.decode_png(pymol_png.encode_png(image, adaptive=True)), image)
+
+def test_downscale():
+    image = np.zeros((100, 60, 4), dtype=np.uint8)
+    image[..., :3], image[:, :30, 3] = 120, 255
+    small = pymol_png.downscale(image, 25)
+    assert max(small.shape[:2]) <= 25
+    #Transparent pixels do not darken the colour
+    assert np.all(small[..., :3][small[..., 3] > 0] == 120)
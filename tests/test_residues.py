@@ -0,0 +1,13 @@
+import pymol_residues
+
+def test_long_object_names_are_kept():
+    name = '1EMA_' + 'A' * 80 + '_transparent'
+    residues = pymol_residues.residue_array([(name, 'A', 195, ''), ('1EMA_B', 'BBBBBBBBBB', -3, 'A')])
+    assert set(residues['object'].tolist()) == {name, '1EMA_B'}
+    assert 'BBBBBBBBBB' in residues['chain'].tolist()
+    assert pymol_residues.as_residue_index(residues) is residues
+
+def test_plain_residue_numbers():
+    residues = pymol_residues.as_residue_index([197, '52A', 195, '-3', 196])
+    assert residues['resi'].tolist() == [-3, 52, 195, 196, 197]
+    assert residues['icode'].tolist() == ['', 'A', '', '', '']
@@ -0,0 +1,40 @@
+import pytest
+
+import pymol_scene as scene
+
+class RecordingCmd:
+    """Two objects: the scene object 'protein' and another visible object 'copy'"""
+    def __init__(self, atoms):
+        self.atoms, self.calls = atoms, []
+
+    def get_names(self, kind='objects', enabled_only=0):
+        return ['protein', 'copy']
+
+    def get_object_list(self, selection):
+        return ['protein']
+
+    def count_atoms(self, selection):
+        return self.atoms
+
+    def iterate(self, selection, expression, space):
+        raise AssertionError("a large scene must not be read atom by atom")
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.calls.append((name,) + args)
+
+@pytest.fixture
+def recording(monkeypatch):
+    fake = RecordingCmd(scene.DIFF_MAX_ATOMS + 1)
+    monkeypatch.setattr(scene, 'cmd', fake)
+    return fake
+
+def test_large_scene_uses_hide_and_show(recording):
+    operations = scene.apply_scene([('protein and chain A', 'cartoon sticks')], colors=[('protein', 'white')])
+    assert recording.calls == [
+        ('hide', 'everything', '(all) and not (protein)'),
+        ('hide', 'everything', '(all) and (protein)'),
+        ('show', 'cartoon', '((all) and (protein)) and (protein and chain A)'),
+        ('show', 'sticks', '((all) and (protein)) and (protein and chain A)'),
+        ('color', 'white', '((all) and (protein)) and (protein)'),
+    ]
+    assert operations == 5
@@ -0,0 +1,52 @@
+import numpy as np
+
+import pymol_selections as selections
+
+def test_static_expressions_are_cached():
+    for expression in ('1EMA_A and resi 195-207+210', '(chain A and resi 3-9) or (chain B and resi \\-2-4)',
+                       '1EMA_organics', 'polymer.protein and name CA'):
+        assert selections.is_cacheable(expression), expression
+
+def test_distance_and_property_expressions_are_not_cached():
+    for expression in ('byres (1EMA_A within 5 of 1EMA_organics)', '1EMA around 4', 'b > 50', 'ss H',
+                       'all w. 4 of lig', 'q < 1', 'x. 3 of lig', '1EMA and state 2', 'formal_charge < 0'):
+        assert not selections.is_cacheable(expression), expression
+
+def brute_force_ranges(numbers, padding):
+    covered = sorted({number + offset for number in numbers for offset in range(-padding, padding + 1)
+                      if number + offset >= min(number, 1)})
+    ranges = []
+    for number in covered:
+        if ranges and number == ranges[-1][1] + 1:
+            ranges[-1][1] = number
+        else:
+            ranges.append([number, number])
+    return [tuple(item) for item in ranges]
+
+def test_residue_ranges_match_brute_force():
+    generator = np.random.default_rng(5)
+    for padding in (0, 1, 3):
+        for _ in range(50):
+            numbers = generator.integers(-10, 60, size=generator.integers(1, 25)).tolist()
+            assert selections.residue_ranges(numbers, padding) == brute_force_ranges(numbers, padding)
+    assert selections.residue_ranges([]) == []
+
+def test_padding_stops_at_residue_one():
+    assert selections.residue_ranges([1, 2, 10], padding=2) == [(1, 4), (8, 12)]
+    assert selections.residue_ranges([-1], padding=2) == [(-1, 1)]
+
+def test_resi_expression_escapes_negative_numbers():
+    assert selections.resi_expression([-3, -2, 5], ['52A']) == 'resi \\-3-\\-2+5+52A'
+
+def test_residue_expression_of_plain_numbers():
+    residues = selections.pymol_residues.as_residue_index([197, '52A', 195, '-3', 196])
+    assert selections.residue_expression(residues) == 'resi \\-3+195-197+52A'
+
+def test_expressions_with_named_selections_are_not_reused(monkeypatch):
+    class NamesCmd:
+        def get_names(self, kind='objects'):
+            return ['sele', '1EMA_active_site_residues']
+    monkeypatch.setattr(selections, 'cmd', NamesCmd())
+    assert selections.uses_selections('1EMA_A and sele')
+    assert selections.uses_selections('byres 1EMA_active_site_residues')
+    assert not selections.uses_selections('1EMA_A and resi 195-207 and not selected')
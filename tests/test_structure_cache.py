@@ -0,0 +1,70 @@
+import gzip
+import http.server
+import os
+import threading
+from functools import partial
+
+import pytest
+
+import pymol_structure_cache as cache
+
+@pytest.fixture
+def server(tmp_path):
+    """Local HTTP stand-in for RCSB serving tmp_path/served"""
+    served = tmp_path / 'served'
+    served.mkdir()
+    handler = partial(http.server.SimpleHTTPRequestHandler, directory=str(served))
+    handler.log_message = lambda *args: None
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield served, f"http://127.0.0.1:{httpd.server_address[1]}/{{code}}.{{ext}}"
+    httpd.shutdown()
+    httpd.server_close()
+
+@pytest.fixture
+def mirror(tmp_path, monkeypatch, server):
+    served, url = server
+    monkeypatch.setattr(cache, 'MIRROR_DIRECTORY', str(tmp_path / 'mirror'))
+    monkeypatch.setattr(cache, 'SOURCE', url)
+    monkeypatch.setattr(cache, 'OFFLINE', False)
+    monkeypatch.setattr(cache, 'CACHE_STATS', dict.fromkeys(cache.CACHE_STATS, 0))
+    return served
+
+def test_download_then_hit(mirror):
+    (mirror / '1abc.cif').write_bytes(b'data_1ABC\n')
+    path = cache.get_structure('1ABC')
+    assert gzip.decompress(open(path, 'rb').read()) == b'data_1ABC\n'
+    assert cache.get_structure('1abc') == path
+    assert cache.CACHE_STATS['downloads'] == 1 and cache.CACHE_STATS['hits'] == 1
+
+def test_eviction_keeps_recent_entries(mirror, monkeypatch):
+    for code in ('1aaa', '2bbb'):
+        (mirror / f'{code}.cif').write_bytes(os.urandom(4000))
+    first = cache.get_structure('1aaa')
+    os.utime(first, (0, 0)) #Least recently used
+    monkeypatch.setattr(cache, 'MAX_MIRROR_BYTES', 5000)
+    second = cache.get_structure('2bbb')
+    assert not os.path.exists(first) and os.path.exists(second)
+    assert cache.CACHE_STATS['evictions'] == 1
+
+def test_failures_fall_back_to_pymol_fetch(mirror, monkeypatch):
+    loaded = []
+    load = lambda path, name, **kwargs: loaded.append(name)
+    #Not on the server (404)
+    assert cache.cached_fetch(load, '9zzz') is None
+    assert cache.CACHE_STATS['failures'] == 1
+    #Offline and not mirrored
+    monkeypatch.setattr(cache, 'OFFLINE', True)
+    (mirror / '1abc.cif').write_bytes(b'data_1ABC\n')
+    assert cache.cached_fetch(load, '1abc') is None
+    assert cache.cached_fetch(load, '1abc 9zzz') is None
+    assert loaded == []
+
+def test_cached_fetch_loads_from_mirror(mirror):
+    (mirror / '1abc.cif').write_bytes(b'data_1ABC\n')
+    (mirror / '2def.cif').write_bytes(b'data_2DEF\n')
+    loaded = []
+    load = lambda path, name, **kwargs: loaded.append((os.path.basename(path), name))
+    assert cache.cached_fetch(load, '1abc 2def') == ['1abc', '2def']
+    assert loaded == [('1abc.cif.gz', '1abc'), ('2def.cif.gz', '2def')]
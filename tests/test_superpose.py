@@ -0,0 +1,87 @@
+import itertools
+
+import numpy as np
+
+import pymol_superpose as superpose
+
+def rotation(axis, angle):
+    axis = np.asarray(axis, dtype=float) / np.linalg.norm(axis)
+    cross = np.array([[0, -axis[2], axis[1]], [axis[2], 0, -axis[0]], [-axis[1], axis[0], 0]])
+    return np.eye(3) + np.sin(angle) * cross + (1 - np.cos(angle)) * cross @ cross
+
+def test_kabsch_recovers_known_rotations():
+    generator = np.random.default_rng(1)
+    mobile = generator.normal(size=(2, 30, 3)) * 10
+    rotations = np.stack([rotation((1, 2, 3), 0.7), rotation((0, 0, 1), 2.5)])
+    translations = np.array([[1.0, -2.0, 3.0], [10.0, 0.0, -5.0]])
+    reference = np.einsum('kij,knj->kni', rotations, mobile) + translations[:, None]
+    found_rotations, found_translations = superpose.kabsch(mobile, reference, np.ones((2, 30)))
+    assert np.allclose(found_rotations, rotations)
+    assert np.allclose(found_translations, translations)
+    assert np.allclose(np.linalg.det(found_rotations), 1.0)
+
+def test_fit_all_rejects_outliers_and_pads():
+    generator = np.random.default_rng(2)
+    matrix = rotation((1, 1, 0), 1.2)
+    pairs = []
+    for count in (40, 25):
+        mobile = generator.normal(size=(count, 3)) * 8
+        reference = mobile @ matrix.T + (4.0, 5.0, 6.0)
+        reference[:3] += 15.0 #A few moved residues
+        pairs.append((mobile, reference))
+    matrices, rmsd, used = superpose.fit_all(pairs)
+    assert matrices.shape == (2, 4, 4)
+    for index, (mobile, reference) in enumerate(pairs):
+        assert np.allclose(matrices[index, :3, :3], matrix, atol=1e-6)
+        assert np.allclose(matrices[index, :3, 3], (4.0, 5.0, 6.0), atol=1e-6)
+        assert used[index] == len(mobile) - 3
+    assert np.allclose(rmsd, 0.0, atol=1e-6)
+
+def alignment_score(first, second, first_indices, second_indices):
+    """Score of an alignment given by its matched positions, gaps for the rest"""
+    matched = sum(superpose.MATCH if first[i] == second[j] else superpose.MISMATCH
+                  for i, j in zip(first_indices, second_indices))
+    gaps = (len(first) - len(first_indices)) + (len(second) - len(second_indices))
+    return matched + superpose.GAP * gaps
+
+def best_score(first, second):
+    """Brute force Needleman-Wunsch score"""
+    scores = np.zeros((len(first) + 1, len(second) + 1), dtype=int)
+    scores[:, 0] = superpose.GAP * np.arange(len(first) + 1)
+    scores[0, :] = superpose.GAP * np.arange(len(second) + 1)
+    for i, j in itertools.product(range(1, len(first) + 1), range(1, len(second) + 1)):
+        match = superpose.MATCH if first[i - 1] == second[j - 1] else superpose.MISMATCH
+        scores[i, j] = max(scores[i - 1, j - 1] + match, scores[i - 1, j] + superpose.GAP,
+                           scores[i, j - 1] + superpose.GAP)
+    return scores[-1, -1]
+
+def test_align_sequences_is_optimal():
+    generator = np.random.default_rng(3)
+    letters = np.array(list('ACDEFGHIKLMNPQRSTVWY'))
+    for _ in range(20):
+        first = ''.join(generator.choice(letters, generator.integers(1, 30)))
+        second = list(first)
+        for _ in range(generator.integers(0, 6)): #Point mutations, insertions and deletions
+            position = generator.integers(0, len(second) + 1)
+            change = generator.integers(0, 3)
+            if change == 0 and position < len(second):
+                second[position] = generator.choice(letters)
+            elif change == 1:
+                second.insert(position, generator.choice(letters))
+            elif position < len(second):
+                del second[position]
+        second = ''.join(second) or 'A'
+        first_indices, second_indices = superpose.align_sequences(first, second)
+        assert np.all(np.diff(first_indices) > 0) and np.all(np.diff(second_indices) > 0)
+        assert alignment_score(first, second, first_indices, second_indices) == best_score(first, second)
+
+def test_align_identical_sequences():
+    first_indices, second_indices = superpose.align_sequences('MSKGEELFTG', 'MSKGEELFTG')
+    assert first_indices.tolist() == second_indices.tolist() == list(range(10))
+
+def test_companions_are_load_hook_objects():
+    chains = ['A', 'B']
+    for name in ('1ema_A', '1ema_B', '1ema_organics', '1ema_active_site_residues', '1ema_A_transparent'):
+        assert superpose.is_companion(name, '1ema', chains)
+    for name in ('1ema_apo', '1ema_C', '1ema', '1emb_A', '1ema_apo_A'):
+        assert not superpose.is_companion(name, '1ema', chains)
@@ -0,0 +1,28 @@
+import json
+import os
+import subprocess
+import sys
+
+from conftest import SCRIPTS
+
+import pymol_watch
+
+def test_debouncer_waits_for_stable_files(tmp_path):
+    path = tmp_path / 'a.pdb'
+    path.write_text('ATOM\n')
+    debouncer = pymol_watch.Debouncer(settle=0.0)
+    debouncer.touch(str(path))
+    assert [item[0] for item in debouncer.ready()] == [str(path)]
+    assert not debouncer.pending
+
+def test_once_with_empty_file_exits(tmp_path):
+    incoming, output = tmp_path / 'incoming', tmp_path / 'output'
+    incoming.mkdir()
+    (incoming / 'empty.pdb').write_bytes(b'')
+    process = subprocess.run([sys.executable, os.path.join(SCRIPTS, 'pymol_watch.py'), str(incoming), '--once',
+                              '--settle', '0.5', '--output-dir', str(output)],
+                             capture_output=True, text=True, timeout=15)
+    assert process.returncode == 1, process.stdout + process.stderr
+    record = json.loads((output / pymol_watch.RECORD_NAME).read_text())
+    assert 'error' in record['files'][str(incoming / 'empty.pdb')]
+    assert record['rendered'] == {}